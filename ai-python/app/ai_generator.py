@@ -1,56 +1,111 @@
 import os
-import groq
 import logging
 import importlib
+import threading
 from .vector_search import VectorSearch
+from .reranker import get_reranker
 
-try:
-    cerebras_module = importlib.import_module('cerebras.cloud.sdk')
-    Cerebras = getattr(cerebras_module, 'Cerebras', None)
-except Exception:
-    Cerebras = None
+logger = logging.getLogger(__name__)
 
-try:
-    from openai import OpenAI as OpenAIClient
-except Exception:
-    OpenAIClient = None
+# Provider SDKs are imported the first time a provider is used, not at import time
+PROVIDER_MODULES = {
+    'groq': 'groq',
+    'cerebras': 'cerebras.cloud.sdk',
+    'bytez': 'openai',  # Bytez uses OpenAI-compatible API
+}
+PROVIDER_API_KEYS = {
+    'groq': 'GROQ_API_KEY',
+    'cerebras': 'CEREBRAS_API_KEY',
+    'bytez': 'BYTEZ_API_KEY',
+}
+
+
+def _import_provider_sdk(provider):
+    """Import a provider SDK module, or None if it is not installed"""
+    try:
+        return importlib.import_module(PROVIDER_MODULES[provider])
+    except Exception as e:
+        logger.warning(f"{provider} SDK not available: {e}")
+        return None
+
+
+def preload_provider_sdks():
+    """Import the SDKs of providers that have an API key configured (startup warm-up)"""
+    loaded = []
+    for provider, key_name in PROVIDER_API_KEYS.items():
+        if os.getenv(key_name) and _import_provider_sdk(provider):
+            loaded.append(provider)
+    return loaded
 
-logger = logging.getLogger(__name__)
 
 class AIGenerator:
     def __init__(self):
         try:
-            self.client = groq.Client(api_key=os.getenv('GROQ_API_KEY'))
             self.default_provider = (os.getenv('LLM_PROVIDER') or 'groq').lower()
             self.groq_model = os.getenv('GROQ_MODEL', 'openai/gpt-oss-120b')
             self.cerebras_model = os.getenv('CEREBRAS_MODEL', 'gpt-oss-120b')
             self.bytez_model = os.getenv('BYTEZ_MODEL', 'gpt-4o-mini')
 
-            self.cerebras_client = None
-            cerebras_api_key = os.getenv('CEREBRAS_API_KEY')
-            if Cerebras and cerebras_api_key:
-                self.cerebras_client = Cerebras(api_key=cerebras_api_key)
-
-            # Bytez uses OpenAI-compatible API
-            self.bytez_client = None
-            bytez_api_key = os.getenv('BYTEZ_API_KEY')
-            if OpenAIClient and bytez_api_key:
-                self.bytez_client = OpenAIClient(
-                    api_key=bytez_api_key,
-                    base_url="https://api.bytez.com/v1"
-                )
+            # Provider clients are created on first use (see _get_client)
+            self._clients = {}
+            self._clients_lock = threading.Lock()
 
             self.vector_search = VectorSearch()
-            logger.info("Groq client initialized successfully")
-            if self.cerebras_client:
-                logger.info("Cerebras client initialized successfully")
-            if self.bytez_client:
-                logger.info("Bytez client initialized successfully")
+            # Cross-encoder rerank of chat retrieval (None unless RERANK_ENABLED)
+            self.reranker = get_reranker()
         except Exception as e:
             logger.error(f"Failed to initialize AI clients: {str(e)}")
             raise
+
+    @property
+    def client(self):
+        """Groq client"""
+        return self._get_client('groq')
+
+    @property
+    def cerebras_client(self):
+        return self._get_client('cerebras')
+
+    @property
+    def bytez_client(self):
+        return self._get_client('bytez')
+
+    def _get_client(self, provider):
+        """Return the cached client for a provider, creating it on first use (None if unavailable)"""
+        if provider in self._clients:
+            return self._clients[provider]
+        with self._clients_lock:
+            if provider not in self._clients:
+                self._clients[provider] = self._create_client(provider)
+            return self._clients[provider]
+
+    def _create_client(self, provider):
+        api_key = os.getenv(PROVIDER_API_KEYS[provider])
+        # Groq is the default provider and is always attempted; the others need a key
+        if provider != 'groq' and not api_key:
+            return None
+
+        module = _import_provider_sdk(provider)
+        if module is None:
+            return None
+
+        try:
+            if provider == 'groq':
+                client = module.Client(api_key=api_key)
+            elif provider == 'cerebras':
+                cerebras_cls = getattr(module, 'Cerebras', None)
+                if cerebras_cls is None:
+                    return None
+                client = cerebras_cls(api_key=api_key)
+            else:
+                client = module.OpenAI(api_key=api_key, base_url="https://api.bytez.com/v1")
+            logger.info(f"{provider.capitalize()} client initialized successfully")
+            return client
+        except Exception as e:
+            logger.error(f"Failed to initialize {provider} client: {str(e)}")
+            return None
     
-    def generate_answer(self, question, pdf_ids, user_id, session_id=None, conversation_history=None, provider=None, model=None):
+    def generate_answer(self, question, pdf_ids, user_id, session_id=None, conversation_history=None, provider=None, model=None, search_mode=None, retrieval_mode='vector'):
         """Generate AI answer with semantic search and references"""
         try:
             logger.info(f"Generating answer for user {user_id}, PDFs: {pdf_ids}")
@@ -64,11 +119,10 @@ class AIGenerator:
             # Determine if summarization is requested
             if "summarize" in enhanced_question.lower():
                 # Retrieve a broad set of chunks for summarization
-                summary_chunks = self.vector_search.search_similar_chunks(
-                    enhanced_question, pdf_ids, user_id, top_k=50, similarity_threshold=0.1
+                summary_chunks = self._retrieve_chunks(
+                    enhanced_question, pdf_ids, user_id, top_k=50, similarity_threshold=0.1,
+                    search_mode=search_mode, retrieval_mode=retrieval_mode
                 )
-                for chunk in summary_chunks:
-                    chunk['source'] = 'vector'
                 if not summary_chunks:
                     logger.warning("No chunks found for summarization")
                     return {
@@ -92,11 +146,10 @@ class AIGenerator:
             
             # Search for relevant chunks using enhanced question
             # Lower threshold and more chunks for better context
-            relevant_chunks = self.vector_search.search_similar_chunks(
-                enhanced_question, pdf_ids, user_id, top_k=10, similarity_threshold=0.3
+            relevant_chunks = self._retrieve_chunks(
+                enhanced_question, pdf_ids, user_id, top_k=10, similarity_threshold=0.3,
+                search_mode=search_mode, retrieval_mode=retrieval_mode, rerank=True
             )
-            for chunk in relevant_chunks:
-                chunk['source'] = 'vector'
             
             if not relevant_chunks:
                 logger.warning("No relevant chunks found for question")
@@ -169,6 +222,30 @@ class AIGenerator:
                 "suggested_questions": []
             }
 
+    def _retrieve_chunks(self, question, pdf_ids, user_id, top_k, similarity_threshold, search_mode=None, retrieval_mode='vector', rerank=False):
+        """Vector search, or lexical + vector fusion when retrieval_mode is 'hybrid'; tags each chunk's source.
+
+        With rerank=True and a reranker configured, a wider candidate set is
+        fetched and cut down to the reranker's top N.
+        """
+        reranker = self.reranker if rerank else None
+        if reranker:
+            top_k = max(top_k, reranker.candidates)
+        if retrieval_mode == 'hybrid':
+            chunks = self.vector_search.hybrid_search(
+                question, pdf_ids, user_id, top_k=top_k, similarity_threshold=similarity_threshold, search_mode=search_mode
+            )
+        else:
+            retrieval_mode = 'vector'
+            chunks = self.vector_search.search_similar_chunks(
+                question, pdf_ids, user_id, top_k=top_k, similarity_threshold=similarity_threshold, search_mode=search_mode
+            )
+        for chunk in chunks:
+            chunk['source'] = retrieval_mode
+        if reranker:
+            chunks = reranker.rerank(question, chunks)
+        return chunks
+    
     def generate_document_summary(self, pdf_ids, user_id, provider=None):
         """Generate a summary of the provided PDFs"""
         try:
@@ -452,9 +529,8 @@ class AIGenerator:
         
         return answer + references_section
 
-    def generate_answer_stream(self, question, pdf_ids, user_id, session_id=None, conversation_history=None, provider=None, model=None):
+    def generate_answer_stream(self, question, pdf_ids, user_id, session_id=None, conversation_history=None, provider=None, model=None, search_mode=None, retrieval_mode='vector'):
         """Generate AI answer as a stream with semantic search and references"""
-        import json
         try:
             logger.info(f"Generating streaming answer for user {user_id}, PDFs: {pdf_ids}")
             selected_provider = self._resolve_provider(provider)
@@ -462,11 +538,10 @@ class AIGenerator:
             enhanced_question = self._enhance_question_with_context(question, conversation_history, selected_provider)
             
             if "summarize" in enhanced_question.lower():
-                summary_chunks = self.vector_search.search_similar_chunks(
-                    enhanced_question, pdf_ids, user_id, top_k=50, similarity_threshold=0.1
+                summary_chunks = self._retrieve_chunks(
+                    enhanced_question, pdf_ids, user_id, top_k=50, similarity_threshold=0.1,
+                    search_mode=search_mode, retrieval_mode=retrieval_mode
                 )
-                for chunk in summary_chunks:
-                    chunk['source'] = 'vector'
                 if not summary_chunks:
                     yield {"type": "metadata", "references": [], "suggested_questions": [], "provider": selected_provider}
                     yield {"type": "chunk", "content": "Unable to find content to summarize. Please ensure the PDFs contain relevant information."}
@@ -488,11 +563,10 @@ class AIGenerator:
                 yield {"type": "done"}
                 return
             
-            relevant_chunks = self.vector_search.search_similar_chunks(
-                enhanced_question, pdf_ids, user_id, top_k=10, similarity_threshold=0.3
+            relevant_chunks = self._retrieve_chunks(
+                enhanced_question, pdf_ids, user_id, top_k=10, similarity_threshold=0.3,
+                search_mode=search_mode, retrieval_mode=retrieval_mode, rerank=True
             )
-            for chunk in relevant_chunks:
-                chunk['source'] = 'vector'
             
             if not relevant_chunks:
                 pdf_names = self.vector_search.get_pdf_names(pdf_ids)
@@ -1,14 +1,22 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Fix relative imports
 from .pdf_processor import DocumentProcessor
-from .ai_generator import AIGenerator
-from .database import test_connection
+from .ai_generator import AIGenerator, preload_provider_sdks
+from .embedding_service import EmbeddingService
+from .database import test_connection, db_connection
 from .pageindex_service import PageIndexService
+from .ingest_jobs import IngestJobQueue
+from .hot_cache import get_hot_cache
+from .result_cache import get_result_cache
+from .reranker import get_reranker
 
 
 # Load environment variables
@@ -33,40 +41,90 @@ CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_SIZE', 52428800))
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 
-# Initialize services ONCE at module level (when app starts)
-try:
-    logger.info("Initializing AI services...")
-    
-    # FIXED: Import once
-    from .database import test_connection
-    if test_connection():
-        logger.info("Database connection successful")  # FIXED: Added 'D'
-    else:
-        logger.error("Database connection failed")
-        raise Exception("Database connection failed")
-    
-    # These will be initialized ONLY ONCE when the module loads
-    pdf_processor = DocumentProcessor()
-    ai_generator = AIGenerator()
-    
-    # Initialize PageIndex service with reference to ai_generator for LLM calls
+# Services are initialized ONCE, in a background thread, so Flask can bind the
+# port immediately. Endpoints answer 503 until warm-up finishes; /ready reports it.
+pdf_processor = None
+ai_generator = None
+pageindex_service = None
+ingest_queue = None
+services_available = False
+warmup_state = {'status': 'warming', 'steps': {}, 'error': None, 'duration': None}
+
+
+def _timed_step(name, func):
+    """Run one warm-up step and record how long it took"""
+    started = time.monotonic()
+    result = func()
+    warmup_state['steps'][name] = round(time.monotonic() - started, 2)
+    logger.info(f"Warm-up step '{name}' finished in {warmup_state['steps'][name]}s")
+    return result
+
+
+def _init_pageindex():
     try:
-        pageindex_service = PageIndexService(ai_generator=ai_generator)
+        service = PageIndexService()
         logger.info("PageIndex service initialized")
+        return service
     except Exception as pi_err:
-        pageindex_service = None
         logger.warning(f"PageIndex service not available: {pi_err}")
-    
-    logger.info("All services initialized successfully")
-    services_available = True
-    
-except Exception as e:
-    logger.error(f"Service initialization failed: {str(e)}")
-    # Set to None if initialization fails
-    pdf_processor = None
-    ai_generator = None
-    pageindex_service = None
-    services_available = False
+        return None
+
+
+def warm_up_services():
+    """Initialize all services; independent steps (DB, models, SDKs, Appwrite) run concurrently."""
+    global pdf_processor, ai_generator, pageindex_service, ingest_queue, services_available
+    started = time.monotonic()
+    try:
+        logger.info("Initializing AI services...")
+        
+        with ThreadPoolExecutor(max_workers=5, thread_name_prefix='warmup') as executor:
+            # Runs the one-time pgvector setup and warms the connection pool
+            database = executor.submit(_timed_step, 'database', test_connection)
+            model = executor.submit(_timed_step, 'embedding_model', EmbeddingService)
+            llm_sdks = executor.submit(_timed_step, 'llm_sdks', preload_provider_sdks)
+            pageindex = executor.submit(_timed_step, 'pageindex', _init_pageindex)
+            reranker = executor.submit(_timed_step, 'reranker', get_reranker)
+            
+            if not database.result():
+                raise Exception("Database connection failed")
+            logger.info("Database connection successful")
+            model.result()
+            llm_sdks.result()
+            pageindex_instance = pageindex.result()
+            reranker.result()
+        
+        # Cheap now that the model singleton is loaded
+        processor = DocumentProcessor()
+        generator = AIGenerator()
+        # PageIndex uses ai_generator for LLM calls
+        if pageindex_instance:
+            pageindex_instance.ai_generator = generator
+        
+        # Background ingestion workers (shared Postgres queue across replicas)
+        queue = IngestJobQueue(processor, pageindex_service=pageindex_instance)
+        queue.start()
+        
+        pdf_processor = processor
+        ai_generator = generator
+        pageindex_service = pageindex_instance
+        ingest_queue = queue
+        services_available = True
+        warmup_state['status'] = 'ready'
+        logger.info("All services initialized successfully")
+        
+    except Exception as e:
+        logger.error(f"Service initialization failed: {str(e)}")
+        warmup_state['status'] = 'failed'
+        warmup_state['error'] = str(e)
+    finally:
+        warmup_state['duration'] = round(time.monotonic() - started, 2)
+
+
+# SERVICE_WARMUP=blocking restores initialize-before-serving (scripts, debugging)
+if os.getenv('SERVICE_WARMUP', 'background').lower() == 'blocking':
+    warm_up_services()
+else:
+    threading.Thread(target=warm_up_services, name='service-warmup', daemon=True).start()
 
 @app.route('/', methods=['GET'])
 def index():
@@ -74,7 +132,7 @@ def index():
     return jsonify({
         'service': 'Docu-Chat AI Python Server',
         'status': 'running',
-        'endpoints': ['/health', '/process-pdf', '/chat'],
+        'endpoints': ['/health', '/ready', '/process-pdf', '/jobs/<job_id>', '/chat'],
         'services_ready': services_available
     })
 
@@ -85,11 +143,30 @@ def health():
         'status': 'healthy' if services_available else 'degraded',
         'service': 'Python AI Server',
         'embedding_model': 'all-MiniLM-L6-v2',
+        'embedding_backend': pdf_processor.embedding_service.backend if pdf_processor else None,
+        'embedding_batcher': pdf_processor.embedding_service.batcher.stats() if pdf_processor and pdf_processor.embedding_service.batcher else None,
+        'embedding_cache': pdf_processor.embedding_service.query_cache.stats() if pdf_processor and pdf_processor.embedding_service.query_cache else None,
         'vector_search': 'enabled',
-        'services_ready': services_available
+        'hot_document_cache': get_hot_cache().stats() if get_hot_cache() else None,
+        'result_cache': get_result_cache().stats() if get_result_cache() else None,
+        'reranker': ai_generator.reranker.stats() if ai_generator and ai_generator.reranker else None,
+        'services_ready': services_available,
+        'warmup': warmup_state['status']
     }
     return jsonify(status_info)
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once services are warm, 503 while warming up or after a failed init"""
+    body = {
+        'ready': services_available,
+        'status': warmup_state['status'],
+        'steps': warmup_state['steps'],
+        'duration': warmup_state['duration'],
+        'error': warmup_state['error']
+    }
+    return jsonify(body), 200 if services_available else 503
+
 @app.route('/process-pdf', methods=['POST'])
 def process_pdf():
     """Process PDF endpoint - called by PHP backend"""
@@ -121,12 +198,25 @@ def process_pdf():
         # Note: We no longer validate file extensions or local existence here 
         # because pdf_path is now an Appwrite File ID, not a local file path.
         
-        logger.info(f"Processing PDF (Appwrite ID): {pdf_path} for user {user_id}")
+        # Synchronous processing is still available for scripts and debugging
+        if data.get('async', True) is False:
+            logger.info(f"Processing PDF (Appwrite ID): {pdf_path} for user {user_id}")
+            result = pdf_processor.process_pdf(pdf_id, pdf_path, user_id)
+            if result.get('status') == 'success' and ingest_queue.schedule_tree_generation(pdf_id, user_id):
+                result['data']['tree_status'] = 'generating'
+            return jsonify(result)
         
-        # Process PDF using the provided path
-        result = pdf_processor.process_pdf(pdf_id, pdf_path, user_id)
+        job_id = ingest_queue.enqueue(pdf_id, pdf_path, user_id)
+        logger.info(f"Queued PDF (Appwrite ID): {pdf_path} for user {user_id} as job {job_id}")
         
-        return jsonify(result)
+        return jsonify({
+            'status': 'success',
+            'message': 'Document queued for processing',
+            'data': {
+                'job_id': job_id,
+                'status_url': f'/jobs/{job_id}'
+            }
+        }), 202
         
     except Exception as e:
         logger.error(f"PDF processing endpoint error: {str(e)}")
@@ -135,6 +225,35 @@ def process_pdf():
             'message': f'Processing failed: {str(e)}'
         }), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Ingestion job status: stage and progress"""
+    try:
+        if not ingest_queue or not services_available:
+            return jsonify({
+                'status': 'error', 
+                'message': 'Job queue not available. Service is still initializing.'
+            }), 503
+        
+        job = ingest_queue.get_job(job_id)
+        if not job:
+            return jsonify({
+                'status': 'error', 
+                'message': 'Job not found'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'data': job
+        })
+        
+    except Exception as e:
+        logger.error(f"Job status endpoint error: {str(e)}")
+        return jsonify({
+            'status': 'error', 
+            'message': f'Job status failed: {str(e)}'
+        }), 500
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Chat endpoint - called by PHP backend"""
@@ -161,6 +280,8 @@ def chat():
         provider = data.get('provider')
         model = data.get('model')
         retrieval_mode = data.get('retrieval_mode', 'vector')
+        # Vector recall/latency trade-off: fast | balanced | accurate
+        search_mode = data.get('search_mode')
         
         if not all([question, pdf_ids, user_id]):
             return jsonify({
@@ -177,8 +298,8 @@ def chat():
             result = _handle_pageindex_chat(question, pdf_ids, user_id, conversation_history, provider, model)
         elif retrieval_mode == 'comparison' and pageindex_service:
             # Comparison mode: both Vector + PageIndex
-            vector_result = ai_generator.generate_answer(question, pdf_ids, user_id, session_id, conversation_history, provider, model=model)
-            pageindex_result = _handle_pageindex_chat(question, pdf_ids, user_id, conversation_history, provider, model)
+            vector_result = ai_generator.generate_answer(question, pdf_ids, user_id, session_id, conversation_history, provider, model=model, search_mode=search_mode)
+            pageindex_result = _handle_pageindex_chat(question, pdf_ids, user_id, conversation_history, provider, model, search_mode=search_mode)
             
             combined_answer = vector_result.get('answer', '') + "\n\n|||COMPARISON_SPLIT|||\n\n" + pageindex_result.get('answer', '')
             combined_refs = vector_result.get('references', []) + pageindex_result.get('references', [])
@@ -189,8 +310,11 @@ def chat():
                 'provider': vector_result.get('provider', provider)
             }
         else:
-            # Default: Vector mode
-            result = ai_generator.generate_answer(question, pdf_ids, user_id, session_id, conversation_history, provider, model=model)
+            # Default: Vector mode ('hybrid' adds full-text search fused with RRF)
+            result = ai_generator.generate_answer(
+                question, pdf_ids, user_id, session_id, conversation_history, provider, model=model,
+                search_mode=search_mode, retrieval_mode=retrieval_mode
+            )
         
         return jsonify({
             'status': 'success',
@@ -232,6 +356,8 @@ def chat_stream():
         provider = data.get('provider')
         model = data.get('model')
         retrieval_mode = data.get('retrieval_mode', 'vector')
+        # Vector recall/latency trade-off: fast | balanced | accurate
+        search_mode = data.get('search_mode')
         
         if not all([question, pdf_ids, user_id]):
             return jsonify({
@@ -250,7 +376,7 @@ def chat_stream():
                 elif retrieval_mode == 'comparison' and pageindex_service:
                     # Stream Vector
                     vector_refs = []
-                    for chunk in ai_generator.generate_answer_stream(question, pdf_ids, user_id, session_id, conversation_history, provider, model=model):
+                    for chunk in ai_generator.generate_answer_stream(question, pdf_ids, user_id, session_id, conversation_history, provider, model=model, search_mode=search_mode):
                         if chunk.get('type') == 'metadata':
                             vector_refs = chunk.get('references', [])
                         else:
@@ -262,7 +388,7 @@ def chat_stream():
                     
                     # Stream PageIndex
                     pageindex_refs = []
-                    for chunk in _handle_pageindex_stream(question, pdf_ids, user_id, conversation_history, provider, model):
+                    for chunk in _handle_pageindex_stream(question, pdf_ids, user_id, conversation_history, provider, model, search_mode=search_mode):
                         if chunk.get('type') == 'metadata':
                             pageindex_refs = chunk.get('references', [])
                         else:
@@ -272,9 +398,10 @@ def chat_stream():
                     meta_chunk = {'type': 'metadata', 'references': vector_refs + pageindex_refs}
                     yield f"data: {json.dumps(meta_chunk)}\n\n"
                 else:
-                    # Default: Vector stream
+                    # Default: Vector stream ('hybrid' adds full-text search fused with RRF)
                     for chunk in ai_generator.generate_answer_stream(
-                        question, pdf_ids, user_id, session_id, conversation_history, provider, model=model
+                        question, pdf_ids, user_id, session_id, conversation_history, provider, model=model,
+                        search_mode=search_mode, retrieval_mode=retrieval_mode
                     ):
                         yield f"data: {json.dumps(chunk)}\n\n"
             except Exception as e:
@@ -361,12 +488,10 @@ def _get_tree_for_pdf(pdf_id):
         return None
 
     try:
-        from .database import get_db_connection
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("SELECT tree_file_id, tree_status FROM pdfs WHERE pdf_id = %s", (pdf_id,))
-            row = cur.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT tree_file_id, tree_status FROM pdfs WHERE pdf_id = %s", (pdf_id,))
+                row = cur.fetchone()
 
         if not row or row[1] != 'completed' or not row[0]:
             return None
@@ -377,46 +502,39 @@ def _get_tree_for_pdf(pdf_id):
         logger.warning(f"Failed to load tree for PDF {pdf_id}: {e}")
         return None
 
-def _handle_pageindex_chat(question, pdf_ids, user_id, conversation_history, provider, model):
+def _get_pdf_name(pdf_id):
+    """Look up a PDF's display name, falling back to 'Unknown'."""
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT file_name FROM pdfs WHERE pdf_id = %s", (pdf_id,))
+                row = cur.fetchone()
+        return row[0] if row else 'Unknown'
+    except Exception:
+        return 'Unknown'
+
+def _handle_pageindex_chat(question, pdf_ids, user_id, conversation_history, provider, model, search_mode=None):
     """Handle a chat request using PageIndex retrieval."""
     # Try first PDF that has a tree
     for pdf_id in pdf_ids:
         tree = _get_tree_for_pdf(pdf_id)
         if tree:
             # Get PDF name
-            try:
-                from .database import get_db_connection
-                conn = get_db_connection()
-                with conn.cursor() as cur:
-                    cur.execute("SELECT file_name FROM pdfs WHERE pdf_id = %s", (pdf_id,))
-                    row = cur.fetchone()
-                conn.close()
-                pdf_name = row[0] if row else 'Unknown'
-            except Exception:
-                pdf_name = 'Unknown'
+            pdf_name = _get_pdf_name(pdf_id)
 
             return pageindex_service.generate_answer_from_tree(
                 question, tree, pdf_id, pdf_name, provider, model, conversation_history
             )
 
-    # No trees available — fall back to vector
-    return ai_generator.generate_answer(question, pdf_ids, user_id, provider=provider, model=model)
+    # No trees available — fall back to vector search on the raw question
+    return ai_generator.generate_answer(question, pdf_ids, user_id, provider=provider, model=model, search_mode=search_mode)
 
-def _handle_pageindex_stream(question, pdf_ids, user_id, conversation_history, provider, model):
+def _handle_pageindex_stream(question, pdf_ids, user_id, conversation_history, provider, model, search_mode=None):
     """Handle streaming chat using PageIndex retrieval."""
     for pdf_id in pdf_ids:
         tree = _get_tree_for_pdf(pdf_id)
         if tree:
-            try:
-                from .database import get_db_connection
-                conn = get_db_connection()
-                with conn.cursor() as cur:
-                    cur.execute("SELECT file_name FROM pdfs WHERE pdf_id = %s", (pdf_id,))
-                    row = cur.fetchone()
-                conn.close()
-                pdf_name = row[0] if row else 'Unknown'
-            except Exception:
-                pdf_name = 'Unknown'
+            pdf_name = _get_pdf_name(pdf_id)
 
             yield from pageindex_service.generate_answer_stream_from_tree(
                 question, tree, pdf_id, pdf_name, provider, model, conversation_history
@@ -425,7 +543,7 @@ def _handle_pageindex_stream(question, pdf_ids, user_id, conversation_history, p
 
     # Fallback to vector stream
     yield from ai_generator.generate_answer_stream(
-        question, pdf_ids, user_id, provider=provider, model=model
+        question, pdf_ids, user_id, provider=provider, model=model, search_mode=search_mode
     )
 
 @app.route('/generate-tree', methods=['POST'])
@@ -453,37 +571,14 @@ def generate_tree():
             return jsonify({'status': 'error', 'message': 'pdf_id and user_id required'}), 400
 
         # Download PDF text from DB
-        from .database import get_db_connection
-        logger.info("[TreeGen-Py] Fetching chunks from DB...")
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT DISTINCT page_number, chunk_text FROM pdf_chunks WHERE pdf_id = %s ORDER BY page_number",
-                (pdf_id,)
-            )
-            rows = cur.fetchall()
-        conn.close()
-
-        logger.info(f"[TreeGen-Py] Found {len(rows)} chunk rows from DB")
+        logger.info("[TreeGen-Py] Fetching pages from DB...")
+        pages_data = pdf_processor.load_pages(pdf_id)
 
-        if not rows:
-            logger.error(f"[TreeGen-Py] ABORT: No chunks found for pdf_id={pdf_id}")
-            return jsonify({'status': 'error', 'message': 'No chunks found for this PDF'}), 404
+        if not pages_data:
+            logger.error(f"[TreeGen-Py] ABORT: No pages found for pdf_id={pdf_id}")
+            return jsonify({'status': 'error', 'message': 'No page text found for this PDF'}), 404
 
-        # Reconstruct pages_data from chunks
-        page_texts = {}
-        for row in rows:
-            page_num = row[0]
-            if page_num not in page_texts:
-                page_texts[page_num] = []
-            page_texts[page_num].append(row[1])
-
-        pages_data = [
-            {'page_number': pn, 'text': ' '.join(texts)}
-            for pn, texts in sorted(page_texts.items())
-        ]
-
-        logger.info(f"[TreeGen-Py] Reconstructed {len(pages_data)} pages from chunks")
+        logger.info(f"[TreeGen-Py] Loaded {len(pages_data)} pages")
         for p in pages_data[:3]:
             logger.info(f"[TreeGen-Py]   Page {p['page_number']}: {len(p['text'])} chars")
 
@@ -495,22 +590,12 @@ def generate_tree():
 
         # Update DB with tree info
         logger.info("[TreeGen-Py] Updating DB with tree info...")
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            if result.get('status') == 'success':
-                cur.execute(
-                    "UPDATE pdfs SET tree_file_id = %s, tree_status = 'completed' WHERE pdf_id = %s",
-                    (result.get('tree_file_id'), pdf_id)
-                )
-                logger.info(f"[TreeGen-Py] DB updated: tree_file_id={result.get('tree_file_id')}, tree_status=completed")
-            else:
-                cur.execute(
-                    "UPDATE pdfs SET tree_status = 'failed' WHERE pdf_id = %s",
-                    (pdf_id,)
-                )
-                logger.info(f"[TreeGen-Py] DB updated: tree_status=failed")
-        conn.commit()
-        conn.close()
+        if result.get('status') == 'success':
+            pdf_processor.update_tree_status(pdf_id, 'completed', result.get('tree_file_id'))
+            logger.info(f"[TreeGen-Py] DB updated: tree_file_id={result.get('tree_file_id')}, tree_status=completed")
+        else:
+            pdf_processor.update_tree_status(pdf_id, 'failed')
+            logger.info(f"[TreeGen-Py] DB updated: tree_status=failed")
 
         logger.info(f"[TreeGen-Py] === /generate-tree DONE, returning: {result.get('status')} ===")
         return jsonify(result)
@@ -1,86 +1,307 @@
 import psycopg2
+import psycopg2.pool
 import os
+import time
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from psycopg2 import extensions
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """Get connection to Neon PostgreSQL database with pgvector"""
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST', '').strip(),
-            database=os.getenv('DB_NAME', '').strip(),
-            user=os.getenv('DB_USER', '').strip(),
-            password=os.getenv('DB_PASSWORD', '').strip(),
-            port=os.getenv('DB_PORT', '5432').strip(),
-            sslmode=os.getenv('SSLMODE', 'require').strip()
-            # options=f"-c endpoint={os.getenv('ENDPOINT')}"
-        )
-    
-        # Enable vector operations
+
+def _connection_params():
+    """Connection parameters for Neon PostgreSQL, read from the environment"""
+    return {
+        'host': os.getenv('DB_HOST', '').strip(),
+        'database': os.getenv('DB_NAME', '').strip(),
+        'user': os.getenv('DB_USER', '').strip(),
+        'password': os.getenv('DB_PASSWORD', '').strip(),
+        'port': os.getenv('DB_PORT', '5432').strip(),
+        'sslmode': os.getenv('SSLMODE', 'require').strip(),
+        # options=f"-c endpoint={os.getenv('ENDPOINT')}"
+    }
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of reusable PostgreSQL connections.
+
+    - Keeps between `minconn` and `maxconn` connections open.
+    - Connections older than `max_lifetime` seconds are closed and replaced.
+    - Connections idle for longer than `health_check_idle` seconds are
+      pinged with `SELECT 1` before being handed out (Neon drops idle TLS
+      sessions, so a stale connection is detected here instead of mid-query).
+    - Leased connections are rolled back and reset to autocommit=False on return.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, max_lifetime=1800, health_check_idle=30, acquire_timeout=30):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()      # (conn, created_at, last_used_at)
+        self._created = {}        # id(conn) -> created_at, for leased connections too
+        self._size = 0            # open connections (idle + leased)
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(minconn):
+            self._size += 1
+            conn = self._connect()
+            self._idle.append((conn, self._created[id(conn)], time.monotonic()))
+
+        logger.info(f"Database pool ready (min={minconn}, max={maxconn}, max_lifetime={max_lifetime}s)")
+
+    def _connect(self):
+        """Open a new physical connection and register it with the pool.
+
+        The caller must already have reserved a slot in `_size`.
+        """
+        conn = psycopg2.connect(**_connection_params())
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and release its slot (caller holds the lock)"""
+        self._created.pop(id(conn), None)
+        self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, last_used_at):
+        """Check lifetime and, for long-idle connections, liveness"""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.health_check_idle is not None and now - last_used_at > self.health_check_idle:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding stale pooled connection: {str(e)}")
+                return False
+        return True
+
+    def getconn(self):
+        """Lease a connection, blocking up to `acquire_timeout` seconds when the pool is exhausted"""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = None
+            with self._cond:
+                while candidate is None:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("Connection pool is closed")
+
+                    if self._idle:
+                        candidate = self._idle.pop()
+                    elif self._size < self.maxconn:
+                        # Reserve a slot, then connect outside the lock
+                        self._size += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise psycopg2.pool.PoolError(
+                                f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+                            )
+                        self._cond.wait(remaining)
+
+            if candidate is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            # Health checks run outside the lock so a slow ping doesn't stall other threads
+            conn, created_at, last_used_at = candidate
+            if self._is_healthy(conn, created_at, last_used_at):
+                return conn
+            with self._cond:
+                self._discard(conn)
+                self._cond.notify()
+
+    def putconn(self, conn, discard=False):
+        """Return a leased connection to the pool"""
+        with self._cond:
+            try:
+                created_at = self._created.get(id(conn))
+                if created_at is None:
+                    # Not ours (or already discarded) - just close it
+                    conn.close()
+                    return
+
+                expired = self.max_lifetime and time.monotonic() - created_at > self.max_lifetime
+                if discard or self._closed or conn.closed or expired:
+                    self._discard(conn)
+                    return
+
+                try:
+                    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if conn.autocommit:
+                        conn.autocommit = False
+                except Exception as e:
+                    logger.warning(f"Failed to reset pooled connection, discarding: {str(e)}")
+                    self._discard(conn)
+                    return
+
+                self._idle.append((conn, created_at, time.monotonic()))
+            finally:
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Lease a connection for the duration of a `with` block"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def closeall(self):
+        """Close every idle connection and refuse further leases"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Pool occupancy snapshot"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max': self.maxconn
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get (creating on first use) the process-wide connection pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    _pool = ConnectionPool(
+                        minconn=int(os.getenv('DB_POOL_MIN', '1')),
+                        maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+                        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+                        health_check_idle=float(os.getenv('DB_POOL_HEALTHCHECK_IDLE', '30')),
+                        acquire_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30'))
+                    )
+                except Exception as e:
+                    logger.error(f"Database connection error: {str(e)}")
+                    raise
+    return _pool
+
+
+@contextmanager
+def db_connection():
+    """Lease a pooled connection to Neon PostgreSQL with pgvector.
+
+    Usage:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                ...
+            conn.commit()
+
+    Uncommitted work is rolled back when the block exits.
+    """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def init_db():
+    """One-time startup setup: make sure the pgvector extension exists"""
+    with db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            conn.commit()
-            
-        logger.info("Database connection established with pgvector support")
-        return conn
-        
-    except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise
+        conn.commit()
+    logger.info("Database connection established with pgvector support")
+
+
+def close_pool():
+    """Close the process-wide pool (used on shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
 
 def test_connection():
     """Test database connection and pgvector extension"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check pgvector extension
-        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_extension WHERE extname = 'vector')")
-        has_vector = cursor.fetchone()[0]
-        
-        # Test vector operations
-        cursor.execute("SELECT '[1,2,3]'::vector")
-        vector_test = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
+        init_db()
+
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Check pgvector extension
+                cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_extension WHERE extname = 'vector')")
+                has_vector = cursor.fetchone()[0]
+
+                # Test vector operations
+                cursor.execute("SELECT '[1,2,3]'::vector")
+                vector_test = cursor.fetchone()
+
         logger.info("Database test successful - pgvector is working")
         return True
-        
+
     except Exception as e:
         logger.error(f"Database test failed: {str(e)}")
         return False
-    
+
 def list_tables():
     """List all tables in the database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Query to get table names
-        cursor.execute("""
-            SELECT table_name
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            ORDER BY table_name;
-        """)
-        
-        tables = cursor.fetchall()
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Query to get table names
+                cursor.execute("""
+                    SELECT table_name
+                    FROM information_schema.tables
+                    WHERE table_schema = 'public'
+                    ORDER BY table_name;
+                """)
+                tables = cursor.fetchall()
+
         if tables:
             print("Tables in the database:")
             for table in tables:
                 print(table[0])  # Table names are in the first column
         else:
             print("No tables found.")
-        
-        cursor.close()
-        conn.close()
-        
+
     except Exception as e:
         logger.error(f"Failed to list tables: {str(e)}")
 
@@ -18,40 +18,249 @@
 #         except Exception as e:
 #             logger.error(f"❌ Failed to load embedding model: {str(e)}")
 #             raise
-from sentence_transformers import SentenceTransformer
+import os
+import time
+import queue
+import atexit
 import logging
+import platform
+import threading
+from concurrent.futures import Future
+
+from .utils.cache_utils import LRUCache
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# EMBEDDING_BACKEND -> (sentence-transformers backend, ONNX file in the model repo).
+# The ONNX backends need `pip install -r requirements-onnx.txt`. Parity with
+# 'torch' (the vectors already stored) is checked by benchmarks/embedding_backends.py:
+#   onnx, onnx-o3  mean cosine >= 0.9999 (same fp32 weights, fused graph)
+#   onnx-int8      mean cosine >= 0.99, min >= 0.97 (dynamic int8 quantisation)
+EMBEDDING_BACKENDS = {
+    'torch': ('torch', None),
+    'onnx': ('onnx', 'onnx/model.onnx'),
+    'onnx-o3': ('onnx', 'onnx/model_O3.onnx'),
+    'onnx-int8': ('onnx', None),  # picked per CPU by _int8_model_file()
+}
+
+
+def _int8_model_file():
+    """Pick the int8 ONNX export that matches this CPU's instruction set"""
+    if platform.machine().lower() in ('arm64', 'aarch64'):
+        return 'onnx/model_qint8_arm64.onnx'
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        flags = ''
+    if 'avx512_vnni' in flags:
+        return 'onnx/model_qint8_avx512_vnni.onnx'
+    if 'avx512f' in flags:
+        return 'onnx/model_qint8_avx512.onnx'
+    return 'onnx/model_qint8_avx2.onnx'
+
+
+def load_sentence_model(backend='torch'):
+    """Load all-MiniLM-L6-v2 on the requested inference backend.
+
+    Returns:
+        (model, backend name) — falls back to ('torch') if the backend can't be loaded
+    """
+    # Deferred so importing the app does not pull in torch
+    from sentence_transformers import SentenceTransformer
+    
+    if backend not in EMBEDDING_BACKENDS:
+        logger.warning(f"Unknown EMBEDDING_BACKEND '{backend}', using torch")
+        backend = 'torch'
+    
+    st_backend, file_name = EMBEDDING_BACKENDS[backend]
+    if st_backend == 'torch':
+        return SentenceTransformer(MODEL_NAME), 'torch'
+    
+    file_name = os.getenv('EMBEDDING_ONNX_FILE') or file_name or _int8_model_file()
+    try:
+        model = SentenceTransformer(MODEL_NAME, backend=st_backend, model_kwargs={'file_name': file_name})
+        logger.info(f"Embedding backend {backend} loaded from {file_name}")
+        return model, backend
+    except Exception as e:
+        logger.warning(f"Embedding backend {backend} unavailable ({e}), falling back to torch")
+        return SentenceTransformer(MODEL_NAME), 'torch'
+
+
+class EmbeddingMicroBatcher:
+    """Coalesce concurrent single-text encodes into one batched encode call.
+
+    Callers block on a Future; a worker thread collects the requests that
+    arrive within `max_wait` seconds of the first one (up to `max_batch_size`),
+    encodes them together and fans the vectors back out.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait=0.005):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+
+    def encode(self, text, timeout=None):
+        """Encode one text through the shared batch; returns the model's output row"""
+        return self.submit(text).result(timeout)
+
+    def submit(self, text):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def stats(self):
+        return {
+            'requests': self._requests,
+            'batches': self._batches,
+            'avg_batch_size': round(self._requests / self._batches, 2) if self._batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or max_wait passes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(text, future) for text, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            self._requests += len(batch)
+            self._batches += 1
+            try:
+                vectors = self.encode_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
 class EmbeddingService:
     _instance = None
     _model_loaded = False
+    # Startup warm-up and request threads may construct the singleton concurrently
+    _init_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(EmbeddingService, cls).__new__(cls)
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super(EmbeddingService, cls).__new__(cls)
         return cls._instance
     
     def __init__(self):
         # Prevent re-initialization
-        if not self._model_loaded:
+        if self._model_loaded:
+            return
+        with self._init_lock:
+            if self._model_loaded:
+                return
             try:
-                logger.info("Loading all-MiniLM-L6-v2 embedding model...")
-                self.model = SentenceTransformer('all-MiniLM-L6-v2')
+                requested_backend = os.getenv('EMBEDDING_BACKEND', 'torch').strip().lower()
+                logger.info(f"Loading all-MiniLM-L6-v2 embedding model ({requested_backend})...")
+                self.model, self.backend = load_sentence_model(requested_backend)
+                if self.backend != requested_backend:
+                    logger.warning(
+                        f"EMBEDDING_BACKEND={requested_backend} is not available, embedding with {self.backend}; "
+                        f"install requirements-onnx.txt for the ONNX backends"
+                    )
                 self.dimension = 384
+                # Texts per model.encode call for batch embedding
+                self.batch_size = max(1, int(os.getenv('EMBEDDING_BATCH_SIZE', '32')))
+                # Concurrent generate_embedding calls are coalesced (max size 1 disables)
+                microbatch_size = int(os.getenv('EMBEDDING_MICROBATCH_MAX_SIZE', '32'))
+                microbatch_wait = float(os.getenv('EMBEDDING_MICROBATCH_WAIT_MS', '5')) / 1000
+                self.batcher = None
+                if microbatch_size > 1:
+                    self.batcher = EmbeddingMicroBatcher(
+                        lambda texts: self.model.encode(texts, batch_size=len(texts)),
+                        max_batch_size=microbatch_size,
+                        max_wait=microbatch_wait
+                    )
+                self.model_id = f"{MODEL_NAME}:{self.backend}"
+                self._init_query_cache()
                 self._model_loaded = True
                 
                 # Test the model
                 test_embedding = self.generate_embedding("test sentence")
                 # print("Test Embeddings: ",test_embedding)
-                logger.info(f"Embedding model loaded (dimension: {self.dimension})")
+                logger.info(f"Embedding model loaded (backend: {self.backend}, dimension: {self.dimension})")
                 
             except Exception as e:
                 logger.error(f"Failed to load embedding model: {str(e)}")
                 raise
     
+    def _init_query_cache(self):
+        """LRU/TTL cache of query vectors (EMBEDDING_CACHE_SIZE=0 disables it)"""
+        self.query_cache = None
+        self.query_cache_path = os.getenv('EMBEDDING_CACHE_PATH')
+        self._cache_unsaved = 0
+        self._cache_save_every = max(1, int(os.getenv('EMBEDDING_CACHE_SAVE_EVERY', '100')))
+        self._cache_save_lock = threading.Lock()
+        self._cache_count_lock = threading.Lock()
+        
+        cache_size = int(os.getenv('EMBEDDING_CACHE_SIZE', '2048'))
+        if cache_size <= 0:
+            return
+        self.query_cache = LRUCache(
+            max_entries=cache_size,
+            ttl=int(os.getenv('EMBEDDING_CACHE_TTL', '86400')),
+            name='query embedding cache'
+        )
+        if self.query_cache_path:
+            self.query_cache.load(self.query_cache_path, convert=tuple)
+            atexit.register(self.save_query_cache)
+    
+    def save_query_cache(self):
+        """Persist the query cache to EMBEDDING_CACHE_PATH (no-op when unset)"""
+        if not self.query_cache or not self.query_cache_path:
+            return
+        # Skip if a save is already running; the next one will include our entries
+        if not self._cache_save_lock.acquire(blocking=False):
+            return
+        try:
+            with self._cache_count_lock:
+                self._cache_unsaved = 0
+            self.query_cache.save(self.query_cache_path)
+        finally:
+            self._cache_save_lock.release()
+    
+    def _cache_key(self, clean_text):
+        # all-MiniLM-L6-v2 is uncased, so case and whitespace runs don't change the vector
+        return f"{self.model_id}|{' '.join(clean_text.split()).lower()}"
+    
     def generate_embedding(self, text):
-        """Generate embedding for text using all-MiniLM-L6-v2"""
+        """Generate embedding for text using all-MiniLM-L6-v2 (query vectors are cached)"""
         try:
             if not text or not text.strip():
                 raise ValueError("Text cannot be empty for embedding")
@@ -60,9 +269,18 @@ class EmbeddingService:
             clean_text = text.strip()
             if len(clean_text) < 3:
                 raise ValueError("Text too short for meaningful embedding")
+            
+            if self.query_cache:
+                cache_key = self._cache_key(clean_text)
+                cached = self.query_cache.get(cache_key)
+                if cached is not None:
+                    return list(cached)
                 
             # Generate embedding - returns numpy array
-            embedding_array = self.model.encode(clean_text)
+            if self.batcher:
+                embedding_array = self.batcher.encode(clean_text)
+            else:
+                embedding_array = self.model.encode(clean_text)
             
             # Convert to list for PostgreSQL vector type
             embedding_list = embedding_array.tolist()
@@ -70,6 +288,18 @@ class EmbeddingService:
             # Validate dimension
             if len(embedding_list) != self.dimension:
                 raise ValueError(f"Embedding dimension mismatch: expected {self.dimension}, got {len(embedding_list)}")
+            
+            if self.query_cache:
+                self.query_cache.set(cache_key, tuple(embedding_list))
+                if self.query_cache_path:
+                    # Only the request that crosses the threshold starts a save
+                    with self._cache_count_lock:
+                        self._cache_unsaved += 1
+                        due = self._cache_unsaved >= self._cache_save_every
+                        if due:
+                            self._cache_unsaved = 0
+                    if due:
+                        threading.Thread(target=self.save_query_cache, name='embedding-cache-save', daemon=True).start()
                 
             return embedding_list
             
@@ -77,19 +307,66 @@ class EmbeddingService:
             logger.error(f"Embedding generation error for text '{text[:50]}...': {str(e)}")
             raise
     
-    def generate_embeddings_batch(self, texts):
-        """Generate embeddings for multiple texts at once"""
+    def generate_query_embeddings(self, texts):
+        """Embed several queries: cached vectors are reused, the rest go through one encode call"""
         try:
-            # Filter out empty texts
-            valid_texts = [text.strip() for text in texts if text and text.strip()]
-            if not valid_texts:
-                return []
-                
-            # Generate batch embeddings
-            embeddings_array = self.model.encode(valid_texts)
-            embeddings_list = embeddings_array.tolist()
+            clean_texts = [text.strip() if text else "" for text in texts]
+            for clean_text in clean_texts:
+                if len(clean_text) < 3:
+                    raise ValueError(f"Text too short for meaningful embedding: '{clean_text}'")
+            
+            embeddings = [None] * len(clean_texts)
+            missing = []
+            for position, clean_text in enumerate(clean_texts):
+                cached = self.query_cache.get(self._cache_key(clean_text)) if self.query_cache else None
+                if cached is not None:
+                    embeddings[position] = list(cached)
+                else:
+                    missing.append(position)
+            
+            if missing:
+                encoded = self.model.encode([clean_texts[position] for position in missing], batch_size=len(missing))
+                for position, embedding_array in zip(missing, encoded):
+                    embeddings[position] = embedding_array.tolist()
+                    if self.query_cache:
+                        self.query_cache.set(self._cache_key(clean_texts[position]), tuple(embeddings[position]))
+            
+            return embeddings
+            
+        except Exception as e:
+            logger.error(f"Query batch embedding error: {str(e)}")
+            raise
+    
+    def generate_embeddings_batch(self, texts, batch_size=None):
+        """Generate embeddings for multiple texts at once.
+
+        The result is aligned 1:1 with `texts`: entries that are empty or too
+        short to embed (same rules as `generate_embedding`) come back as None.
+        Texts are encoded in length-sorted batches to minimise padding.
+        """
+        try:
+            batch_size = batch_size or self.batch_size
+            embeddings_list = [None] * len(texts)
+            
+            # Keep the original position of every embeddable text
+            valid = []
+            for position, text in enumerate(texts):
+                clean_text = text.strip() if text else ""
+                if len(clean_text) >= 3:
+                    valid.append((position, clean_text))
+            if not valid:
+                return embeddings_list
+            
+            # Longest first, so each batch holds texts of similar length
+            valid.sort(key=lambda item: len(item[1]), reverse=True)
+            
+            for batch_start in range(0, len(valid), batch_size):
+                batch = valid[batch_start:batch_start + batch_size]
+                embeddings_array = self.model.encode([text for _, text in batch], batch_size=batch_size)
+                for (position, _), embedding in zip(batch, embeddings_array):
+                    embeddings_list[position] = embedding.tolist()
             
-            logger.info(f"Generated {len(embeddings_list)} embeddings in batch")
+            logger.info(f"Generated {len(valid)} embeddings in batch ({len(texts) - len(valid)} skipped)")
             return embeddings_list
             
         except Exception as e:
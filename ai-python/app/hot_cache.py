@@ -0,0 +1,273 @@
+"""
+In-process ANN cache for frequently queried documents.
+
+A PDF that receives HOT_CACHE_MIN_QUERIES vector searches within
+HOT_CACHE_WINDOW seconds has its embeddings loaded (in the background) into
+a contiguous float32 matrix. Later searches over cached PDFs are answered
+with a dot product in NumPy; Postgres is only asked for the chunk text of
+the winners.
+
+Entries are keyed by pdf_id and pdfs.ingest_version, which process_pdf bumps
+on every successful (re)ingest. Text lookups check the version, so a worker
+that did not see the reprocess drops its stale entry and falls back to SQL.
+With HOT_CACHE_DIR set, matrices are written as `.npy` files and
+memory-mapped, so restarts and sibling workers share one copy through the
+page cache. The cache is bounded by HOT_CACHE_MAX_MB (0 disables it) and
+evicts least recently used documents first.
+"""
+
+import os
+import glob
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .database import db_connection
+from .vector_storage import storage_mode, EMBEDDING_DIMENSION
+from .utils.cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Rough per-chunk overhead of the chunk_id list on top of the matrix row
+_CHUNK_ID_BYTES = 100
+
+
+class _HotDocument:
+    __slots__ = ('pdf_id', 'user_id', 'version', 'chunk_ids', 'matrix', 'nbytes')
+
+    def __init__(self, pdf_id, user_id, version, chunk_ids, matrix):
+        self.pdf_id = pdf_id
+        self.user_id = user_id
+        self.version = version
+        self.chunk_ids = chunk_ids
+        self.matrix = matrix
+        self.nbytes = matrix.nbytes + len(chunk_ids) * _CHUNK_ID_BYTES
+
+
+class HotDocumentCache:
+    """Memory-budgeted LRU of per-PDF embedding matrices answering top-k in NumPy"""
+
+    def __init__(self, max_bytes, min_queries=3, window=600, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.min_queries = max(1, min_queries)
+        self.cache_dir = cache_dir
+        self.storage_mode = storage_mode()
+        self._documents = OrderedDict()  # pdf_id -> _HotDocument
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = set()
+        # Recent query counts per PDF; expiry makes hotness decay
+        self._query_counts = LRUCache(max_entries=10000, ttl=window, name='hot document query counts')
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def search(self, query_embedding, pdf_ids, user_id, limit):
+        """Top `limit` (chunk_id, similarity) over the given PDFs, or None if any PDF is not cached.
+
+        A miss counts towards making the missing PDFs hot.
+        """
+        with self._lock:
+            documents = [self._documents.get(pdf_id) for pdf_id in pdf_ids]
+            cold = [pdf_id for pdf_id, doc in zip(pdf_ids, documents) if doc is None or doc.user_id != user_id]
+            if cold:
+                self.misses += 1
+            else:
+                self.hits += 1
+                for pdf_id in pdf_ids:
+                    self._documents.move_to_end(pdf_id)
+        if cold:
+            self._note_queries(cold, user_id)
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # One contiguous score vector across the selected PDFs
+        scores = np.concatenate([doc.matrix @ query for doc in documents]) if documents else np.empty(0, np.float32)
+        if scores.size == 0:
+            return []
+        limit = min(limit, scores.size)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        offsets = np.cumsum([0] + [len(doc.chunk_ids) for doc in documents])
+        hits = []
+        for position in top:
+            index = int(np.searchsorted(offsets, position, side='right')) - 1
+            doc = documents[index]
+            hits.append((doc.chunk_ids[position - offsets[index]], float(scores[position]), doc.pdf_id, doc.version))
+        return hits
+
+    def invalidate(self, pdf_id):
+        """Drop a PDF (e.g. after it was reprocessed) and its memory-mapped files"""
+        pdf_id = str(pdf_id)
+        with self._lock:
+            doc = self._documents.pop(pdf_id, None)
+            if doc:
+                self._bytes -= doc.nbytes
+                self.invalidations += 1
+        self._query_counts.delete(pdf_id)
+        if self.cache_dir:
+            for path in glob.glob(os.path.join(self.cache_dir, f"{pdf_id}-v*")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if doc:
+            logger.info(f"Hot cache: invalidated {pdf_id} (v{doc.version})")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'documents': len(self._documents),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'mmap': bool(self.cache_dir)
+        }
+
+    def _note_queries(self, pdf_ids, user_id):
+        """Count a query against each cold PDF and start loading the ones that became hot"""
+        for pdf_id in pdf_ids:
+            with self._lock:
+                count = self._query_counts.get(pdf_id, 0) + 1
+                self._query_counts.set(pdf_id, count)
+                if count < self.min_queries or pdf_id in self._loading:
+                    continue
+                self._loading.add(pdf_id)
+            threading.Thread(
+                target=self._load, args=(pdf_id, user_id), name=f"hot-cache-{pdf_id[:8]}", daemon=True
+            ).start()
+
+    def _load(self, pdf_id, user_id):
+        try:
+            doc = self._load_document(pdf_id, user_id)
+            if doc is None:
+                return
+            if doc.nbytes > self.max_bytes:
+                logger.info(f"Hot cache: {pdf_id} ({doc.nbytes} bytes) exceeds the budget, not cached")
+                return
+            with self._lock:
+                old = self._documents.pop(pdf_id, None)
+                if old:
+                    self._bytes -= old.nbytes
+                self._documents[pdf_id] = doc
+                self._bytes += doc.nbytes
+                self.loads += 1
+                while self._bytes > self.max_bytes and len(self._documents) > 1:
+                    _, evicted = self._documents.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+                    self.evictions += 1
+            logger.info(f"Hot cache: loaded {pdf_id} v{doc.version} ({len(doc.chunk_ids)} chunks, {doc.nbytes} bytes)")
+        except Exception as e:
+            logger.warning(f"Hot cache: failed to load {pdf_id}: {e}")
+        finally:
+            with self._lock:
+                self._loading.discard(pdf_id)
+
+    def _load_document(self, pdf_id, user_id):
+        column = 'embedding_half' if self.storage_mode == 'halfvec' else 'embedding'
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COALESCE(ingest_version, 0) FROM pdfs WHERE pdf_id = %s AND user_id = %s",
+                    (pdf_id, user_id)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                version = row[0]
+
+                cached = self._read_files(pdf_id, version)
+                if cached:
+                    chunk_ids, matrix = cached
+                else:
+                    cursor.execute(f"""
+                        SELECT chunk_id, {column}::real[]
+                        FROM pdf_chunks_embeddings
+                        WHERE pdf_id = %s::uuid AND user_id = %s::uuid AND {column} IS NOT NULL
+                        ORDER BY chunk_index
+                    """, (pdf_id, user_id))
+                    rows = cursor.fetchall()
+                    chunk_ids = [str(chunk_id) for chunk_id, _ in rows]
+                    matrix = np.array([embedding for _, embedding in rows], dtype=np.float32).reshape(-1, EMBEDDING_DIMENSION)
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    matrix /= np.where(norms > 0, norms, 1)
+                    matrix = self._write_files(pdf_id, version, chunk_ids, matrix)
+            conn.rollback()
+        return _HotDocument(pdf_id, user_id, version, chunk_ids, matrix)
+
+    def _paths(self, pdf_id, version):
+        base = os.path.join(self.cache_dir, f"{pdf_id}-v{version}")
+        return f"{base}.npy", f"{base}.ids.npy"
+
+    def _read_files(self, pdf_id, version):
+        if not self.cache_dir:
+            return None
+        matrix_path, ids_path = self._paths(pdf_id, version)
+        if not (os.path.exists(matrix_path) and os.path.exists(ids_path)):
+            return None
+        try:
+            return list(np.load(ids_path)), np.load(matrix_path, mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Hot cache: unreadable files for {pdf_id}: {e}")
+            return None
+
+    def _write_files(self, pdf_id, version, chunk_ids, matrix):
+        """Persist the matrix and return a read-only memory map of it (or the matrix itself)"""
+        if not self.cache_dir:
+            return matrix
+        matrix_path, ids_path = self._paths(pdf_id, version)
+        try:
+            # Write-then-rename so a sibling worker never maps a partial file
+            np.save(f"{ids_path}.tmp.npy", np.array(chunk_ids, dtype='<U36'))
+            np.save(f"{matrix_path}.tmp.npy", matrix)
+            os.replace(f"{ids_path}.tmp.npy", ids_path)
+            os.replace(f"{matrix_path}.tmp.npy", matrix_path)
+            return np.load(matrix_path, mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Hot cache: could not write {matrix_path}: {e}")
+            return matrix
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_hot_cache():
+    """Process-wide HotDocumentCache, or None when HOT_CACHE_MAX_MB is 0"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_mb = float(os.getenv('HOT_CACHE_MAX_MB', '256'))
+                if max_mb <= 0:
+                    _cache = False
+                else:
+                    _cache = HotDocumentCache(
+                        max_bytes=int(max_mb * 1024 * 1024),
+                        min_queries=int(os.getenv('HOT_CACHE_MIN_QUERIES', '3')),
+                        window=int(os.getenv('HOT_CACHE_WINDOW', '600')),
+                        cache_dir=os.getenv('HOT_CACHE_DIR') or None
+                    )
+    return _cache or None
+
+
+def invalidate_hot_document(pdf_id):
+    """Drop a reprocessed PDF from this process's hot cache (other workers notice the version change)"""
+    if _cache:
+        _cache.invalidate(pdf_id)
@@ -0,0 +1,383 @@
+"""
+Ingestion job queue — runs document processing off the request thread.
+
+Two job types share the queue: 'ingest' (download → extract → embed → store)
+and 'tree' (PageIndex tree generation, scheduled after an ingest commits).
+
+Jobs live in the `ingest_jobs` Postgres table. Workers claim them with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so several AI-server replicas can share
+one queue without double-processing a document.
+"""
+
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+
+from .database import db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class IngestJobQueue:
+    """
+    Handles:
+    - Enqueueing documents for processing and returning a job ID immediately
+    - A bounded pool of worker threads that claim and run queued jobs
+    - Stage/progress reporting for the status endpoint
+    - Re-queueing jobs whose worker stopped heartbeating (crash, redeploy)
+    - Deferred PageIndex tree generation once a document is searchable
+    """
+
+    def __init__(self, pdf_processor, pageindex_service=None, workers=None, poll_interval=None, stale_after=None, max_attempts=None):
+        """
+        Args:
+            pdf_processor: DocumentProcessor used to run the ingestion pipeline
+            pageindex_service: Shared PageIndexService for 'tree' jobs (None disables them)
+            workers: Worker threads in this process (INGEST_WORKERS, default 2)
+            poll_interval: Seconds between queue polls when idle (INGEST_POLL_INTERVAL)
+            stale_after: Seconds without a heartbeat before a running job is re-queued
+            max_attempts: Attempts before a repeatedly stale job is marked failed
+        """
+        self.pdf_processor = pdf_processor
+        self.pageindex_service = pageindex_service
+        self.tree_gen_mode = os.getenv('PAGEINDEX_TREE_GEN_MODE', 'on_upload')
+        self.workers = workers or int(os.getenv('INGEST_WORKERS', '2'))
+        self.poll_interval = poll_interval or float(os.getenv('INGEST_POLL_INTERVAL', '10'))
+        self.stale_after = stale_after or int(os.getenv('INGEST_JOB_STALE_SECONDS', '900'))
+        self.max_attempts = max_attempts or int(os.getenv('INGEST_JOB_MAX_ATTEMPTS', '3'))
+
+        self._worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    # ─── Schema ───────────────────────────────────────────────────────
+
+    def ensure_schema(self):
+        """Create the queue table if it doesn't exist yet."""
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS ingest_jobs (
+                        job_id        TEXT PRIMARY KEY,
+                        job_type      TEXT NOT NULL DEFAULT 'ingest',
+                        pdf_id        TEXT NOT NULL,
+                        user_id       TEXT NOT NULL,
+                        file_id       TEXT,
+                        status        TEXT NOT NULL DEFAULT 'queued',
+                        stage         TEXT NOT NULL DEFAULT 'queued',
+                        progress      INTEGER NOT NULL DEFAULT 0,
+                        attempts      INTEGER NOT NULL DEFAULT 0,
+                        error         TEXT,
+                        result        JSONB,
+                        worker_id     TEXT,
+                        created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        started_at    TIMESTAMPTZ,
+                        heartbeat_at  TIMESTAMPTZ,
+                        finished_at   TIMESTAMPTZ
+                    )
+                """)
+                # Tables created before tree jobs existed
+                cur.execute("ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS job_type TEXT NOT NULL DEFAULT 'ingest'")
+                cur.execute("ALTER TABLE ingest_jobs ALTER COLUMN file_id DROP NOT NULL")
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS ingest_jobs_status_created_idx
+                    ON ingest_jobs (status, created_at)
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_pdf_idx ON ingest_jobs (pdf_id)")
+            conn.commit()
+
+    # ─── Public API ───────────────────────────────────────────────────
+
+    def start(self):
+        """Create the schema and start the worker threads."""
+        self.ensure_schema()
+        for n in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{self._worker_prefix}-{n}",),
+                name=f"ingest-worker-{n}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Ingest job queue started with {self.workers} workers")
+
+    def stop(self, timeout=None):
+        """Ask workers to exit after their current job."""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, pdf_id, file_id, user_id):
+        """
+        Queue a document for processing.
+
+        If the same PDF already has a queued or running job, that job's ID is
+        returned instead of creating a duplicate.
+
+        Returns:
+            job_id (str)
+        """
+        return self._enqueue('ingest', pdf_id, user_id, file_id=file_id)
+
+    def schedule_tree_generation(self, pdf_id, user_id):
+        """
+        Queue PageIndex tree generation for a freshly ingested PDF.
+
+        Only runs when PAGEINDEX_TREE_GEN_MODE is 'on_upload' and the PageIndex
+        service is available; otherwise the tree stays 'pending' for the manual
+        /generate-tree flow.
+
+        Returns:
+            job_id (str) or None when not scheduled
+        """
+        if self.tree_gen_mode != 'on_upload':
+            logger.info("PageIndex tree gen mode is 'manual', skipping auto-generation")
+            return None
+        if not self.pageindex_service:
+            logger.warning(f"PageIndex service not available, tree for PDF {pdf_id} not scheduled")
+            return None
+
+        job_id = self._enqueue('tree', pdf_id, user_id)
+        self.pdf_processor.update_tree_status(pdf_id, 'generating')
+        return job_id
+
+    def _enqueue(self, job_type, pdf_id, user_id, file_id=None):
+        job_id = str(uuid.uuid4())
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                # Serialize enqueues per PDF so the duplicate check can't race
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (str(pdf_id),))
+                cur.execute("""
+                    SELECT job_id FROM ingest_jobs
+                    WHERE pdf_id = %s AND job_type = %s AND status IN ('queued', 'running')
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (str(pdf_id), job_type))
+                existing = cur.fetchone()
+                if existing:
+                    conn.commit()
+                    logger.info(f"PDF {pdf_id} already has active {job_type} job {existing[0]}")
+                    return existing[0]
+
+                cur.execute("""
+                    INSERT INTO ingest_jobs (job_id, job_type, pdf_id, user_id, file_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (job_id, job_type, str(pdf_id), str(user_id), str(file_id) if file_id else None))
+            conn.commit()
+
+        logger.info(f"Queued {job_type} job {job_id} for PDF {pdf_id}")
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, job_id):
+        """Return a job's status, stage and progress, or None if unknown."""
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT job_id, pdf_id, status, stage, progress, attempts, error, result,
+                           created_at, started_at, finished_at, job_type
+                    FROM ingest_jobs WHERE job_id = %s
+                """, (job_id,))
+                row = cur.fetchone()
+
+        if not row:
+            return None
+
+        return {
+            'job_id': row[0],
+            'pdf_id': row[1],
+            'status': row[2],
+            'stage': row[3],
+            'progress': row[4],
+            'attempts': row[5],
+            'error': row[6],
+            'result': row[7],
+            'created_at': row[8].isoformat() if row[8] else None,
+            'started_at': row[9].isoformat() if row[9] else None,
+            'finished_at': row[10].isoformat() if row[10] else None,
+            'job_type': row[11]
+        }
+
+    # ─── Worker internals ─────────────────────────────────────────────
+
+    def _worker_loop(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                self._requeue_stale_jobs()
+                job = self._claim_next_job(worker_id)
+            except Exception as e:
+                logger.error(f"[{worker_id}] Failed to poll ingest queue: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run_job(worker_id, job)
+
+    def _claim_next_job(self, worker_id):
+        """Atomically move the oldest queued job to 'running' and return it."""
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE ingest_jobs
+                    SET status = 'running', stage = 'starting', progress = 0,
+                        attempts = attempts + 1, worker_id = %s,
+                        started_at = now(), heartbeat_at = now()
+                    WHERE job_id = (
+                        SELECT job_id FROM ingest_jobs
+                        WHERE status = 'queued'
+                        ORDER BY created_at
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING job_id, pdf_id, file_id, user_id, job_type
+                """, (worker_id,))
+                row = cur.fetchone()
+            conn.commit()
+
+        if not row:
+            return None
+        return {'job_id': row[0], 'pdf_id': row[1], 'file_id': row[2], 'user_id': row[3], 'job_type': row[4]}
+
+    def _run_job(self, worker_id, job):
+        job_id = job['job_id']
+        job_type = job['job_type']
+        logger.info(f"[{worker_id}] Running {job_type} job {job_id} for PDF {job['pdf_id']}")
+
+        def report_progress(stage, progress):
+            self._update_progress(job_id, stage, progress)
+
+        # Long extraction/OCR phases report no progress, so heartbeat independently
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(max(1, self.stale_after / 3)):
+                self._heartbeat(job_id)
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f"ingest-heartbeat-{job_id[:8]}", daemon=True)
+        heartbeat_thread.start()
+
+        try:
+            if job_type == 'tree':
+                result = self._run_tree_job(job, report_progress)
+            else:
+                result = self.pdf_processor.process_pdf(
+                    job['pdf_id'], job['file_id'], job['user_id'], progress_callback=report_progress
+                )
+        except Exception as e:
+            logger.error(f"[{worker_id}] {job_type} job {job_id} crashed: {e}", exc_info=True)
+            result = {'status': 'error', 'message': str(e)}
+        finally:
+            done.set()
+            heartbeat_thread.join()
+
+        if result.get('status') == 'success':
+            self._finish_job(job_id, 'completed', result=result)
+            logger.info(f"[{worker_id}] {job_type} job {job_id} completed")
+        else:
+            self._finish_job(job_id, 'failed', result=result, error=result.get('message'))
+            logger.warning(f"[{worker_id}] {job_type} job {job_id} failed: {result.get('message')}")
+            if job_type == 'tree':
+                self._mark_tree_failed(job['pdf_id'])
+
+        # The document is committed and searchable; build its tree separately
+        if job_type == 'ingest' and result.get('status') == 'success':
+            try:
+                self.schedule_tree_generation(job['pdf_id'], job['user_id'])
+            except Exception as e:
+                logger.error(f"[{worker_id}] Failed to schedule tree generation for PDF {job['pdf_id']}: {e}")
+
+    def _run_tree_job(self, job, report_progress):
+        """Generate and store the PageIndex tree from the stored page text."""
+        if not self.pageindex_service:
+            return {'status': 'error', 'message': 'PageIndex service not available'}
+
+        pdf_id = job['pdf_id']
+        report_progress('loading_pages', 10)
+        pages_data = self.pdf_processor.load_pages(pdf_id)
+        if not pages_data:
+            return {'status': 'error', 'message': 'No page text found for this PDF'}
+
+        report_progress('tree_generation', 30)
+        logger.info(f"Starting PageIndex tree generation for PDF {pdf_id}")
+        tree_result = self.pageindex_service.generate_tree_from_pages(pages_data, pdf_id)
+
+        if tree_result.get('status') == 'success':
+            self.pdf_processor.update_tree_status(pdf_id, 'completed', tree_result.get('tree_file_id'))
+            logger.info(f"PageIndex tree completed: {tree_result.get('node_count')} nodes")
+        return tree_result
+
+    def _mark_tree_failed(self, pdf_id):
+        try:
+            self.pdf_processor.update_tree_status(pdf_id, 'failed')
+        except Exception as e:
+            logger.error(f"Failed to record tree failure for PDF {pdf_id}: {e}")
+
+    def _update_progress(self, job_id, stage, progress):
+        """Record stage/progress; doubles as the worker heartbeat."""
+        try:
+            with db_connection() as conn:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE ingest_jobs
+                        SET stage = %s, progress = %s, heartbeat_at = now()
+                        WHERE job_id = %s
+                    """, (stage, int(progress), job_id))
+        except Exception as e:
+            logger.warning(f"Failed to update progress for job {job_id}: {e}")
+
+    def _heartbeat(self, job_id):
+        try:
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE ingest_jobs SET heartbeat_at = now() WHERE job_id = %s", (job_id,))
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Heartbeat failed for job {job_id}: {e}")
+
+    def _finish_job(self, job_id, status, result=None, error=None):
+        try:
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE ingest_jobs
+                        SET status = %s, stage = %s, progress = CASE WHEN %s = 'completed' THEN 100 ELSE progress END,
+                            result = %s, error = %s, finished_at = now(), heartbeat_at = now()
+                        WHERE job_id = %s
+                    """, (status, status, status, json.dumps(result) if result is not None else None, error, job_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to record final status for job {job_id}: {e}")
+
+    def _requeue_stale_jobs(self):
+        """Return jobs whose worker stopped heartbeating to the queue (or fail them after max attempts)."""
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE ingest_jobs
+                    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                        stage = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                        error = 'Worker stopped responding',
+                        worker_id = NULL
+                    WHERE status = 'running'
+                    AND heartbeat_at < now() - make_interval(secs => %s)
+                    RETURNING job_id, job_type, pdf_id, status
+                """, (self.max_attempts, self.max_attempts, self.stale_after))
+                requeued = cur.fetchall()
+            conn.commit()
+
+        for job_id, job_type, pdf_id, status in requeued:
+            logger.warning(f"Ingest job {job_id} had no heartbeat for {self.stale_after}s, released")
+            if job_type == 'tree' and status == 'failed':
+                # Same as the worker's own failure path, or the PDF stays 'generating' forever
+                self._mark_tree_failed(pdf_id)
@@ -10,10 +10,11 @@ import os
 import json
 import logging
 import tempfile
-import requests
 import re
 from difflib import SequenceMatcher
 
+from .utils.download_utils import download_appwrite_file
+
 logger = logging.getLogger(__name__)
 
 
@@ -412,30 +413,24 @@ JSON:"""
         if not self._appwrite_available or not tree_file_id:
             return None
 
+        tmp_path = None
         try:
-            # Use REST API directly (same pattern as pdf_processor.py)
-            endpoint = os.getenv('APPWRITE_ENDPOINT')
-            project = os.getenv('APPWRITE_PROJECT_ID')
-            api_key = os.getenv('APPWRITE_API_KEY')
-
-            url = f"{endpoint}/storage/buckets/{self.bucket_id}/files/{tree_file_id}/download"
-            headers = {
-                "X-Appwrite-Project": project,
-                "X-Appwrite-Key": api_key
-            }
-
-            response = requests.get(url, headers=headers)
-            if response.status_code != 200:
-                logger.error(f"Appwrite download failed: {response.status_code}")
-                return None
+            # Stream to a temp file over the shared session (same pattern as pdf_processor.py)
+            fd, tmp_path = tempfile.mkstemp(suffix='.json')
+            os.close(fd)
+            download_appwrite_file(self.bucket_id, tree_file_id, tmp_path)
 
-            tree = json.loads(response.content.decode('utf-8'))
+            with open(tmp_path, 'r', encoding='utf-8') as f:
+                tree = json.load(f)
             logger.info(f"Tree downloaded from Appwrite: {tree_file_id}")
             return tree
 
         except Exception as e:
             logger.error(f"Failed to download tree from Appwrite: {e}")
             return None
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def delete_tree_from_appwrite(self, tree_file_id):
         """Delete tree JSON from Appwrite (called on PDF deletion)."""
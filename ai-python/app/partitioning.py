@@ -0,0 +1,363 @@
+"""
+Partitioned storage for pdf_chunks and pdf_chunks_embeddings.
+
+Two schemes are supported:
+
+- user  HASH (user_id) into N partitions (default 16). Every search filters
+        on user_id, so it reads one partition and that partition's ANN index.
+- pdf   LIST (pdf_id) with one partition per document plus a DEFAULT
+        partition. Ingest creates the document's partition. Deleting a
+        document drops its partitions, which avoids a DELETE across the heap
+        and the vacuum debt that follows.
+
+Indexes are created on the partitioned parent, so every partition gets its
+own local HNSW/IVFFlat, (user_id, pdf_id) and full-text index, and partitions
+added later inherit them.
+
+    python -m app.partitioning status
+    python -m app.partitioning migrate --by user [--partitions 16]
+    python -m app.partitioning migrate --by pdf
+    python -m app.partitioning drop-pdf --pdf <uuid> --user <uuid>
+    python -m app.partitioning prune
+
+migrate copies rows into new partitioned tables in batches while the old
+tables stay live (it resumes if interrupted). It then locks out writers,
+catches up on rows inserted, updated or deleted meanwhile and swaps the
+names in one transaction. The old tables are
+kept as <table>_unpartitioned. Pause ingestion (INGEST_WORKERS=0) while it
+runs so the catch-up stays small, and restart the service afterwards.
+"""
+
+import os
+import json
+import uuid
+import logging
+import argparse
+import threading
+
+from .database import db_connection
+from .vector_index import VectorIndexManager, INDEX_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('pdf_chunks', 'pdf_chunks_embeddings')
+PARTITION_SCHEMES = {'user': 'user_id', 'pdf': 'pdf_id'}
+
+_schemes = {}
+_schemes_lock = threading.Lock()
+
+
+def _pdf_partition(table, pdf_id):
+    """Name of a document's partition (fits the 63-character identifier limit)"""
+    return f"{table}_pdf_{uuid.UUID(str(pdf_id)).hex}"
+
+
+def partition_scheme(cur, table='pdf_chunks_embeddings'):
+    """'user', 'pdf' or None (not partitioned), read from the catalog"""
+    cur.execute("""
+        SELECT a.attname
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+        WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace
+    """, (table,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {column: scheme for scheme, column in PARTITION_SCHEMES.items()}.get(row[0])
+
+
+def current_scheme(table='pdf_chunks_embeddings'):
+    """Partition scheme of a table, cached for the life of the process"""
+    if table not in _schemes:
+        with _schemes_lock:
+            if table not in _schemes:
+                with db_connection() as conn:
+                    with conn.cursor() as cur:
+                        _schemes[table] = partition_scheme(cur, table)
+    return _schemes[table]
+
+
+def ensure_pdf_partitions(pdf_id):
+    """Create a document's partitions under the 'pdf' scheme (no-op otherwise).
+
+    Runs in its own short transaction, before ingestion opens the long one.
+    Rows that landed in the DEFAULT partition for this PDF are moved over
+    first, otherwise the ATTACH would be rejected.
+    """
+    if current_scheme() != 'pdf':
+        return
+    pdf_literal = str(uuid.UUID(str(pdf_id)))
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for table in TABLES:
+                name = _pdf_partition(table, pdf_id)
+                cur.execute("SELECT to_regclass(%s)", (name,))
+                if cur.fetchone()[0]:
+                    continue
+                cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                cur.execute(f"""
+                    WITH moved AS (DELETE FROM {table}_default WHERE pdf_id = %s RETURNING *)
+                    INSERT INTO {name} SELECT * FROM moved
+                """, (pdf_literal,))
+                cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES IN ('{pdf_literal}')")
+                logger.info(f"Created partition {name}")
+        conn.commit()
+
+
+def drop_pdf_rows(pdf_id, user_id):
+    """Delete a document's chunks: drop its partitions under 'pdf', a pruned DELETE otherwise"""
+    pdf_id, user_id = str(uuid.UUID(str(pdf_id))), str(uuid.UUID(str(user_id)))
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            # Search rows first, in case they reference pdf_chunks
+            for table in reversed(TABLES):
+                if partition_scheme(cur, table) == 'pdf':
+                    cur.execute(f"DROP TABLE IF EXISTS {_pdf_partition(table, pdf_id)}")
+                cur.execute(
+                    f"DELETE FROM {table} WHERE user_id = %s AND pdf_id = %s",
+                    (user_id, pdf_id)
+                )
+        conn.commit()
+    logger.info(f"Dropped chunk rows of {pdf_id}")
+
+
+def prune_partitions():
+    """Drop per-PDF partitions whose document no longer exists (e.g. deleted by the backend)"""
+    dropped = []
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for table in reversed(TABLES):
+                if partition_scheme(cur, table) != 'pdf':
+                    continue
+                cur.execute("""
+                    SELECT c.relname FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = %s::regclass AND c.relname LIKE %s
+                """, (table, f"{table}_pdf_%"))
+                partitions = [row[0] for row in cur.fetchall()]
+                cur.execute("SELECT replace(pdf_id::text, '-', '') FROM pdfs")
+                live = {row[0] for row in cur.fetchall()}
+                for name in partitions:
+                    if name.rsplit('_', 1)[-1] not in live:
+                        cur.execute(f"DROP TABLE {name}")
+                        dropped.append(name)
+        conn.commit()
+    logger.info(f"Pruned {len(dropped)} partitions")
+    return dropped
+
+
+def status():
+    report = {}
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for table in TABLES:
+                cur.execute("""
+                    SELECT count(*), COALESCE(sum(pg_total_relation_size(i.inhrelid)), 0)
+                    FROM pg_inherits i WHERE i.inhparent = to_regclass(%s)
+                """, (table,))
+                partitions, size = cur.fetchone()
+                report[table] = {
+                    'scheme': partition_scheme(cur, table),
+                    'partitions': partitions,
+                    'size_bytes': int(size)
+                }
+    return report
+
+
+# ─── Migration ────────────────────────────────────────────────────────
+
+def _index_specs(table, manager, has_tsv):
+    """(final name, definition) of the partitioned indexes for a table"""
+    if table == 'pdf_chunks':
+        return [('pdf_chunks_pdf_chunk_idx', "(pdf_id, chunk_index)")]
+
+    column, opclass = INDEX_COLUMNS[manager.storage]
+    if manager.index_type == 'hnsw':
+        with_clause = f"(m = {manager.hnsw_m}, ef_construction = {manager.hnsw_ef_construction})"
+    else:
+        with_clause = f"(lists = {manager._lists_for_build()})"
+    specs = [
+        ('pdf_chunks_embeddings_user_pdf_idx', "(user_id, pdf_id)"),
+        # Serves ON DELETE CASCADE from pdfs, which filters on pdf_id alone
+        ('pdf_chunks_embeddings_pdf_idx', "(pdf_id)"),
+        (manager.index_name(), f"USING {manager.index_type} ({column} {opclass}) WITH {with_clause}"),
+    ]
+    if has_tsv:
+        specs.append(('pdf_chunks_embeddings_chunk_tsv_gin_idx', "USING gin (chunk_tsv)"))
+    return specs
+
+
+def _temp_name(name):
+    return f"{name[:58]}_part"
+
+
+def _build_partitioned_table(cur, table, by, partitions):
+    new = f"{table}_partitioned"
+    key = PARTITION_SCHEMES[by]
+    method = 'HASH' if by == 'user' else 'LIST'
+    cur.execute(f"""
+        CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+        PARTITION BY {method} ({key})
+    """)
+    # Unique constraints on a partitioned table must include the partition key
+    cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {_temp_name(table + '_pkey')} PRIMARY KEY (chunk_id, {key})")
+
+    if by == 'user':
+        for remainder in range(partitions):
+            cur.execute(f"""
+                CREATE TABLE {table}_p{remainder:02d} PARTITION OF {new}
+                FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})
+            """)
+    else:
+        cur.execute(f"CREATE TABLE {table}_default PARTITION OF {new} DEFAULT")
+        cur.execute(f"SELECT DISTINCT pdf_id::text FROM {table}")
+        for (pdf_id,) in cur.fetchall():
+            cur.execute(f"""
+                CREATE TABLE {_pdf_partition(table, pdf_id)} PARTITION OF {new}
+                FOR VALUES IN ('{uuid.UUID(pdf_id)}')
+            """)
+
+    # Foreign keys to other tables carry over; links between the two chunk
+    # tables can't (chunk_id alone is no longer unique), cascades come from pdfs
+    cur.execute("""
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        AND confrelid <> ALL(ARRAY[to_regclass('pdf_chunks'), to_regclass('pdf_chunks_embeddings')])
+    """, (table,))
+    for (definition,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE {new} ADD {definition}")
+    logger.info(f"Created {new} ({method} on {key})")
+
+
+def _copy_batches(cur, table, batch_size):
+    """Copy rows in chunk_id order; resumes after the highest chunk_id already copied.
+
+    uuid has no max(), so the keyset boundary is read with ORDER BY ... DESC LIMIT 1.
+    """
+    new = f"{table}_partitioned"
+    cur.execute(f"SELECT chunk_id::text FROM {new} ORDER BY chunk_id DESC LIMIT 1")
+    row = cur.fetchone()
+    last = row[0] if row else None
+    total = 0
+    while True:
+        where = "WHERE chunk_id > %s" if last else ""
+        cur.execute(f"""
+            WITH batch AS (
+                SELECT * FROM {table} {where} ORDER BY chunk_id LIMIT %s
+            ), copied AS (
+                INSERT INTO {new} SELECT * FROM batch
+            )
+            SELECT (SELECT chunk_id::text FROM batch ORDER BY chunk_id DESC LIMIT 1), (SELECT count(*) FROM batch)
+        """, ((last, batch_size) if last else (batch_size,)))
+        batch_last, count = cur.fetchone()
+        if not count:
+            break
+        last = batch_last
+        total += count
+        logger.info(f"{table}: copied {total} rows")
+    return total
+
+
+def _swap(conn, table, specs):
+    """Catch up on writes made during the copy and swap the tables, in one transaction.
+
+    Rows deleted or updated in the old table after they were copied (a PDF
+    deleted by the backend, the denormalize backfill) are dropped from the
+    new table, then every row it is missing is inserted again.
+    """
+    new = f"{table}_partitioned"
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+        # The tables have identical columns (CREATE TABLE ... LIKE), so rows compare column by column
+        cur.execute(f"""
+            DELETE FROM {new} n
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} t
+                WHERE t.chunk_id = n.chunk_id AND ROW(t.*) IS NOT DISTINCT FROM ROW(n.*)
+            )
+        """)
+        logger.info(f"{table}: {cur.rowcount} deleted or changed rows dropped")
+        cur.execute(f"""
+            INSERT INTO {new} SELECT * FROM {table} t
+            WHERE NOT EXISTS (SELECT 1 FROM {new} n WHERE n.chunk_id = t.chunk_id)
+        """)
+        logger.info(f"{table}: {cur.rowcount} rows caught up")
+
+        # Free the index names for the new table
+        cur.execute("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass", (table,))
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index[:50]}_unpart")
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        cur.execute(f"ALTER TABLE {new} RENAME TO {table}")
+        for name, _ in specs + [(f"{table}_pkey", None)]:
+            cur.execute(f"ALTER INDEX {_temp_name(name)} RENAME TO {name}")
+    conn.commit()
+
+
+def migrate(by, partitions=16, batch_size=5000):
+    """Move both chunk tables to the given partition scheme"""
+    manager = VectorIndexManager()
+    for table in TABLES:
+        with db_connection() as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                scheme = partition_scheme(cur, table)
+                if scheme:
+                    logger.info(f"{table} is already partitioned by {scheme}, skipping")
+                    continue
+                cur.execute("""
+                    SELECT conname FROM pg_constraint
+                    WHERE confrelid = %s::regclass AND contype = 'f'
+                    AND conrelid <> ALL(ARRAY[to_regclass('pdf_chunks'), to_regclass('pdf_chunks_embeddings')])
+                """, (table,))
+                referencing = [row[0] for row in cur.fetchall()]
+                if referencing:
+                    raise RuntimeError(f"{table} is referenced by {referencing}; drop those foreign keys first")
+
+                cur.execute("SELECT to_regclass(%s)", (f"{table}_partitioned",))
+                if not cur.fetchone()[0]:
+                    _build_partitioned_table(cur, table, by, partitions)
+                _copy_batches(cur, table, batch_size)
+
+                # Build indexes after the bulk copy; the table isn't live yet, so no CONCURRENTLY
+                cur.execute(
+                    "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'chunk_tsv'",
+                    (table,)
+                )
+                specs = _index_specs(table, manager, has_tsv=cur.fetchone() is not None)
+                cur.execute("SET maintenance_work_mem = %s", (os.getenv('VECTOR_INDEX_BUILD_MEM', '512MB'),))
+                for name, definition in specs:
+                    logger.info(f"Building {name} on {table}_partitioned")
+                    cur.execute(f"CREATE INDEX IF NOT EXISTS {_temp_name(name)} ON {table}_partitioned {definition}")
+                cur.execute(f"ANALYZE {table}_partitioned")
+
+            conn.autocommit = False
+            _swap(conn, table, specs)
+        logger.info(f"{table} is now partitioned by {by}; old rows kept in {table}_unpartitioned")
+    _schemes.clear()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Partition pdf_chunks / pdf_chunks_embeddings")
+    parser.add_argument('command', choices=['status', 'migrate', 'drop-pdf', 'prune'])
+    parser.add_argument('--by', choices=list(PARTITION_SCHEMES), default='user')
+    parser.add_argument('--partitions', type=int, default=16, help='Hash partitions (--by user)')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--pdf')
+    parser.add_argument('--user')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate(args.by, args.partitions, args.batch_size)
+        print(json.dumps(status(), indent=2))
+    elif args.command == 'drop-pdf':
+        if not (args.pdf and args.user):
+            parser.error('drop-pdf needs --pdf and --user')
+        drop_pdf_rows(args.pdf, args.user)
+    elif args.command == 'prune':
+        print(json.dumps(prune_partitions(), indent=2))
+    else:
+        print(json.dumps(status(), indent=2))
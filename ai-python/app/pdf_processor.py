@@ -1,25 +1,201 @@
-import pdfplumber
-import pytesseract
-import os
-import docx2txt
-import pandas as pd
-import csv
-from pptx import Presentation
-
-# Configure Tesseract path from environment
-pytesseract.pytesseract.tesseract_cmd = os.getenv('TESSERACT_PATH', 'tesseract')
-from PIL import Image
-import io
 import os
 import uuid
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from psycopg2.extras import execute_values
 
 from .embedding_service import EmbeddingService
-from .database import get_db_connection
+from .database import get_pool, db_connection
+from .vector_storage import embedding_columns, storage_mode, FTS_CONFIG
+from .hot_cache import invalidate_hot_document
+from .result_cache import invalidate_cached_results
+from .partitioning import ensure_pdf_partitions
+from .utils.pipeline_utils import background_iter
+from .utils.download_utils import download_appwrite_file, get_appwrite_file_metadata
 
 logger = logging.getLogger(__name__)
 
+
+# OCR tuning: first pass DPI, high-DPI retry for low-confidence pages (0 disables),
+# mean word confidence (0-100) below which a retry is attempted, and concurrent tesseract runs
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))
+OCR_RETRY_DPI = int(os.getenv('OCR_RETRY_DPI', '300'))
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', '60'))
+OCR_WORKERS = max(1, int(os.getenv('OCR_WORKERS', str(min(4, os.cpu_count() or 1)))))
+OCR_CONFIG = '--psm 6 -c preserve_interword_spaces=1'
+
+
+# Format libraries (pdfplumber, pytesseract, docx2txt, pandas, python-pptx) are
+# imported on first use so that importing this module, and starting the server,
+# does not pay for every parser up front.
+_pytesseract = None
+
+
+def _get_pytesseract():
+    """Import pytesseract on first OCR and point it at the configured binary"""
+    global _pytesseract
+    if _pytesseract is None:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = os.getenv('TESSERACT_PATH', 'tesseract')
+        _pytesseract = pytesseract
+    return _pytesseract
+
+
+def _render_page(page, resolution):
+    """Render a pdfplumber page straight to a grayscale PIL image (no PNG round trip)"""
+    return page.to_image(resolution=resolution).original.convert('L')
+
+
+def _ocr_image(image):
+    """Run tesseract once on a PIL image.
+
+    Text and word confidences both come from a single image_to_data call: words
+    are joined with spaces per line, lines with newlines, and paragraphs/blocks
+    with blank lines, like image_to_string's layout.
+
+    Returns:
+        (text, mean word confidence 0-100)
+    """
+    pytesseract = _get_pytesseract()
+    data = pytesseract.image_to_data(image, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+    
+    paragraphs = []
+    lines = {}
+    confidences = []
+    for position, word in enumerate(data['text']):
+        if not word or not word.strip():
+            continue
+        paragraph = (data['block_num'][position], data['par_num'][position])
+        if not paragraphs or paragraphs[-1] != paragraph:
+            paragraphs.append(paragraph)
+        lines.setdefault(paragraph, {}).setdefault(data['line_num'][position], []).append(word.strip())
+        confidence = float(data['conf'][position])
+        if confidence >= 0:
+            confidences.append(confidence)
+    
+    text = "\n\n".join(
+        "\n".join(" ".join(words) for words in lines[paragraph].values())
+        for paragraph in paragraphs
+    )
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, mean_confidence
+
+
+def _ocr_pages(pages_by_number):
+    """OCR low-text pages concurrently with a bounded tesseract pool.
+
+    Every page is rendered at OCR_DPI first; pages whose confidence is below
+    OCR_MIN_CONFIDENCE are rendered again at OCR_RETRY_DPI and the better
+    result is kept. Rendering stays on the calling thread (pdfplumber pages
+    are not thread-safe); only tesseract runs in the pool.
+
+    Args:
+        pages_by_number: {page_number: pdfplumber page}
+
+    Returns:
+        {page_number: ocr_text}
+    """
+    results = {}
+    
+    def run_pass(page_numbers, resolution):
+        futures = {}
+        with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+            for page_num in page_numbers:
+                # Bound rendered images held in memory to a couple per worker
+                pending = [f for f in futures.values() if not f.done()]
+                if len(pending) >= OCR_WORKERS * 2:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                try:
+                    image = _render_page(pages_by_number[page_num], resolution)
+                except Exception as render_error:
+                    logger.warning(f"OCR failed for page {page_num}: {str(render_error)}")
+                    continue
+                futures[page_num] = executor.submit(_ocr_image, image)
+            
+            for page_num, future in futures.items():
+                try:
+                    text, confidence = future.result()
+                except Exception as ocr_error:
+                    logger.warning(f"OCR failed for page {page_num}: {str(ocr_error)}")
+                    continue
+                previous = results.get(page_num)
+                if previous is None or confidence > previous[1]:
+                    results[page_num] = (text, confidence)
+                logger.info(f"OCR page {page_num} at {resolution} DPI: {len(text)} chars, confidence {confidence:.0f}")
+    
+    run_pass(sorted(pages_by_number), OCR_DPI)
+    
+    if OCR_RETRY_DPI > OCR_DPI:
+        retry_pages = [
+            page_num for page_num in sorted(pages_by_number)
+            if page_num not in results or results[page_num][1] < OCR_MIN_CONFIDENCE
+        ]
+        if retry_pages:
+            logger.info(f"Retrying OCR for {len(retry_pages)} low-confidence pages at {OCR_RETRY_DPI} DPI")
+            run_pass(retry_pages, OCR_RETRY_DPI)
+    
+    return {page_num: text for page_num, (text, _) in results.items()}
+
+
+def _extract_pages(pdf, page_numbers, total_pages):
+    """Extract the given 1-based page numbers from an open pdfplumber document"""
+    native_texts = {}
+    low_text_pages = {}
+    
+    for page_num in page_numbers:
+        logger.info(f"Processing page {page_num}/{total_pages}")
+        page = pdf.pages[page_num - 1]
+        
+        # Primary text extraction using pdfplumber
+        page_text = page.extract_text() or ""
+        native_texts[page_num] = page_text
+        
+        # OCR fallback for image-heavy pages
+        if len(page_text.strip()) <= 100:
+            logger.info(f"Low text on page {page_num}, queued for OCR")
+            low_text_pages[page_num] = page
+    
+    ocr_texts = _ocr_pages(low_text_pages) if low_text_pages else {}
+    
+    pages_data = []
+    for page_num in page_numbers:
+        page_text = native_texts[page_num]
+        ocr_text = ocr_texts.get(page_num, "")
+        used_ocr = bool(ocr_text.strip())
+        if page_num in low_text_pages and not used_ocr:
+            logger.warning(f"OCR failed to extract text from page {page_num}")
+        
+        # Combine text sources
+        final_text = page_text.strip()
+        if used_ocr:
+            if final_text:
+                final_text += "\n\n" + ocr_text.strip()
+            else:
+                final_text = ocr_text.strip()
+        
+        pages_data.append({
+            'page_number': page_num,
+            'text': final_text,
+            'char_length': len(final_text),
+            'used_ocr': used_ocr,
+            'has_native_text': bool(page_text.strip())
+        })
+        
+        logger.info(f"Page {page_num}: {len(final_text)} chars (OCR: {used_ocr})")
+    
+    return pages_data
+
+
+def _extract_page_range(pdf_path, first_page, last_page, total_pages):
+    """Process-pool worker: open a private pdfplumber handle and extract an inclusive page range"""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        return _extract_pages(pdf, range(first_page, last_page + 1), total_pages)
+
+
 class DocumentProcessor:
     def __init__(self):
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -29,10 +205,18 @@ class DocumentProcessor:
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
         self.embedding_service = EmbeddingService()
+        # Chunks written per multi-row INSERT during ingestion
+        self.insert_batch_size = max(1, int(os.getenv('INGEST_INSERT_BATCH_SIZE', '100')))
+        # Parallel PDF extraction: worker processes (1 = serial) and pages per task
+        self.extract_workers = int(os.getenv('PDF_EXTRACT_WORKERS', '1'))
+        self.extract_pages_per_task = max(1, int(os.getenv('PDF_EXTRACT_PAGES_PER_TASK', '16')))
+        # vector | halfvec | binary (see vector_storage.py; columns come from migrations)
+        self.embedding_storage = storage_mode()
     
     def extract_text_from_docx(self, file_path):
         """Extract text from DOCX file"""
         try:
+            import docx2txt
             text = docx2txt.process(file_path)
             return [{'page_number': 1, 'text': text, 'char_length': len(text), 'used_ocr': False}]
         except Exception as e:
@@ -52,6 +236,7 @@ class DocumentProcessor:
     def extract_text_from_csv(self, file_path):
         """Extract text from CSV file"""
         try:
+            import pandas as pd
             df = pd.read_csv(file_path)
             text = df.to_string(index=False)
             return [{'page_number': 1, 'text': text, 'char_length': len(text), 'used_ocr': False}]
@@ -62,6 +247,7 @@ class DocumentProcessor:
     def extract_text_from_pptx(self, file_path):
         """Extract text from PPTX file (slides and notes)"""
         try:
+            from pptx import Presentation
             prs = Presentation(file_path)
             pages_data = []
             
@@ -95,73 +281,81 @@ class DocumentProcessor:
 
     def extract_text_with_ocr(self, pdf_path):
         """Extract text from PDF with intelligent OCR fallback"""
-        pages_data = []
-        
+        return list(self.iter_text_with_ocr(pdf_path))
+    
+    def iter_text_with_ocr(self, pdf_path):
+        """Yield extracted pages in order, one page range at a time.
+
+        Large PDFs are split into page ranges and extracted in parallel worker
+        processes when PDF_EXTRACT_WORKERS > 1; the yielded pages are identical
+        to the serial path and stay in page order.
+        """
+        import pdfplumber
         try:
             with pdfplumber.open(pdf_path) as pdf:
                 total_pages = len(pdf.pages)
                 logger.info(f"Processing PDF with {total_pages} pages")
                 
-                for page_num, page in enumerate(pdf.pages, 1):
-                    logger.info(f"Processing page {page_num}/{total_pages}")
-                    
-                    # Primary text extraction using pdfplumber
-                    page_text = page.extract_text() or ""
-                    has_sufficient_text = len(page_text.strip()) > 100
-                    
-                    ocr_text = ""
-                    used_ocr = False
-                    
-                    # OCR fallback for image-heavy pages
-                    if not has_sufficient_text:
-                        logger.info(f"Low text on page {page_num}, attempting OCR...")
-                        try:
-                            # Convert page to high-resolution image
-                            page_image = page.to_image(resolution=300)
-                            
-                            # Convert to PIL Image for OCR
-                            img_bytes = io.BytesIO()
-                            page_image.save(img_bytes, format='PNG', quality=100)
-                            img_bytes.seek(0)
-                            
-                            # Perform OCR with optimized settings
-                            ocr_text = pytesseract.image_to_string(
-                                Image.open(img_bytes), 
-                                config='--psm 6 -c preserve_interword_spaces=1'
-                            )
-                            used_ocr = bool(ocr_text.strip())
-                            
-                            if used_ocr:
-                                logger.info(f"OCR extracted {len(ocr_text)} characters from page {page_num}")
-                            else:
-                                logger.warning(f"OCR failed to extract text from page {page_num}")
-                                
-                        except Exception as ocr_error:
-                            logger.warning(f"OCR failed for page {page_num}: {str(ocr_error)}")
-                    
-                    # Combine text sources
-                    final_text = page_text.strip()
-                    if used_ocr and ocr_text.strip():
-                        if final_text:
-                            final_text += "\n\n" + ocr_text.strip()
-                        else:
-                            final_text = ocr_text.strip()
-                    
-                    pages_data.append({
-                        'page_number': page_num,
-                        'text': final_text,
-                        'char_length': len(final_text),
-                        'used_ocr': used_ocr,
-                        'has_native_text': bool(page_text.strip())
-                    })
-                    
-                    logger.info(f"Page {page_num}: {len(final_text)} chars (OCR: {used_ocr})")
+                ranges = [
+                    (start, min(start + self.extract_pages_per_task - 1, total_pages))
+                    for start in range(1, total_pages + 1, self.extract_pages_per_task)
+                ]
+                
+                if self.extract_workers <= 1 or len(ranges) <= 1:
+                    for start, end in ranges:
+                        yield from _extract_pages(pdf, range(start, end + 1), total_pages)
+                    return
+            
+            # Parallel mode: each worker opens its own pdfplumber handle
+            workers = min(self.extract_workers, len(ranges))
+            logger.info(f"Extracting {total_pages} pages in {len(ranges)} ranges across {workers} processes")
+            
+            executor = ProcessPoolExecutor(max_workers=workers)
+            try:
+                # At most `workers` ranges in flight, so extracted pages never pile up
+                # ahead of the consumer; futures are taken in submission order, so
+                # pages stay ordered
+                queued = iter(ranges)
+                in_flight = deque(
+                    executor.submit(_extract_page_range, pdf_path, start, end, total_pages)
+                    for start, end in itertools.islice(queued, workers)
+                )
+                while in_flight:
+                    range_pages = in_flight.popleft().result()
+                    next_range = next(queued, None)
+                    if next_range:
+                        in_flight.append(executor.submit(_extract_page_range, pdf_path, *next_range, total_pages))
+                    yield from range_pages
+            finally:
+                # On errors (or an abandoned iterator) drop the queued ranges instead of finishing them
+                executor.shutdown(cancel_futures=True)
         
         except Exception as e:
             logger.error(f"PDF processing error: {str(e)}")
             raise
-        
-        return pages_data
+    
+    def open_document(self, file_path, ext):
+        """Return (page_count, page iterator) for a downloaded document.
+
+        PDFs are extracted lazily as the iterator is consumed; the other
+        formats are small and extracted up front.
+        """
+        if ext == '.pdf':
+            import pdfplumber
+            with pdfplumber.open(file_path) as pdf:
+                page_count = len(pdf.pages)
+            return page_count, self.iter_text_with_ocr(file_path)
+        elif ext == '.docx':
+            pages_data = self.extract_text_from_docx(file_path)
+        elif ext == '.txt':
+            pages_data = self.extract_text_from_txt(file_path)
+        elif ext == '.csv':
+            pages_data = self.extract_text_from_csv(file_path)
+        elif ext == '.pptx':
+            pages_data = self.extract_text_from_pptx(file_path)
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+        return len(pages_data), iter(pages_data)
     
     def chunk_text_with_metadata(self, text, page_number):
         """Split text into chunks with proper character offsets and metadata"""
@@ -194,54 +388,170 @@ class DocumentProcessor:
         logger.info(f"Page {page_number} split into {len(chunk_objects)} chunks")
         return chunk_objects
     
-    def process_pdf(self, pdf_id, file_path, user_id):
+    def load_pages(self, pdf_id):
+        """Per-page text of an ingested document (input for PageIndex tree generation).
+
+        Pages are stored at ingest (pdf_pages). Documents ingested before that
+        have their pages rebuilt from the stored chunks instead.
+        """
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT page_number, page_text FROM pdf_pages WHERE pdf_id = %s ORDER BY page_number",
+                    (str(pdf_id),)
+                )
+                pages = [{'page_number': pn, 'text': text} for pn, text in cur.fetchall()]
+                if pages:
+                    return pages
+                
+                # Text lives on the search row; page numbers of rows from before
+                # the denormalize migration come from pdf_chunks
+                cur.execute("""
+                    SELECT COALESCE(pce.page_number, pc.page_number) AS page, pce.chunk_text
+                    FROM pdf_chunks_embeddings pce
+                    LEFT JOIN pdf_chunks pc ON pc.chunk_id = pce.chunk_id AND pc.pdf_id = pce.pdf_id
+                    WHERE pce.pdf_id = %s::uuid
+                    ORDER BY page, pce.chunk_index
+                """, (str(pdf_id),))
+                rows = cur.fetchall()
+        
+        page_texts = {}
+        for page_num, chunk_text in rows:
+            page_texts.setdefault(page_num, []).append(chunk_text)
+        
+        return [
+            {'page_number': pn, 'text': self._join_chunks(texts)}
+            for pn, texts in sorted(page_texts.items())
+        ]
+    
+    def _join_chunks(self, texts, max_overlap=100):
+        """Join consecutive chunks of a page, dropping the text splitter's overlap (chunk_overlap)"""
+        joined = texts[0] if texts else ''
+        for text in texts[1:]:
+            overlap = next(
+                (k for k in range(min(max_overlap, len(text), len(joined)), 0, -1) if joined.endswith(text[:k])),
+                0
+            )
+            joined += text[overlap:] if overlap else ' ' + text
+        return joined
+    
+    def update_tree_status(self, pdf_id, tree_status, tree_file_id=None):
+        """Record PageIndex tree state on the pdfs row"""
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                if tree_file_id is not None:
+                    cur.execute(
+                        "UPDATE pdfs SET tree_file_id = %s, tree_status = %s WHERE pdf_id = %s",
+                        (tree_file_id, tree_status, pdf_id)
+                    )
+                else:
+                    cur.execute("UPDATE pdfs SET tree_status = %s WHERE pdf_id = %s", (tree_status, pdf_id))
+            conn.commit()
+    
+    def _write_chunk_batch(self, cursor, pdf_id, user_id, rows):
+        """Bulk-insert (chunk_id, chunk_data, embedding) rows into pdf_chunks and pdf_chunks_embeddings.
+
+        The batch is written with one multi-row INSERT per table inside a savepoint.
+        If that fails, only this batch is retried row by row so a single bad chunk
+        is skipped without aborting the surrounding transaction.
+
+        Returns:
+            Number of chunks written
+        """
+        if not rows:
+            return 0
+        
+        try:
+            cursor.execute("SAVEPOINT chunk_batch")
+            self._insert_chunk_rows(cursor, pdf_id, user_id, rows)
+            cursor.execute("RELEASE SAVEPOINT chunk_batch")
+            return len(rows)
+        except Exception as batch_error:
+            cursor.execute("ROLLBACK TO SAVEPOINT chunk_batch")
+            logger.warning(f"Bulk insert of {len(rows)} chunks failed, retrying row by row: {str(batch_error)}")
+        
+        written = 0
+        for row in rows:
+            try:
+                cursor.execute("SAVEPOINT chunk_row")
+                self._insert_chunk_rows(cursor, pdf_id, user_id, [row])
+                cursor.execute("RELEASE SAVEPOINT chunk_row")
+                written += 1
+            except Exception as chunk_error:
+                cursor.execute("ROLLBACK TO SAVEPOINT chunk_row")
+                logger.error(f"Failed to process chunk {row[1]['chunk_index']}: {str(chunk_error)}")
+        
+        # The batch savepoint is no longer needed once the fallback finished
+        cursor.execute("RELEASE SAVEPOINT chunk_batch")
+        return written
+    
+    def _insert_chunk_rows(self, cursor, pdf_id, user_id, rows):
+        """Multi-row INSERT of chunk metadata and search rows.
+
+        The chunk text is stored once, on the search row, together with the
+        page number so the ANN scan reads a single table.
+        """
+        # Insert into pdf_chunks (metadata)
+        execute_values(cursor, """
+            INSERT INTO pdf_chunks 
+            (chunk_id, pdf_id, user_id, chunk_index, page_number, start_char, end_char)
+            VALUES %s
+        """, [
+            (
+                chunk_id, pdf_id, user_id, chunk_data['chunk_index'],
+                chunk_data['page_number'], chunk_data['start_char'],
+                chunk_data['end_char']
+            )
+            for chunk_id, chunk_data, _ in rows
+        ], page_size=len(rows))
+        
+        # Insert into pdf_chunks_embeddings, in the configured storage mode (compact vector literals)
+        columns, vector_template, vector_values = embedding_columns(self.embedding_storage)
+        execute_values(cursor, f"""
+            INSERT INTO pdf_chunks_embeddings 
+            (chunk_id, pdf_id, user_id, chunk_index, chunk_text, start_char, end_char,
+             page_number, chunk_tsv, {', '.join(columns)})
+            VALUES %s
+        """, [
+            (
+                chunk_id, pdf_id, user_id, chunk_data['chunk_index'],
+                chunk_data['chunk_text'], chunk_data['start_char'],
+                chunk_data['end_char'], chunk_data['page_number'],
+                FTS_CONFIG, chunk_data['chunk_text'], *vector_values(embedding)
+            )
+            for chunk_id, chunk_data, embedding in rows
+        ], template=(
+            f"(%s::uuid, %s::uuid, %s::uuid, %s, %s, %s, %s, %s, "
+            f"to_tsvector(%s::regconfig, %s), {vector_template})"
+        ), page_size=len(rows))
+    
+    def process_pdf(self, pdf_id, file_path, user_id, progress_callback=None):
+        """
+        Download, extract, chunk, embed and store a document.
+
+        Args:
+            pdf_id: UUID of the PDF row
+            file_path: Appwrite File ID of the uploaded document
+            user_id: Owner UUID
+            progress_callback: Optional callable(stage, progress_percent) for job status reporting
+        """
         import tempfile
-        from appwrite.client import Client
-        from appwrite.services.storage import Storage
         
         tmp_file_path = None
-        conn = None
         try:
             logger.info(f"Starting document processing: {pdf_id} for user {user_id}")
             
-            # Initialize Appwrite client
-            client = Client()
-            client.set_endpoint(os.getenv('APPWRITE_ENDPOINT'))
-            client.set_project(os.getenv('APPWRITE_PROJECT_ID'))
-            client.set_key(os.getenv('APPWRITE_API_KEY'))
-            
-            storage = Storage(client)
             bucket_id = os.getenv('APPWRITE_STORAGE_BUCKET_ID')
             
             # Here file_path actually contains the Appwrite File ID from PHP backend
             file_id = file_path 
+            self._report(progress_callback, 'downloading', 0)
             logger.info(f"Downloading file ID {file_id} from Appwrite bucket {bucket_id}")
             
             try:
-                # Bypass the buggy SDK get_file_download by using the REST API directly
-                import requests
-                
-                endpoint = os.getenv('APPWRITE_ENDPOINT')
-                project = os.getenv('APPWRITE_PROJECT_ID')
-                api_key = os.getenv('APPWRITE_API_KEY')
-                
-                url = f"{endpoint}/storage/buckets/{bucket_id}/files/{file_id}/download"
-                headers = {
-                    "X-Appwrite-Project": project,
-                    "X-Appwrite-Key": api_key
-                }
-                
-                logger.info(f"Downloading directly from Appwrite API: {url}")
-                response = requests.get(url, headers=headers)
-                
-                if response.status_code != 200:
-                    raise Exception(f"Appwrite API returned {response.status_code}: {response.text}")
-                    
-                result = response.content
-                
                 # Try to get the file name/extension from Appwrite metadata, fallback to .pdf
                 try:
-                    meta = storage.get_file(bucket_id, file_id)
+                    meta = get_appwrite_file_metadata(bucket_id, file_id)
                     original_name = meta['name']
                     ext = os.path.splitext(original_name)[1].lower()
                     if not ext:
@@ -250,169 +560,181 @@ class DocumentProcessor:
                     logger.warning(f"Failed to get file metadata, defaulting to .pdf: {meta_ex}")
                     ext = '.pdf'
                 
-                # Save to a temporary file locally
+                # Stream straight to a temporary file (bypasses the buggy SDK get_file_download)
                 fd, tmp_file_path = tempfile.mkstemp(suffix=ext)
-                with os.fdopen(fd, 'wb') as f:
-                    f.write(result)
+                os.close(fd)
+                download_appwrite_file(bucket_id, file_id, tmp_file_path)
                     
             except Exception as e:
                 logger.error(f"Failed to download file from Appwrite: {e}")
                 raise FileNotFoundError(f"File ID {file_id} could not be downloaded from Appwrite")
             
-            # Determine file type and extract text using the temp file
-            logger.info(f"Processing temporary file: {tmp_file_path}, detected extension: {ext}")
-            if ext == '.pdf':
-                pages_data = self.extract_text_with_ocr(tmp_file_path)
-            elif ext == '.docx':
-                pages_data = self.extract_text_from_docx(tmp_file_path)
-            elif ext == '.txt':
-                pages_data = self.extract_text_from_txt(tmp_file_path)
-            elif ext == '.csv':
-                pages_data = self.extract_text_from_csv(tmp_file_path)
-            elif ext == '.pptx':
-                pages_data = self.extract_text_from_pptx(tmp_file_path)
-            else:
-                raise ValueError(f"Unsupported file type: {ext}")
+            return self.process_local_file(pdf_id, tmp_file_path, user_id, ext=ext, progress_callback=progress_callback)
             
-            # Check if we extracted any content
-            total_text_length = sum(page['char_length'] for page in pages_data)
-            if total_text_length == 0:
-                raise ValueError("No text content could be extracted from document")
-                
-            total_pages = len(pages_data)
+        except Exception as e:
+            logger.error(f"Document processing failed: {str(e)}")
+            return {
+                'status': 'error',
+                'message': f'Document processing failed: {str(e)}'
+            }
             
-            logger.info(f"Extracted {total_text_length} characters from {total_pages} pages/sections")
+        finally:
+            # Cleanup temporary file
+            if tmp_file_path and os.path.exists(tmp_file_path):
+                try:
+                    os.remove(tmp_file_path)
+                    logger.info(f"Cleaned up temporary file: {tmp_file_path}")
+                except Exception as e:
+                    logger.error(f"Failed to cleanup temp file {tmp_file_path}: {e}")
+    
+    def _report(self, progress_callback, stage, progress):
+        if progress_callback:
+            try:
+                progress_callback(stage, progress)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+    
+    def process_local_file(self, pdf_id, file_path, user_id, ext=None, progress_callback=None):
+        """
+        Extract, chunk, embed and store a document that is already on local disk.
+
+        process_pdf calls this after downloading; benchmarks and scripts can
+        call it directly. The pdfs row must exist. Returns the same result dict.
+        """
+        ext = ext or os.path.splitext(file_path)[1].lower() or '.pdf'
+
+        def report(stage, progress):
+            self._report(progress_callback, stage, progress)
+
+        conn = None
+        telemetry_conn = None
+        pool = get_pool()
+        try:
+            # Determine file type; pages are extracted lazily by the pipeline below
+            report('extracting', 10)
+            logger.info(f"Processing file: {file_path}, detected extension: {ext}")
+            total_pages, pages = self.open_document(file_path, ext)
             
             # Open a secondary connection strictly for live UI telemetry
-            telemetry_conn = get_db_connection()
+            telemetry_conn = pool.getconn()
             telemetry_conn.autocommit = True
             try:
                 with telemetry_conn.cursor() as t_cursor:
                     t_cursor.execute(
-                        "UPDATE pdfs SET processing_progress = 30, page_count = %s WHERE pdf_id = %s", 
+                        "UPDATE pdfs SET processing_progress = 10, page_count = %s WHERE pdf_id = %s", 
                         (total_pages, pdf_id)
                     )
             except Exception as e:
                 logger.warning(f"Telemetry update failed: {e}")
                 
+            # Per-document partitions (pdf partition scheme) are created up front,
+            # outside the long ingest transaction
+            ensure_pdf_partitions(pdf_id)
+            
             # Get database connection for main transaction
-            conn = get_db_connection()
+            conn = pool.getconn()
             cursor = conn.cursor()
             
             # Start transaction
             conn.autocommit = False
             
-            all_chunks = []
+            stats = {'pages': 0, 'chars': 0, 'chunks': 0}
+            # Extracted page text, stored for PageIndex tree generation after commit
+            page_texts = []
             
-            # Process each page and chunk text
-            for page_data in pages_data:
-                if page_data['text']:
-                    page_chunks = self.chunk_text_with_metadata(
-                        page_data['text'], 
-                        page_data['page_number']
-                    )
-                    all_chunks.extend(page_chunks)
+            # Pipeline: extract + chunk (thread) -> embed (thread) -> write (this thread).
+            # Page N+1 is extracted while page N's chunks are embedded and an earlier
+            # batch is written, with at most a couple of batches buffered per stage.
+            def chunk_batches():
+                batch = []
+                for page_data in pages:
+                    stats['pages'] += 1
+                    page_texts.append((page_data['page_number'], page_data['text'] or ''))
+                    stats['chars'] += page_data['char_length']
+                    if page_data['text']:
+                        for chunk_data in self.chunk_text_with_metadata(page_data['text'], page_data['page_number']):
+                            batch.append((chunk_data, stats['pages']))
+                            if len(batch) >= self.insert_batch_size:
+                                yield batch
+                                batch = []
+                if batch:
+                    yield batch
             
-            logger.info(f"Total chunks created: {len(all_chunks)}")
+            def embedded_batches(batches):
+                for batch in batches:
+                    embeddings = self.embedding_service.generate_embeddings_batch(
+                        [chunk_data['chunk_text'] for chunk_data, _ in batch]
+                    )
+                    yield batch, embeddings
             
-            # Insert chunks and generate embeddings in transaction
+            report('embedding', 10)
             successful_chunks = 0
-            for chunk_data in all_chunks:
-                try:
-                    chunk_id = str(uuid.uuid4())
-                    
-                    # Insert into pdf_chunks (metadata)
-                    cursor.execute("""
-                        INSERT INTO pdf_chunks 
-                        (chunk_id, pdf_id, user_id, chunk_index, page_number, start_char, end_char, chunk_text)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        chunk_id, pdf_id, user_id, chunk_data['chunk_index'],
-                        chunk_data['page_number'], chunk_data['start_char'],
-                        chunk_data['end_char'], chunk_data['chunk_text']
-                    ))
-                    
-                    # Generate embedding
-                    embedding = self.embedding_service.generate_embedding(chunk_data['chunk_text'])
-                    
-                    # Insert into pdf_chunks_embeddings
-                    cursor.execute("""
-                        INSERT INTO pdf_chunks_embeddings 
-                        (chunk_id, pdf_id, user_id, chunk_index, chunk_text, start_char, end_char, embedding)
-                        VALUES (%s::uuid, %s::uuid, %s::uuid, %s, %s, %s, %s, %s::vector)
-                    """, (
-                        chunk_id, pdf_id, user_id, chunk_data['chunk_index'],
-                        chunk_data['chunk_text'], chunk_data['start_char'],
-                        chunk_data['end_char'], embedding
-                    ))
-                    
-                    successful_chunks += 1
-                    
-                except Exception as chunk_error:
-                    logger.error(f"Failed to process chunk {chunk_data['chunk_index']}: {str(chunk_error)}")
-                    # Continue with other chunks
-                    continue
+            for batch, embeddings in background_iter(
+                embedded_batches(background_iter(chunk_batches(), maxsize=2, name=f"extract-{pdf_id}")),
+                maxsize=2, name=f"embed-{pdf_id}"
+            ):
+                stats['chunks'] += len(batch)
+                
+                rows = []
+                for (chunk_data, _), embedding in zip(batch, embeddings):
+                    if embedding is None:
+                        logger.error(f"Failed to process chunk {chunk_data['chunk_index']}: text too short for embedding")
+                        # Continue with other chunks
+                        continue
+                    rows.append((str(uuid.uuid4()), chunk_data, embedding))
+                
+                successful_chunks += self._write_chunk_batch(cursor, pdf_id, user_id, rows)
                     
-                # Calculate real-time percentage (30% to 95%) and stream it via telemetry
-                if successful_chunks % 5 == 0 or successful_chunks == len(all_chunks):
-                    # Progress bounds: 30% base + up to 65% for vectorization
-                    current_progress = 30 + int((successful_chunks / max(1, len(all_chunks))) * 65)
-                    try:
-                        with telemetry_conn.cursor() as t_cursor:
-                            t_cursor.execute("UPDATE pdfs SET processing_progress = %s WHERE pdf_id = %s", (current_progress, pdf_id))
-                    except Exception as e:
-                        pass
-            
-            # === PageIndex Tree Generation (error-isolated) ===
-            tree_file_id = None
-            tree_status = 'pending'
-            try:
-                from .pageindex_service import PageIndexService
-
-                # Check if tree generation mode is "on_upload" (default)
-                # This reads from environment; can be overridden per-request
-                tree_gen_mode = os.getenv('PAGEINDEX_TREE_GEN_MODE', 'on_upload')
-                if tree_gen_mode == 'on_upload':
-                    logger.info(f"Starting PageIndex tree generation for PDF {pdf_id}")
-                    pageindex_svc = PageIndexService()
-                    tree_result = pageindex_svc.generate_tree_from_pages(pages_data, pdf_id)
-                    if tree_result.get('status') == 'success':
-                        tree_file_id = tree_result.get('tree_file_id')
-                        tree_status = 'completed'
-                        logger.info(f"PageIndex tree completed: {tree_result.get('node_count')} nodes")
-                    else:
-                        tree_status = 'failed'
-                        logger.warning(f"PageIndex tree generation returned error: {tree_result.get('message')}")
-                else:
-                    tree_status = 'pending'
-                    logger.info("PageIndex tree gen mode is 'manual', skipping auto-generation")
-            except Exception as tree_err:
-                tree_status = 'failed'
-                logger.error(f"PageIndex tree generation failed (non-blocking): {tree_err}")
-
-            # Update PDF processing status to 100% completed
+                # Calculate real-time percentage (10% to 95%) and stream it via telemetry
+                # Progress bounds: 10% base + up to 85% by pages written
+                pages_written = batch[-1][1]
+                current_progress = 10 + int((pages_written / max(1, total_pages)) * 85)
+                try:
+                    with telemetry_conn.cursor() as t_cursor:
+                        t_cursor.execute("UPDATE pdfs SET processing_progress = %s WHERE pdf_id = %s", (current_progress, pdf_id))
+                except Exception as e:
+                    # Progress is best-effort; never fail the ingest over it
+                    logger.debug(f"Progress update failed for PDF {pdf_id}: {str(e)}")
+                report('embedding', current_progress)
+            
+            # Check if we extracted any content
+            if stats['chars'] == 0:
+                raise ValueError("No text content could be extracted from document")
+            
+            logger.info(f"Extracted {stats['chars']} characters from {stats['pages']} pages/sections")
+            logger.info(f"Total chunks created: {stats['chunks']}")
+            
+            cursor.execute("DELETE FROM pdf_pages WHERE pdf_id = %s", (pdf_id,))
+            execute_values(cursor, "INSERT INTO pdf_pages (pdf_id, page_number, page_text) VALUES %s",
+                           [(pdf_id, page_number, text) for page_number, text in page_texts], page_size=500)
+            
+            # Mark searchable. PageIndex tree generation runs afterwards as a
+            # separate background job so vector chat is available immediately.
             cursor.execute("""
                 UPDATE pdfs 
                 SET processing_status = 'completed', processing_progress = 100, page_count = %s,
-                    tree_file_id = %s, tree_status = %s
+                    tree_file_id = NULL, tree_status = 'pending',
+                    ingest_version = COALESCE(ingest_version, 0) + 1
                 WHERE pdf_id = %s
-            """, (len(pages_data), tree_file_id, tree_status, pdf_id))
+            """, (stats['pages'], pdf_id))
             
             # Commit transaction
             conn.commit()
+            invalidate_hot_document(pdf_id)
+            invalidate_cached_results(pdf_id)
             
             logger.info(f"Document processing completed: {pdf_id}")
-            logger.info(f"Statistics: {successful_chunks}/{len(all_chunks)} chunks processed")
+            logger.info(f"Statistics: {successful_chunks}/{stats['chunks']} chunks processed")
             
             return {
                 'status': 'success',
                 'message': 'Document processed successfully',
                 'data': {
                     'chunk_count': successful_chunks,
-                    'page_count': len(pages_data),
-                    'total_chunks': len(all_chunks),
-                    'tree_status': tree_status,
-                    'tree_file_id': tree_file_id
+                    'page_count': stats['pages'],
+                    'total_chunks': stats['chunks'],
+                    'tree_status': 'pending',
+                    'tree_file_id': None
                 }
             }
             
@@ -438,17 +760,9 @@ class DocumentProcessor:
             }
             
         finally:
-            # Cleanup temporary file
-            if tmp_file_path and os.path.exists(tmp_file_path):
-                try:
-                    os.remove(tmp_file_path)
-                    logger.info(f"Cleaned up temporary file: {tmp_file_path}")
-                except Exception as e:
-                    logger.error(f"Failed to cleanup temp file {tmp_file_path}: {e}")
-                    
-            # Close connection
+            # Return leased connections to the pool
             if conn:
-                conn.close()
+                pool.putconn(conn)
                 
-            if 'telemetry_conn' in locals() and telemetry_conn:
-                telemetry_conn.close()
+            if telemetry_conn:
+                pool.putconn(telemetry_conn)
@@ -0,0 +1,142 @@
+"""
+Optional cross-encoder rerank stage between vector retrieval and the prompt.
+
+With RERANK_ENABLED=true, chat retrieval fetches RERANK_CANDIDATES chunks,
+scores (question, chunk) pairs with a small CPU cross-encoder in one batched
+forward pass and keeps the best RERANK_TOP_N for the LLM.
+
+The stage has a latency budget of RERANK_BUDGET_MS. The cost per pair is
+tracked as a moving average. Only as many of the top vector candidates as fit
+in the budget are scored; the rest keep their vector order. When not even
+RERANK_MIN_CANDIDATES fit, reranking is skipped. After scoring, candidates
+below RERANK_MIN_SCORE (a raw cross-encoder logit, unset = off) are cut,
+but the best one is always kept.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name=RERANK_MODEL, candidates=30, top_n=5, budget_ms=300,
+                 min_candidates=8, min_score=None, max_length=256):
+        # Deferred so importing the app does not pull in torch
+        from sentence_transformers import CrossEncoder
+
+        backend = os.getenv('RERANK_BACKEND', 'torch').strip().lower()
+        try:
+            self.model = CrossEncoder(model_name, max_length=max_length, backend=backend)
+        except Exception as e:
+            if backend == 'torch':
+                raise
+            logger.warning(f"Rerank backend {backend} unavailable ({e}), falling back to torch")
+            self.model = CrossEncoder(model_name, max_length=max_length)
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self.min_candidates = max(1, min_candidates)
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        # Seconds per scored pair (moving average), measured by the warm-up pass
+        self._pair_cost = None
+        self.calls = 0
+        self.skipped = 0
+        self.over_budget = 0
+        self._warm_up()
+        logger.info(f"Cross-encoder reranker loaded ({model_name}, ~{self._pair_cost * 1000:.2f}ms/pair)")
+
+    def _warm_up(self):
+        pairs = [("warm up query", "warm up passage " * 40)] * self.min_candidates
+        self._score(pairs)
+
+    def _score(self, pairs):
+        started = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        elapsed = time.perf_counter() - started
+        cost = elapsed / len(pairs)
+        with self._lock:
+            self._pair_cost = cost if self._pair_cost is None else 0.8 * self._pair_cost + 0.2 * cost
+        return scores, elapsed
+
+    def rerank(self, question, chunks, top_n=None):
+        """Best `top_n` chunks by cross-encoder score (chunks come in vector order)"""
+        top_n = top_n or self.top_n
+        if len(chunks) <= 1:
+            return chunks[:top_n]
+
+        # Early cut-off: score only the head of the vector ranking that fits the budget
+        affordable = int(self.budget / self._pair_cost) if self._pair_cost else len(chunks)
+        count = min(len(chunks), affordable)
+        if count < min(self.min_candidates, len(chunks)):
+            self.skipped += 1
+            logger.info(f"Rerank skipped: {count} pairs fit in {self.budget * 1000:.0f}ms")
+            return chunks[:top_n]
+
+        head, tail = chunks[:count], chunks[count:]
+        try:
+            scores, elapsed = self._score([(question, chunk['chunk_text']) for chunk in head])
+        except Exception as e:
+            logger.warning(f"Rerank failed, keeping vector order: {e}")
+            return chunks[:top_n]
+
+        self.calls += 1
+        if elapsed > self.budget:
+            self.over_budget += 1
+
+        for chunk, score in zip(head, scores):
+            chunk['rerank_score'] = float(score)
+        ranked = sorted(head, key=lambda c: c['rerank_score'], reverse=True)
+        if self.min_score is not None:
+            ranked = ranked[:1] + [c for c in ranked[1:] if c['rerank_score'] >= self.min_score]
+
+        logger.info(f"Reranked {count}/{len(chunks)} candidates in {elapsed * 1000:.0f}ms, kept {min(top_n, len(ranked))}")
+        if self.min_score is not None:
+            # Candidates below the score floor are dropped, not backfilled from the unscored tail
+            return ranked[:top_n]
+        return (ranked + tail)[:top_n]
+
+    def stats(self):
+        return {
+            'model': self.model_name,
+            'candidates': self.candidates,
+            'top_n': self.top_n,
+            'budget_ms': self.budget * 1000,
+            'pair_cost_ms': round(self._pair_cost * 1000, 3) if self._pair_cost else None,
+            'calls': self.calls,
+            'skipped': self.skipped,
+            'over_budget': self.over_budget
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Process-wide reranker, or None unless RERANK_ENABLED (or if the model can't be loaded)"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = False
+                if os.getenv('RERANK_ENABLED', 'false').lower() == 'true':
+                    try:
+                        min_score = os.getenv('RERANK_MIN_SCORE')
+                        _reranker = CrossEncoderReranker(
+                            candidates=int(os.getenv('RERANK_CANDIDATES', '30')),
+                            top_n=int(os.getenv('RERANK_TOP_N', '5')),
+                            budget_ms=float(os.getenv('RERANK_BUDGET_MS', '300')),
+                            min_candidates=int(os.getenv('RERANK_MIN_CANDIDATES', '8')),
+                            min_score=float(min_score) if min_score else None,
+                            max_length=int(os.getenv('RERANK_MAX_LENGTH', '256'))
+                        )
+                    except Exception as e:
+                        logger.error(f"Failed to load reranker, continuing without it: {str(e)}")
+    return _reranker or None
@@ -0,0 +1,195 @@
+"""
+Retrieval result cache in front of VectorSearch.search_similar_chunks and search_batch.
+
+Keys combine the query embedding quantised to int8 (so re-phrasings that embed
+identically, and float noise, share an entry), the sorted pdf_ids, user_id,
+top_k, the search settings, and each PDF's pdfs.ingest_version. A reprocessed
+document therefore never serves old results: its entries become unreachable
+and age out. process_pdf drops the PDF's cached version in this process so the
+new one is picked up immediately.
+
+Backends:
+- local (default): in-process LRU bounded by RESULT_CACHE_MAX_ENTRIES and
+  RESULT_CACHE_MAX_MB, entries expire after RESULT_CACHE_TTL seconds
+- redis: set RESULT_CACHE_URL=redis://... (needs `pip install redis`) to share
+  results across workers; expiry is Redis' own TTL
+
+Ingest versions are looked up in one small query and kept for
+RESULT_CACHE_VERSION_TTL seconds, which bounds how long another worker can
+take to notice a reprocess. RESULT_CACHE_TTL=0 disables the cache.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from .database import db_connection
+from .utils.cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks_size(chunks):
+    """Approximate in-memory size of a cached result (dominated by chunk text)"""
+    return sum(200 + len(chunk.get('chunk_text') or '') for chunk in chunks)
+
+
+class RedisResultBackend:
+    """get/set/delete over a Redis-compatible server; values are JSON chunk lists"""
+
+    def __init__(self, url, ttl, prefix='retrieval:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Result cache get failed: {e}")
+            return default
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Result cache set failed: {e}")
+
+    def delete(self, key):
+        try:
+            return bool(self.client.delete(self.prefix + key))
+        except Exception:
+            return False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'errors': self.errors
+        }
+
+
+class RetrievalResultCache:
+    def __init__(self, backend, version_ttl=5, backend_name='local'):
+        self.backend = backend
+        self.backend_name = backend_name
+        # pdf_id -> ingest_version, briefly cached so most lookups cost no query
+        self._versions = LRUCache(max_entries=10000, ttl=version_ttl, name='ingest versions')
+        self.invalidations = 0
+
+    def make_key(self, query_embedding, pdf_ids, user_id, top_k, settings=''):
+        """Cache key, or None if a PDF's ingest version is unknown (e.g. deleted)"""
+        pdf_ids = sorted(str(pdf_id) for pdf_id in pdf_ids)
+        versions = self._ingest_versions(pdf_ids)
+        if len(versions) != len(pdf_ids):
+            return None
+        quantised = np.clip(np.round(np.asarray(query_embedding, dtype=np.float32) * 127), -127, 127).astype(np.int8)
+        digest = hashlib.sha1(quantised.tobytes())
+        digest.update(f"|{user_id}|{top_k}|{settings}|".encode())
+        digest.update(','.join(f"{pdf_id}:{versions[pdf_id]}" for pdf_id in pdf_ids).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        chunks = self.backend.get(key)
+        # Callers annotate chunks (source, rerank_score); never hand out the cached dicts
+        return [dict(chunk) for chunk in chunks] if chunks is not None else None
+
+    def set(self, key, chunks):
+        if key is None:
+            return
+        self.backend.set(key, [dict(chunk) for chunk in chunks])
+
+    def invalidate(self, pdf_id):
+        """Forget a reprocessed PDF's ingest version; its old entries are never looked up again"""
+        self._versions.delete(str(pdf_id))
+        self.invalidations += 1
+
+    def stats(self):
+        return {'backend': self.backend_name, 'invalidations': self.invalidations, **self.backend.stats()}
+
+    def _ingest_versions(self, pdf_ids):
+        versions = {}
+        missing = []
+        for pdf_id in pdf_ids:
+            version = self._versions.get(pdf_id)
+            if version is None:
+                missing.append(pdf_id)
+            else:
+                versions[pdf_id] = version
+        if missing:
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pdf_id, COALESCE(ingest_version, 0) FROM pdfs WHERE pdf_id = ANY(%s::uuid[])",
+                        (missing,)
+                    )
+                    rows = cursor.fetchall()
+            for pdf_id, version in rows:
+                self._versions.set(str(pdf_id), version)
+                versions[str(pdf_id)] = version
+        return versions
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide RetrievalResultCache, or None when RESULT_CACHE_TTL is 0"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = _create_result_cache() or False
+    return _cache or None
+
+
+def _create_result_cache():
+    ttl = int(os.getenv('RESULT_CACHE_TTL', '600'))
+    if ttl <= 0:
+        return None
+    version_ttl = float(os.getenv('RESULT_CACHE_VERSION_TTL', '5'))
+
+    url = os.getenv('RESULT_CACHE_URL')
+    if url:
+        try:
+            backend = RedisResultBackend(url, ttl)
+            backend.client.ping()
+            logger.info("Retrieval result cache using Redis")
+            return RetrievalResultCache(backend, version_ttl, backend_name='redis')
+        except Exception as e:
+            logger.warning(f"Redis result cache unavailable ({e}), using the in-process cache")
+
+    backend = LRUCache(
+        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '5000')),
+        ttl=ttl,
+        name='retrieval result cache',
+        max_bytes=int(float(os.getenv('RESULT_CACHE_MAX_MB', '64')) * 1024 * 1024),
+        sizeof=_chunks_size
+    )
+    return RetrievalResultCache(backend, version_ttl)
+
+
+def invalidate_cached_results(pdf_id):
+    """Drop cached retrieval results for a reprocessed PDF (no-op if the cache is off)"""
+    if _cache:
+        _cache.invalidate(pdf_id)
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL and hit/miss counters.
+
+    Bounded by entry count and, when `max_bytes` is set, by the summed
+    `sizeof(value)` of its entries. Values should be treated as immutable by
+    callers. Entries can be saved to
+    and loaded from a JSON file (values must be JSON-serialisable); expiry
+    times are wall-clock so they survive a restart.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, name='cache', max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self.name = name
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> (value, expires_at or None)
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        expires_at = time.time() + ttl if ttl else None
+        size = self.sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._sizes[key] = size
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return False
+        self._bytes -= self._sizes.pop(key, 0)
+        return True
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self._bytes if self.max_bytes else None,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
+
+    def save(self, path):
+        """Write live entries (least recently used first) to a JSON file atomically"""
+        now = time.time()
+        with self._lock:
+            entries = [
+                [key, value, expires_at]
+                for key, (value, expires_at) in self._entries.items()
+                if expires_at is None or expires_at > now
+            ]
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, path)
+            logger.info(f"Saved {len(entries)} {self.name} entries to {path}")
+        except Exception as e:
+            logger.warning(f"Failed to save {self.name} to {path}: {e}")
+
+    def load(self, path, convert=None):
+        """Load entries written by save(); `convert` is applied to each value. Returns the count loaded."""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load {self.name} from {path}: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for key, value, expires_at in entries:
+                if expires_at is not None and expires_at <= now:
+                    continue
+                value = convert(value) if convert else value
+                self._remove(key)
+                self._entries[key] = (value, expires_at)
+                self._sizes[key] = self.sizeof(value) if self.max_bytes else 0
+                self._bytes += self._sizes[key]
+                loaded += 1
+            self._evict()
+        logger.info(f"Loaded {loaded} {self.name} entries from {path}")
+        return loaded
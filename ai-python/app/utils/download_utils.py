@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the socket and written to disk per iteration
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+# Attempts per download (the first try included); retries resume with an HTTP Range request
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('DOWNLOAD_MAX_ATTEMPTS', '4'))
+# (connect, read) timeouts in seconds
+DOWNLOAD_TIMEOUT = (
+    float(os.getenv('DOWNLOAD_CONNECT_TIMEOUT', '10')),
+    float(os.getenv('DOWNLOAD_READ_TIMEOUT', '60'))
+)
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded after all attempts"""
+
+
+def get_http_session():
+    """Shared keep-alive requests.Session with a pooled HTTP adapter"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = int(os.getenv('HTTP_POOL_SIZE', '10'))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def download_to_file(url, dest_path, headers=None, chunk_size=None, max_attempts=None):
+    """Stream a URL to `dest_path` in fixed-size chunks.
+
+    The body is never held in memory. On connection errors, truncated bodies or
+    retryable HTTP statuses the download is resumed from the last written byte
+    with a `Range` header (or restarted if the server ignores it).
+
+    Returns:
+        Number of bytes written
+    """
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    max_attempts = max_attempts or DOWNLOAD_MAX_ATTEMPTS
+    session = get_http_session()
+
+    bytes_written = 0
+    total_size = None
+    last_error = None
+
+    for attempt in range(1, max_attempts + 1):
+        request_headers = dict(headers or {})
+        if bytes_written:
+            request_headers['Range'] = f"bytes={bytes_written}-"
+
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 206 and bytes_written:
+                    mode = 'ab'
+                    content_range = response.headers.get('Content-Range', '')
+                    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+                        total_size = int(content_range.rsplit('/', 1)[1])
+                elif response.status_code == 200:
+                    # Fresh download, or the server ignored our Range header
+                    mode = 'wb'
+                    bytes_written = 0
+                    content_length = response.headers.get('Content-Length')
+                    total_size = int(content_length) if content_length and content_length.isdigit() else None
+                elif response.status_code in _RETRYABLE_STATUS:
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                else:
+                    raise DownloadError(f"{url} returned {response.status_code}: {response.text[:500]}")
+
+                with open(dest_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            bytes_written += len(chunk)
+
+            if total_size is not None and bytes_written < total_size:
+                raise requests.ConnectionError(f"Connection closed after {bytes_written}/{total_size} bytes")
+
+            logger.info(f"Downloaded {bytes_written} bytes to {dest_path}")
+            return bytes_written
+
+        except DownloadError:
+            raise
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError,
+                requests.exceptions.ChunkedEncodingError) as e:
+            last_error = e
+            if attempt < max_attempts:
+                backoff = min(2 ** (attempt - 1), 10)
+                logger.warning(f"Download attempt {attempt}/{max_attempts} failed at byte {bytes_written}: {e}; retrying in {backoff}s")
+                time.sleep(backoff)
+
+    raise DownloadError(f"Failed to download {url} after {max_attempts} attempts: {last_error}")
+
+
+def appwrite_headers():
+    """Server-side auth headers for the Appwrite REST API"""
+    return {
+        "X-Appwrite-Project": os.getenv('APPWRITE_PROJECT_ID'),
+        "X-Appwrite-Key": os.getenv('APPWRITE_API_KEY')
+    }
+
+
+def appwrite_file_url(bucket_id, file_id, download=False):
+    """REST URL for a file (metadata) or its contents (download=True)"""
+    url = f"{os.getenv('APPWRITE_ENDPOINT')}/storage/buckets/{bucket_id}/files/{file_id}"
+    return f"{url}/download" if download else url
+
+
+def get_appwrite_file_metadata(bucket_id, file_id):
+    """Fetch Appwrite file metadata (name, mimeType, sizeOriginal, ...) over the shared session"""
+    response = get_http_session().get(
+        appwrite_file_url(bucket_id, file_id), headers=appwrite_headers(), timeout=DOWNLOAD_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def download_appwrite_file(bucket_id, file_id, dest_path):
+    """Stream an Appwrite file to disk. Bypasses the SDK's get_file_download, which buffers the whole body."""
+    return download_to_file(appwrite_file_url(bucket_id, file_id, download=True), dest_path, headers=appwrite_headers())
@@ -0,0 +1,62 @@
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+def background_iter(iterable, maxsize=2, name=None):
+    """Run an iterator in a background thread and yield its items through a bounded queue.
+
+    Chaining these turns a series of generator stages into a pipeline where
+    every stage works concurrently, while at most `maxsize` items are
+    buffered between any two stages. Exceptions raised by the producer are
+    re-raised in the consumer; closing the consumer early stops the producer
+    at its next item.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            # Propagate shutdown to upstream generator stages
+            close = getattr(iterator, 'close', None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning(f"Failed to close pipeline stage {name}: {e}")
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,347 @@
+"""
+ANN index management and per-query search settings for pdf_chunks_embeddings.
+
+Creates and validates the HNSW / IVFFlat index for the active storage mode
+(see vector_storage.py), optional per-user partial indexes for very large
+accounts, and the (user_id, pdf_id) B-tree used by filtered searches.
+
+Every search runs in its own transaction with settings picked by a search
+mode (fast / balanced / accurate):
+
+- small filtered sets (few chunks across the selected PDFs) use an exact
+  scan: 100% recall and faster than walking the graph
+- otherwise hnsw.ef_search / ivfflat.probes come from the mode, and on
+  pgvector >= 0.8 iterative scans keep filtered queries from returning fewer
+  than LIMIT rows (the usual filtered-ANN recall loss)
+
+When the table is partitioned (partitioning.py), `create` builds a local
+index on every partition and attaches them to an index on the parent.
+
+    python -m app.vector_index create [--type hnsw|ivfflat] [--user <uuid>]
+    python -m app.vector_index validate
+    python -m app.vector_index partial-candidates
+    python -m app.vector_index explain --user <uuid> --pdf <uuid> [--mode accurate] "question"
+"""
+
+import os
+import json
+import math
+import uuid
+import logging
+import argparse
+
+from .database import db_connection
+from .vector_storage import storage_mode
+from .utils.cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('hnsw', 'ivfflat')
+
+# Storage mode -> (column, operator class matching the search distance)
+INDEX_COLUMNS = {
+    'vector': ('embedding', 'vector_cosine_ops'),
+    'halfvec': ('embedding_half', 'halfvec_cosine_ops'),
+    'binary': ('embedding_bit', 'bit_hamming_ops'),
+}
+
+# Search mode -> HNSW candidate list size and the share of IVFFlat lists probed
+SEARCH_MODES = {
+    'fast': {'ef_search': 40, 'probes_ratio': 0.01},
+    'balanced': {'ef_search': 100, 'probes_ratio': 0.05},
+    'accurate': {'ef_search': 400, 'probes_ratio': 0.2},
+}
+
+
+def _uuid_literal(value):
+    """Validated UUID for DDL, which can't take bind parameters"""
+    return str(uuid.UUID(str(value)))
+
+
+class VectorIndexManager:
+    def __init__(self, storage=None):
+        self.storage = storage or storage_mode()
+        self.index_type = os.getenv('VECTOR_INDEX_TYPE', 'hnsw').strip().lower()
+        if self.index_type not in INDEX_TYPES:
+            logger.warning(f"Unknown VECTOR_INDEX_TYPE '{self.index_type}', using hnsw")
+            self.index_type = 'hnsw'
+        self.hnsw_m = int(os.getenv('VECTOR_HNSW_M', '16'))
+        self.hnsw_ef_construction = int(os.getenv('VECTOR_HNSW_EF_CONSTRUCTION', '64'))
+        # 0 = pick from the row count when the index is built
+        self.ivfflat_lists = int(os.getenv('VECTOR_IVFFLAT_LISTS', '0'))
+        self.default_mode = os.getenv('VECTOR_SEARCH_MODE', 'balanced').strip().lower()
+        # Filtered sets up to this many chunks are searched exactly
+        self.exact_max_rows = int(os.getenv('VECTOR_SEARCH_EXACT_MAX_ROWS', '20000'))
+        self.partial_min_rows = int(os.getenv('VECTOR_PARTIAL_INDEX_MIN_ROWS', '200000'))
+
+        # Chunk counts only change when a PDF is (re)ingested
+        self._pdf_counts = LRUCache(max_entries=10000, ttl=600, name='pdf chunk counts')
+        self._pgvector_version = None
+        self._lists = None
+
+    # ─── Index DDL ────────────────────────────────────────────────────
+
+    def index_name(self, index_type=None, user_id=None):
+        column = INDEX_COLUMNS[self.storage][0]
+        name = f"pdf_chunks_embeddings_{column}_{index_type or self.index_type}"
+        if user_id:
+            name += f"_u{_uuid_literal(user_id).replace('-', '')[:12]}"
+        return f"{name}_idx"
+
+    def create_index(self, index_type=None, user_id=None):
+        """Build the ANN index (optionally partial for one user) and the filter B-tree, concurrently"""
+        index_type = index_type or self.index_type
+        column, opclass = INDEX_COLUMNS[self.storage]
+
+        if index_type == 'hnsw':
+            with_clause = f"(m = {self.hnsw_m}, ef_construction = {self.hnsw_ef_construction})"
+        else:
+            with_clause = f"(lists = {self._lists_for_build(user_id)})"
+
+        where_clause = f"WHERE user_id = '{_uuid_literal(user_id)}'::uuid" if user_id else ""
+        indexes = [
+            ('pdf_chunks_embeddings_user_pdf_idx', "(user_id, pdf_id)"),
+            (self.index_name(index_type, user_id), f"USING {index_type} ({column} {opclass}) WITH {with_clause} {where_clause}"),
+        ]
+
+        with db_connection() as conn:
+            # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                if index_type == 'hnsw':
+                    cur.execute("SET maintenance_work_mem = %s", (os.getenv('VECTOR_INDEX_BUILD_MEM', '512MB'),))
+                partitions = self._partitions(cur)
+                if partitions is None:
+                    for name, definition in indexes:
+                        sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON pdf_chunks_embeddings {definition}"
+                        logger.info(f"Creating index: {' '.join(sql.split())}")
+                        cur.execute(sql)
+                elif user_id:
+                    logger.warning("pdf_chunks_embeddings is partitioned; per-user partial indexes are not built")
+                    return
+                else:
+                    for name, definition in indexes:
+                        self._create_partitioned_index(cur, name, definition, partitions)
+        self._lists = None
+        logger.info(f"Index {self.index_name(index_type, user_id)} ready")
+
+    def _partitions(self, cur):
+        """Partition names if pdf_chunks_embeddings is partitioned (see partitioning.py), else None"""
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('pdf_chunks_embeddings')")
+        row = cur.fetchone()
+        if not row or row[0] != 'p':
+            return None
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'pdf_chunks_embeddings'::regclass
+        """)
+        return [row[0] for row in cur.fetchall()]
+
+    def _create_partitioned_index(self, cur, name, definition, partitions):
+        """Local index per partition (built concurrently), then attached to an index on the parent"""
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0]:
+            return
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY pdf_chunks_embeddings {definition}")
+        for partition in partitions:
+            child = f"{partition[:40]}_{name[22:]}"[:63]
+            logger.info(f"Creating index {child} on {partition}")
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} {definition}")
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+    def _lists_for_build(self, user_id=None):
+        """pgvector guidance: rows/1000 up to 1M rows, sqrt(rows) beyond"""
+        if self.ivfflat_lists > 0:
+            return self.ivfflat_lists
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                if user_id:
+                    cur.execute("SELECT count(*) FROM pdf_chunks_embeddings WHERE user_id = %s::uuid", (str(user_id),))
+                else:
+                    cur.execute("SELECT count(*) FROM pdf_chunks_embeddings")
+                rows = cur.fetchone()[0]
+        lists = rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows))
+        return max(10, lists)
+
+    def validate(self):
+        """Describe the vector indexes and flag problems.
+
+        Returns:
+            {'indexes': [...], 'problems': [...]}
+        """
+        column, opclass = INDEX_COLUMNS[self.storage]
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT i.relname, am.amname, ix.indisvalid, ix.indisready,
+                           pg_get_indexdef(ix.indexrelid), pg_relation_size(ix.indexrelid),
+                           COALESCE(s.idx_scan, 0)
+                    FROM pg_index ix
+                    JOIN pg_class i ON i.oid = ix.indexrelid
+                    JOIN pg_class t ON t.oid = ix.indrelid
+                    JOIN pg_am am ON am.oid = i.relam
+                    LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = ix.indexrelid
+                    WHERE t.relname = 'pdf_chunks_embeddings'
+                """)
+                rows = cur.fetchall()
+
+        indexes = [{
+            'name': name,
+            'method': method,
+            'valid': valid,
+            'ready': ready,
+            'definition': definition,
+            'size_bytes': size,
+            'scans': scans
+        } for name, method, valid, ready, definition, size, scans in rows]
+
+        problems = []
+        ann = [ix for ix in indexes if ix['method'] in INDEX_TYPES and f"({column} " in ix['definition']]
+        if not any(ix['valid'] and 'WHERE' not in ix['definition'] for ix in ann):
+            problems.append(f"No valid full {'/'.join(INDEX_TYPES)} index on {column}; run `create`")
+        for ix in indexes:
+            if not ix['valid']:
+                # Left behind by a failed CREATE INDEX CONCURRENTLY
+                problems.append(f"{ix['name']} is INVALID; drop it and rebuild")
+        for ix in ann:
+            if opclass not in ix['definition']:
+                problems.append(f"{ix['name']} uses a different operator class than the search distance")
+        if not any('(user_id, pdf_id)' in ix['definition'] for ix in indexes):
+            problems.append("No (user_id, pdf_id) B-tree for filtered/exact searches")
+
+        return {'storage': self.storage, 'indexes': indexes, 'problems': problems}
+
+    def partial_index_candidates(self, min_rows=None):
+        """Users large enough that a per-user partial ANN index is worth its build cost"""
+        min_rows = min_rows or self.partial_min_rows
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT user_id, count(*) FROM pdf_chunks_embeddings
+                    GROUP BY user_id HAVING count(*) >= %s
+                    ORDER BY count(*) DESC
+                """, (min_rows,))
+                return [{'user_id': str(user_id), 'chunks': count} for user_id, count in cur.fetchall()]
+
+    # ─── Per-query settings ───────────────────────────────────────────
+
+    def pgvector_version(self, cursor):
+        if self._pgvector_version is None:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+            version = row[0] if row else '0.0.0'
+            self._pgvector_version = tuple(int(part) for part in version.split('.')[:2] if part.isdigit())
+        return self._pgvector_version
+
+    def _ivfflat_lists(self, cursor):
+        if self._lists is None:
+            cursor.execute("""
+                SELECT COALESCE(max(substring(opt FROM 'lists=(\\d+)')::int), 100)
+                FROM pg_class c, unnest(c.reloptions) opt
+                WHERE c.relname LIKE %s
+            """, ('pdf_chunks_embeddings%ivfflat%',))
+            self._lists = cursor.fetchone()[0]
+        return self._lists
+
+    def filtered_row_count(self, cursor, pdf_ids, user_id):
+        """Chunks across the selected PDFs (cached per PDF).
+
+        Filters on user_id as well, like the search itself, so partitions by user are pruned.
+        """
+        counts = {pdf_id: self._pdf_counts.get(pdf_id) for pdf_id in pdf_ids}
+        missing = [pdf_id for pdf_id, count in counts.items() if count is None]
+        if missing:
+            cursor.execute("""
+                SELECT pdf_id::text, count(*) FROM pdf_chunks_embeddings
+                WHERE pdf_id = ANY(%s::uuid[]) AND user_id = %s::uuid
+                GROUP BY pdf_id
+            """, (missing, str(user_id)))
+            found = dict(cursor.fetchall())
+            for pdf_id in missing:
+                counts[pdf_id] = found.get(pdf_id, 0)
+                self._pdf_counts.set(pdf_id, counts[pdf_id])
+        return sum(counts.values())
+
+    def apply_search_settings(self, cursor, pdf_ids, user_id, limit, mode=None):
+        """Set transaction-local planner/index settings for one search.
+
+        Must run inside the search's transaction (settings are SET LOCAL).
+
+        Returns:
+            dict describing the chosen strategy (for logging / EXPLAIN reports)
+        """
+        mode = (mode or self.default_mode).lower()
+        if mode not in SEARCH_MODES:
+            mode = 'balanced'
+
+        rows = self.filtered_row_count(cursor, [str(pdf_id) for pdf_id in pdf_ids], user_id)
+        if rows <= self.exact_max_rows:
+            # Small candidate set: an exact sort beats walking the graph. enable_indexscan=off
+            # rules out plain index scans (the ANN index and the B-tree alike); the
+            # (user_id, pdf_id) B-tree is still used through a bitmap scan, and the
+            # filtered rows are sorted by exact distance
+            cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            return {'mode': mode, 'strategy': 'exact', 'rows': rows}
+
+        knobs = SEARCH_MODES[mode]
+        settings = {'hnsw.ef_search': str(min(1000, max(knobs['ef_search'], limit)))}
+        lists = self._ivfflat_lists(cursor)
+        settings['ivfflat.probes'] = str(max(1, min(lists, math.ceil(lists * knobs['probes_ratio']))))
+        if self.pgvector_version(cursor) >= (0, 8):
+            # Keep scanning the index until LIMIT rows survive the user/pdf filter;
+            # callers re-sort by similarity, so relaxed ordering is safe
+            settings['hnsw.iterative_scan'] = 'relaxed_order'
+            settings['ivfflat.iterative_scan'] = 'relaxed_order'
+
+        assignments = ", ".join("set_config(%s, %s, true)" for _ in settings)
+        cursor.execute(f"SELECT {assignments}", [item for pair in settings.items() for item in pair])
+        return {'mode': mode, 'strategy': 'ann', 'rows': rows, **settings}
+
+
+def summarize_plan(plan):
+    """Pull index usage and timings out of EXPLAIN (FORMAT JSON) output"""
+    root = plan[0] if isinstance(plan, list) else plan
+    indexes, node_types = [], []
+
+    def walk(node):
+        node_types.append(node.get('Node Type'))
+        if node.get('Index Name'):
+            indexes.append(node['Index Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(root['Plan'])
+    return {
+        'indexes_used': indexes,
+        'ann_index_used': any('hnsw' in name or 'ivfflat' in name for name in indexes),
+        'node_types': node_types,
+        'planning_ms': root.get('Planning Time'),
+        'execution_ms': root.get('Execution Time')
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Manage ANN indexes on pdf_chunks_embeddings")
+    parser.add_argument('command', choices=['create', 'validate', 'partial-candidates', 'explain'])
+    parser.add_argument('question', nargs='?', default='introduction summary overview abstract')
+    parser.add_argument('--type', choices=INDEX_TYPES)
+    parser.add_argument('--user', help='user_id (partial index for create, filter for explain)')
+    parser.add_argument('--pdf', action='append', default=[], help='pdf_id to search (repeatable)')
+    parser.add_argument('--mode', choices=list(SEARCH_MODES))
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    manager = VectorIndexManager()
+    if args.command == 'create':
+        manager.create_index(args.type, user_id=args.user)
+        print(json.dumps(manager.validate(), indent=2))
+    elif args.command == 'validate':
+        print(json.dumps(manager.validate(), indent=2))
+    elif args.command == 'partial-candidates':
+        print(json.dumps(manager.partial_index_candidates(), indent=2))
+    else:
+        from .vector_search import VectorSearch
+        report = VectorSearch().explain_search(args.question, args.pdf, args.user, top_k=args.top_k, search_mode=args.mode)
+        print(json.dumps(report, indent=2, default=str))
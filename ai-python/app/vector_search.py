@@ -1,29 +1,145 @@
+import os
+import heapq
 import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
 from .embedding_service import EmbeddingService
-from .database import get_db_connection
+from .database import db_connection
+from .vector_storage import storage_mode, vector_literal, EMBEDDING_DIMENSION, BINARY_RERANK_FACTOR, FTS_CONFIG
+from .vector_index import VectorIndexManager, summarize_plan
+from .hot_cache import get_hot_cache
+from .result_cache import get_result_cache
 
 logger = logging.getLogger(__name__)
 
+
+def mmr_select(relevance, vectors, k, lambda_mult):
+    """Indices of k candidates picked by maximal marginal relevance.
+
+    Each step takes the candidate maximising
+    lambda * relevance - (1 - lambda) * max cosine to the already selected ones,
+    so overlapping neighbour chunks don't both make the cut.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+    
+    selected = [int(np.argmax(relevance))]
+    available = np.ones(len(relevance), dtype=bool)
+    available[selected[0]] = False
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(relevance)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
 class VectorSearch:
     def __init__(self):
         self.embedding_service = EmbeddingService()
+        # vector | halfvec | binary (see vector_storage.py)
+        self.storage_mode = storage_mode()
+        self.index_manager = VectorIndexManager(storage=self.storage_mode)
+        # Reciprocal rank fusion constant and per-leg candidate depth (x top_k) for hybrid search
+        self.rrf_k = int(os.getenv('HYBRID_RRF_K', '60'))
+        self.hybrid_depth = max(1, int(os.getenv('HYBRID_CANDIDATE_FACTOR', '4')))
+        # MMR trade-off between relevance and diversity; opt-in, the default 1 keeps plain
+        # similarity ranking (no vectors fetched). Around 0.7 is a reasonable diversity setting.
+        self.mmr_lambda = float(os.getenv('RETRIEVAL_MMR_LAMBDA', '1'))
+        self.use_mmr = self.mmr_lambda < 1
+        # In-process top-k for frequently queried PDFs (None when HOT_CACHE_MAX_MB=0)
+        self.hot_cache = get_hot_cache()
+        # Per-PDF fan-out: off (default) | auto (>= VECTOR_FANOUT_MIN_PDFS selected) | always.
+        # The shared executor caps how many pooled connections fan-outs hold at once;
+        # it never takes more than half of DB_POOL_MAX, so plain searches still get connections.
+        self.fanout = os.getenv('VECTOR_SEARCH_FANOUT', 'off').strip().lower()
+        self.fanout_min_pdfs = max(2, int(os.getenv('VECTOR_FANOUT_MIN_PDFS', '4')))
+        self.fanout_deadline = float(os.getenv('VECTOR_FANOUT_DEADLINE_MS', '1500')) / 1000
+        self._fanout_pool = None
+        if self.fanout != 'off':
+            workers = min(int(os.getenv('VECTOR_FANOUT_WORKERS', '4')), int(os.getenv('DB_POOL_MAX', '10')) // 2)
+            self._fanout_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='vector-fanout')
+        # Finished results keyed on (query vector, PDFs + ingest versions, ...) (None when RESULT_CACHE_TTL=0)
+        self.result_cache = get_result_cache()
     
-    def search_similar_chunks(self, query, pdf_ids, user_id, top_k=5, similarity_threshold=0.7):
-        """Search for similar chunks using vector cosine similarity"""
+    def search_similar_chunks(self, query, pdf_ids, user_id, top_k=5, similarity_threshold=0.7, search_mode=None):
+        """Search for similar chunks using vector cosine similarity.
+
+        search_mode ('fast' / 'balanced' / 'accurate') trades recall for latency;
+        see vector_index.py. Defaults to VECTOR_SEARCH_MODE. PDFs held in the
+        hot document cache are ranked in-process (exactly) instead, and repeat
+        searches are answered from the result cache.
+        """
         try:
             # Generate query embedding
             query_embedding = self.embedding_service.generate_embedding(query)
             logger.info(f"Vector search for query: '{query[:50]}...'")
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
+            top_chunks = self._search_embeddings([query_embedding], pdf_ids, user_id, top_k, search_mode)[0]
+            logger.info(f"Found {len(top_chunks)} relevant chunks (threshold: {similarity_threshold})")
+            return top_chunks
+            
+        except Exception as e:
+            logger.error(f"Vector search error: {str(e)}")
+            raise
+    
+    def hybrid_search(self, query, pdf_ids, user_id, top_k=5, similarity_threshold=0.7, search_mode=None,
+                      query_embedding=None):
+        """Lexical (tsvector) + vector search fused with reciprocal rank fusion, in one round trip.
+
+        Both legs fetch top_k * HYBRID_CANDIDATE_FACTOR candidates; a chunk scores
+        sum(1 / (HYBRID_RRF_K + rank)) over the legs it appears in. Exact
+        identifiers and rare terms that embeddings miss come in via the lexical leg.
+        query_embedding skips embedding the query again (batch search).
+        """
+        try:
+            if query_embedding is None:
+                query_embedding = self.embedding_service.generate_embedding(query)
+            logger.info(f"Hybrid search for query: '{query[:50]}...'")
             
-            # Convert UUIDs to strings for query (keep as strings, cast in SQL)
             pdf_ids_str = [str(pdf_id) for pdf_id in pdf_ids]
             user_id_str = str(user_id)
+            query_vector = vector_literal(query_embedding)
+            depth = top_k * self.hybrid_depth
             
-            # FIXED: Cast UUID parameters properly
-            cursor.execute("""
+            vector_sql, vector_params = self._similarity_query(query_vector, pdf_ids_str, user_id_str, depth)
+            sql = f"""
+                WITH q AS (
+                    -- OR of the question's lexemes: any shared term is a lexical candidate
+                    SELECT to_tsquery('simple', COALESCE(string_agg(quote_literal(lexeme), ' | '), '')) AS query
+                    FROM unnest(to_tsvector(%s::regconfig, %s))
+                ),
+                vector_hits AS (
+                    SELECT chunk_id, row_number() OVER (ORDER BY similarity DESC) AS rank
+                    FROM ({vector_sql}) v
+                ),
+                lexical_hits AS (
+                    SELECT chunk_id, row_number() OVER (ORDER BY score DESC) AS rank
+                    FROM (
+                        SELECT pce.chunk_id, ts_rank_cd(pce.chunk_tsv, q.query) AS score
+                        FROM pdf_chunks_embeddings pce, q
+                        WHERE pce.pdf_id = ANY(%s::uuid[])
+                        AND pce.user_id = %s::uuid
+                        AND pce.chunk_tsv @@ q.query
+                        ORDER BY score DESC
+                        LIMIT %s
+                    ) l
+                ),
+                fused AS (
+                    SELECT chunk_id, SUM(1.0 / (%s + rank)) AS rrf_score
+                    FROM (
+                        SELECT chunk_id, rank FROM vector_hits
+                        UNION ALL
+                        SELECT chunk_id, rank FROM lexical_hits
+                    ) hits
+                    GROUP BY chunk_id
+                )
                 SELECT 
                     pce.chunk_id,
                     pce.pdf_id,
@@ -31,81 +147,437 @@ class VectorSearch:
                     pce.chunk_text,
                     pce.start_char,
                     pce.end_char,
-                    pc.page_number,
+                    COALESCE(pce.page_number, pc.page_number),
                     pdf.file_name,
-                    1 - (pce.embedding <=> %s::vector) as similarity
-                FROM pdf_chunks_embeddings pce
-                JOIN pdfs pdf ON pce.pdf_id = pdf.pdf_id
-                JOIN pdf_chunks pc ON pce.chunk_id = pc.chunk_id
-                WHERE pce.pdf_id = ANY(%s::uuid[])  -- CAST string array to UUID array
-                AND pce.user_id = %s::uuid          -- CAST string to UUID
-                ORDER BY pce.embedding <=> %s::vector
+                    1 - ({self._distance_sql()}) as similarity,
+                    f.rrf_score
+                    {self._vector_column_sql() if self.use_mmr else ''}
+                FROM fused f
+                JOIN pdf_chunks_embeddings pce ON pce.chunk_id = f.chunk_id
+                -- Partition keys, so a partitioned table is pruned here too
+                AND pce.user_id = %s::uuid AND pce.pdf_id = ANY(%s::uuid[])
+                JOIN pdfs pdf ON pdf.pdf_id = pce.pdf_id
+                LEFT JOIN pdf_chunks pc ON pc.chunk_id = pce.chunk_id AND pc.pdf_id = pce.pdf_id
+                ORDER BY f.rrf_score DESC
                 LIMIT %s
-            """, (query_embedding, pdf_ids_str, user_id_str, query_embedding, top_k * 2))
+            """
+            params = (
+                (FTS_CONFIG, query)
+                + tuple(vector_params)
+                + (pdf_ids_str, user_id_str, depth, self.rrf_k, query_vector, user_id_str, pdf_ids_str, top_k * 2)
+            )
             
-            results = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    strategy = self.index_manager.apply_search_settings(cursor, pdf_ids_str, user_id_str, depth, search_mode)
+                    cursor.execute(sql, params)
+                    results = cursor.fetchall()
+                conn.rollback()
+            logger.debug(f"Hybrid search strategy: {strategy}")
             
-            # Process results and remove duplicates, then apply threshold
-            unique_chunks = {}
-            for row in results:
-                chunk_id, pdf_id, chunk_index, chunk_text, start_char, end_char, page_number, pdf_name, similarity = row
-                
-                # Use chunk text as key to avoid duplicates
-                chunk_key = chunk_text[:100]
-                if chunk_key not in unique_chunks or unique_chunks[chunk_key]['similarity'] < similarity:
-                    unique_chunks[chunk_key] = {
-                        'chunk_id': str(chunk_id),  # Ensure UUID is string
-                        'pdf_id': str(pdf_id),      # Ensure UUID is string
-                        'chunk_index': chunk_index,
-                        'chunk_text': chunk_text,
-                        'start_char': start_char,
-                        'end_char': end_char,
-                        'page_number': page_number,
-                        'pdf_name': pdf_name,
-                        'similarity': float(similarity)
-                    }
-            
-            # Sort by similarity and get top chunks, then apply threshold
-            all_chunks = sorted(unique_chunks.values(), key=lambda x: x['similarity'], reverse=True)
-            
-            # Apply threshold but be more lenient - take top chunks even if below threshold
-            if len(all_chunks) <= top_k:
-                top_chunks = all_chunks
-            else:
-                # Take top chunks, but if they're all below threshold, take the best ones anyway
-                top_chunks = all_chunks[:top_k]
-                if top_chunks and top_chunks[-1]['similarity'] < similarity_threshold:
-                    # If the last chunk is below threshold, still include it for context
-                    pass
-            
-            logger.info(f"Found {len(top_chunks)} relevant chunks (threshold: {similarity_threshold})")
+            top_chunks = self._rows_to_chunks(results, top_k, score_key='rrf_score', with_vectors=self.use_mmr)
+            logger.info(f"Found {len(top_chunks)} relevant chunks via hybrid search")
             return top_chunks
             
         except Exception as e:
-            logger.error(f"Vector search error: {str(e)}")
+            logger.error(f"Hybrid search error: {str(e)}")
             raise
     
+    def search_batch(self, queries, pdf_ids, user_id, top_k=5, similarity_threshold=0.7, search_mode=None,
+                     retrieval_mode='vector'):
+        """Search for several queries at once; returns one ranked chunk list per query, in order.
+
+        The queries are embedded in one encode call. Each one then goes through
+        the same result cache, hot document cache and fan-out logic as
+        search_similar_chunks, so the results are identical; the vector searches
+        still left over run as one SQL statement. retrieval_mode='hybrid' runs
+        hybrid_search per query (the lexical leg is not batched).
+        """
+        try:
+            if not queries:
+                return []
+            query_embeddings = self.embedding_service.generate_query_embeddings(queries)
+            logger.info(f"Batch {retrieval_mode} search for {len(queries)} queries")
+            
+            if retrieval_mode == 'hybrid':
+                return [
+                    self.hybrid_search(
+                        query, pdf_ids, user_id, top_k=top_k, similarity_threshold=similarity_threshold,
+                        search_mode=search_mode, query_embedding=embedding
+                    )
+                    for query, embedding in zip(queries, query_embeddings)
+                ]
+            return self._search_embeddings(query_embeddings, pdf_ids, user_id, top_k, search_mode)
+            
+        except Exception as e:
+            logger.error(f"Batch vector search error: {str(e)}")
+            raise
+    
+    def _search_embeddings(self, query_embeddings, pdf_ids, user_id, top_k, search_mode):
+        """Top-k chunks for each query embedding: result cache, then hot cache, then SQL.
+
+        A single query (or any query when fanning out) runs its own search; two
+        or more left for SQL share one statement, with the query vectors
+        unnested WITH ORDINALITY and each searched in a LATERAL subquery.
+        """
+        # Convert UUIDs to strings for query (keep as strings, cast in SQL)
+        pdf_ids_str = [str(pdf_id) for pdf_id in pdf_ids]
+        user_id_str = str(user_id)
+        
+        results = [None] * len(query_embeddings)
+        cache_keys = [None] * len(query_embeddings)
+        pending = []
+        for position, query_embedding in enumerate(query_embeddings):
+            cache_keys[position] = self._result_cache_key(query_embedding, pdf_ids_str, user_id_str, top_k, search_mode)
+            if cache_keys[position]:
+                cached = self.result_cache.get(cache_keys[position])
+                if cached is not None:
+                    logger.info(f"Found {len(cached)} relevant chunks in the result cache")
+                    results[position] = cached
+                    continue
+            
+            if self.hot_cache:
+                rows = self._search_hot_cache(query_embedding, pdf_ids_str, user_id_str, top_k * 2)
+                if rows is not None:
+                    results[position] = self._rows_to_chunks(rows, top_k, with_vectors=self.use_mmr)
+                    logger.info(f"Found {len(results[position])} relevant chunks from the hot document cache")
+                    if cache_keys[position]:
+                        self.result_cache.set(cache_keys[position], results[position])
+                    continue
+            pending.append(position)
+        
+        if len(pending) == 1 or (pending and self._use_fanout(pdf_ids_str)):
+            for position in pending:
+                query_vector = vector_literal(query_embeddings[position])
+                if self._use_fanout(pdf_ids_str):
+                    rows = self._fanout_search(query_vector, pdf_ids_str, user_id_str, top_k * 2, search_mode)
+                else:
+                    rows = self._single_search(query_vector, pdf_ids_str, user_id_str, top_k * 2, search_mode)
+                results[position] = self._rows_to_chunks(rows, top_k, with_vectors=self.use_mmr)
+        elif pending:
+            hits_sql, hits_params = self._similarity_query(
+                None, pdf_ids_str, user_id_str, top_k * 2, with_vectors=self.use_mmr, query_ref='q.query_vector'
+            )
+            sql = f"""
+                SELECT q.ord, hits.*
+                FROM unnest(%s::text[]) WITH ORDINALITY AS q(query_vector, ord)
+                CROSS JOIN LATERAL ({hits_sql}) hits
+                ORDER BY q.ord
+            """
+            params = ([vector_literal(query_embeddings[position]) for position in pending],) + tuple(hits_params)
+            
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    strategy = self.index_manager.apply_search_settings(cursor, pdf_ids_str, user_id_str, top_k * 2, search_mode)
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+                conn.rollback()
+            logger.debug(f"Batch vector search strategy: {strategy}")
+            
+            rows_by_query = [[] for _ in pending]
+            for row in rows:
+                rows_by_query[row[0] - 1].append(row[1:])
+            for position, query_rows in zip(pending, rows_by_query):
+                results[position] = self._rows_to_chunks(query_rows, top_k, with_vectors=self.use_mmr)
+        
+        for position in pending:
+            if cache_keys[position]:
+                self.result_cache.set(cache_keys[position], results[position])
+        return results
+    
+    def _use_fanout(self, pdf_ids_str):
+        if self.fanout == 'always':
+            return len(pdf_ids_str) > 1
+        return self.fanout == 'auto' and len(pdf_ids_str) >= self.fanout_min_pdfs
+    
+    def _single_search(self, query_vector, pdf_ids_str, user_id_str, limit, search_mode):
+        """Top-`limit` rows across the selected PDFs in one statement"""
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                strategy = self.index_manager.apply_search_settings(cursor, pdf_ids_str, user_id_str, limit, search_mode)
+                cursor.execute(*self._similarity_query(
+                    query_vector, pdf_ids_str, user_id_str, limit, with_vectors=self.use_mmr
+                ))
+                rows = cursor.fetchall()
+            # End the transaction so the SET LOCAL settings are dropped
+            conn.rollback()
+        logger.debug(f"Vector search strategy: {strategy}")
+        return rows
+    
+    def _fanout_search(self, query_vector, pdf_ids_str, user_id_str, limit, search_mode):
+        """Top-`limit` rows via one nearest-neighbour query per PDF, run concurrently and heap-merged.
+
+        Each PDF gets its own small filtered search (often an exact scan),
+        so latency tracks the slowest PDF instead of the total selection.
+        Each per-PDF query gets VECTOR_FANOUT_DEADLINE_MS from when it starts
+        (time queued behind other requests doesn't count). PDFs that time out
+        or fail are searched again together in one plain statement, so the
+        result is always complete.
+        """
+        def search_pdf(pdf_id):
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    # The server gives up at the deadline
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                                   (str(int(self.fanout_deadline * 1000)),))
+                    self.index_manager.apply_search_settings(cursor, [pdf_id], user_id_str, limit, search_mode)
+                    cursor.execute(*self._similarity_query(
+                        query_vector, [pdf_id], user_id_str, limit, with_vectors=self.use_mmr
+                    ))
+                    rows = cursor.fetchall()
+                conn.rollback()
+            # Iterative scans return relaxed order; the merge needs each list sorted
+            rows.sort(key=lambda row: row[8], reverse=True)
+            return rows
+        
+        futures = {self._fanout_pool.submit(search_pdf, pdf_id): pdf_id for pdf_id in pdf_ids_str}
+        wait(futures)
+        
+        per_pdf = []
+        failed = []
+        for future, pdf_id in futures.items():
+            try:
+                per_pdf.append(future.result())
+            except Exception as e:
+                logger.warning(f"Fan-out search failed for PDF {pdf_id}: {e}")
+                failed.append(pdf_id)
+        
+        if failed:
+            logger.warning(f"Fan-out search: {len(failed)}/{len(pdf_ids_str)} PDFs retried in one statement")
+            rows = self._single_search(query_vector, failed, user_id_str, limit, search_mode)
+            per_pdf.append(sorted(rows, key=lambda row: row[8], reverse=True))
+        logger.debug(f"Fan-out search over {len(pdf_ids_str)} PDFs")
+        
+        merged = heapq.merge(*per_pdf, key=lambda row: row[8], reverse=True)
+        return list(itertools.islice(merged, limit))
+    
+    def _result_cache_key(self, query_embedding, pdf_ids_str, user_id_str, top_k, search_mode):
+        """Result cache key for a search, or None when the cache is off or the key can't be built"""
+        if not self.result_cache:
+            return None
+        try:
+            settings = f"{self.storage_mode}|{search_mode or ''}|{self.mmr_lambda}"
+            return self.result_cache.make_key(query_embedding, pdf_ids_str, user_id_str, top_k, settings)
+        except Exception as e:
+            logger.warning(f"Result cache lookup skipped: {e}")
+            return None
+    
+    def _search_hot_cache(self, query_embedding, pdf_ids_str, user_id_str, limit):
+        """Rank in the hot cache and fetch only the winners' rows; None means use SQL.
+
+        The fetch also reads each PDF's ingest_version, so an entry made stale
+        by a reprocess in another worker is dropped here rather than served.
+        """
+        hits = self.hot_cache.search(query_embedding, pdf_ids_str, user_id_str, limit)
+        if hits is None:
+            return None
+        if not hits:
+            return []
+        
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT 
+                        pce.chunk_id,
+                        pce.pdf_id,
+                        pce.chunk_index,
+                        pce.chunk_text,
+                        pce.start_char,
+                        pce.end_char,
+                        COALESCE(pce.page_number, pc.page_number),
+                        pdf.file_name,
+                        h.similarity,
+                        COALESCE(pdf.ingest_version, 0)
+                        {self._vector_column_sql() if self.use_mmr else ''}
+                    FROM unnest(%s::uuid[], %s::float8[]) AS h(chunk_id, similarity)
+                    JOIN pdf_chunks_embeddings pce ON pce.chunk_id = h.chunk_id
+                    JOIN pdfs pdf ON pdf.pdf_id = pce.pdf_id
+                    LEFT JOIN pdf_chunks pc ON pc.chunk_id = pce.chunk_id AND pc.pdf_id = pce.pdf_id
+                    WHERE pce.user_id = %s::uuid
+                    AND pce.pdf_id = ANY(%s::uuid[])
+                    ORDER BY h.similarity DESC
+                """, ([hit[0] for hit in hits], [hit[1] for hit in hits], user_id_str, pdf_ids_str))
+                rows = cursor.fetchall()
+        
+        expected = {pdf_id: version for _, _, pdf_id, version in hits}
+        stale = {str(row[1]) for row in rows if row[9] != expected.get(str(row[1]))}
+        if stale or len(rows) != len(hits):
+            # Reprocessed or deleted since it was cached
+            for pdf_id in stale or expected:
+                self.hot_cache.invalidate(pdf_id)
+            return None
+        # Drop the version column, keep the optional trailing vector
+        return [row[:9] + row[10:] for row in rows]
+    
+    def _rows_to_chunks(self, results, top_k, score_key='similarity', with_vectors=False):
+        """Turn search rows into chunk dicts and keep the best top_k.
+
+        Without vectors, near-duplicate texts (same first 100 characters) are
+        dropped and the top_k are the highest scores. With with_vectors, each
+        row ends with the chunk's embedding and MMR (RETRIEVAL_MMR_LAMBDA)
+        alone handles redundancy when choosing the top_k.
+        """
+        unique_chunks = {}
+        vectors = {}
+        for row in results:
+            if with_vectors:
+                vector, row = row[-1], row[:-1]
+            chunk_id, pdf_id, chunk_index, chunk_text, start_char, end_char, page_number, pdf_name, similarity = row[:9]
+            chunk = {
+                'chunk_id': str(chunk_id),  # Ensure UUID is string
+                'pdf_id': str(pdf_id),      # Ensure UUID is string
+                'chunk_index': chunk_index,
+                'chunk_text': chunk_text,
+                'start_char': start_char,
+                'end_char': end_char,
+                'page_number': page_number,
+                'pdf_name': pdf_name,
+                'similarity': float(similarity)
+            }
+            if len(row) > 9:
+                chunk['rrf_score'] = float(row[9])
+            
+            # Near-duplicate texts share a key and only the best is kept; MMR handles redundancy itself
+            chunk_key = chunk['chunk_id'] if with_vectors else chunk_text[:100]
+            if chunk_key not in unique_chunks or unique_chunks[chunk_key][score_key] < chunk[score_key]:
+                unique_chunks[chunk_key] = chunk
+                if with_vectors:
+                    vectors[chunk_key] = vector
+        
+        # Best first; the threshold is lenient - top chunks are kept for context even below it
+        keys = sorted(unique_chunks, key=lambda key: unique_chunks[key][score_key], reverse=True)
+        if with_vectors and len(keys) > top_k and all(vectors[key] is not None for key in keys):
+            scores = np.array([unique_chunks[key][score_key] for key in keys], dtype=np.float32)
+            if score_key != 'similarity':
+                # Put fused scores on a 0-1 scale comparable to the cosine penalty
+                scores /= scores.max() or 1.0
+            picked = mmr_select(scores, [vectors[key] for key in keys], top_k, self.mmr_lambda)
+            keys = [keys[i] for i in sorted(picked)]
+        return [unique_chunks[key] for key in keys[:top_k]]
+    
+    def _distance_sql(self, query_ref='%s'):
+        """Cosine distance expression for the storage mode (binary re-ranks on the float column)"""
+        if self.storage_mode == 'halfvec':
+            return f"pce.embedding_half <=> {query_ref}::halfvec({EMBEDDING_DIMENSION})"
+        return f"pce.embedding <=> {query_ref}::vector"
+    
+    def _vector_column_sql(self):
+        """Trailing select column with the chunk's embedding as real[] (for MMR)"""
+        column = 'embedding_half' if self.storage_mode == 'halfvec' else 'embedding'
+        return f", pce.{column}::real[] AS vector"
+    
+    def _similarity_query(self, query_vector, pdf_ids_str, user_id_str, limit, with_vectors=False, query_ref=None):
+        """(sql, params) for a top-`limit` cosine search in the configured storage mode.
+
+        query_ref is a SQL expression holding the query vector (e.g. a LATERAL
+        column); it replaces the query_vector parameter.
+        """
+        distance = self._distance_sql(query_ref or '%s')
+        # Parameters for each query vector placeholder (none when it is a SQL reference)
+        qv = () if query_ref else (query_vector,)
+        vector_column = self._vector_column_sql() if with_vectors else ''
+        
+        # The ANN scan reads only the search row; page and document name are joined onto the winners
+        select = f"""
+            SELECT 
+                pce.chunk_id,
+                pce.pdf_id,
+                pce.chunk_index,
+                pce.chunk_text,
+                pce.start_char,
+                pce.end_char,
+                pce.page_number,
+                1 - ({distance}) as similarity
+                {vector_column}
+        """
+        
+        if self.storage_mode == 'binary':
+            # Hamming scan over the 1-bit index, then exact float re-rank of the candidates
+            return self._with_chunk_metadata(f"""
+                WITH candidates AS (
+                    SELECT chunk_id FROM pdf_chunks_embeddings
+                    WHERE pdf_id = ANY(%s::uuid[])
+                    AND user_id = %s::uuid
+                    ORDER BY embedding_bit <~> binary_quantize({query_ref or '%s'}::vector)::bit({EMBEDDING_DIMENSION})
+                    LIMIT %s
+                )
+                {select}
+                FROM candidates c
+                JOIN pdf_chunks_embeddings pce ON pce.chunk_id = c.chunk_id
+                AND pce.user_id = %s::uuid AND pce.pdf_id = ANY(%s::uuid[])
+                ORDER BY {distance}
+                LIMIT %s
+            """, with_vectors), ((pdf_ids_str, user_id_str) + qv + (limit * BINARY_RERANK_FACTOR,) + qv
+                                 + (user_id_str, pdf_ids_str) + qv + (limit,))
+        
+        # UUID parameters are passed as strings and cast in SQL
+        return self._with_chunk_metadata(f"""
+            {select}
+            FROM pdf_chunks_embeddings pce
+            WHERE pce.pdf_id = ANY(%s::uuid[])
+            AND pce.user_id = %s::uuid
+            ORDER BY {distance}
+            LIMIT %s
+        """, with_vectors), qv + (pdf_ids_str, user_id_str) + qv + (limit,)
+    
+    def _with_chunk_metadata(self, hits_sql, with_vectors=False):
+        """Wrap a top-k query so its rows carry page_number and the PDF name (search row layout).
+
+        Rows ingested before page_number was denormalized fall back to pdf_chunks;
+        the name is read from pdfs, so a renamed PDF shows its current name.
+        """
+        return f"""
+            SELECT
+                h.chunk_id,
+                h.pdf_id,
+                h.chunk_index,
+                h.chunk_text,
+                h.start_char,
+                h.end_char,
+                COALESCE(h.page_number, pc.page_number) AS page_number,
+                pdf.file_name,
+                h.similarity
+                {', h.vector' if with_vectors else ''}
+            FROM ({hits_sql}) h
+            JOIN pdfs pdf ON pdf.pdf_id = h.pdf_id
+            LEFT JOIN pdf_chunks pc ON pc.chunk_id = h.chunk_id AND pc.pdf_id = h.pdf_id
+            ORDER BY h.similarity DESC
+        """
+    
+    def explain_search(self, query, pdf_ids, user_id, top_k=5, search_mode=None):
+        """EXPLAIN ANALYZE a search with the settings it would run with, and report index usage"""
+        query_vector = vector_literal(self.embedding_service.generate_embedding(query))
+        pdf_ids_str = [str(pdf_id) for pdf_id in pdf_ids]
+        user_id_str = str(user_id)
+        
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                strategy = self.index_manager.apply_search_settings(cursor, pdf_ids_str, user_id_str, top_k * 2, search_mode)
+                sql, params = self._similarity_query(query_vector, pdf_ids_str, user_id_str, top_k * 2)
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+                plan = cursor.fetchone()[0]
+            conn.rollback()
+        
+        return {'strategy': strategy, 'storage': self.storage_mode, **summarize_plan(plan), 'plan': plan}
+    
     def get_chunk_by_id(self, chunk_id):
         """Get specific chunk by ID for reference"""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    pc.chunk_id, pc.pdf_id, pc.chunk_index, pc.chunk_text,
-                    pc.start_char, pc.end_char, pc.page_number,
-                    pdf.file_name
-                FROM pdf_chunks pc
-                JOIN pdfs pdf ON pc.pdf_id = pdf.pdf_id
-                WHERE pc.chunk_id = %s::uuid  -- CAST to UUID
-            """, (chunk_id,))
-            
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            pce.chunk_id, pce.pdf_id, pce.chunk_index, pce.chunk_text,
+                            pce.start_char, pce.end_char,
+                            COALESCE(pce.page_number, pc.page_number),
+                            pdf.file_name
+                        FROM pdf_chunks_embeddings pce
+                        JOIN pdfs pdf ON pce.pdf_id = pdf.pdf_id
+                        LEFT JOIN pdf_chunks pc ON pce.chunk_id = pc.chunk_id AND pc.pdf_id = pce.pdf_id
+                        WHERE pce.chunk_id = %s::uuid  -- CAST to UUID
+                    """, (chunk_id,))
+                    
+                    result = cursor.fetchone()
             
             if result:
                 return {
@@ -131,20 +603,17 @@ class VectorSearch:
             if not pdf_ids:
                 return []
                 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
             # Convert UUIDs to strings
             pdf_ids_str = [str(pdf_id) for pdf_id in pdf_ids]
             
-            cursor.execute("""
-                SELECT file_name FROM pdfs
-                WHERE pdf_id = ANY(%s::uuid[])
-            """, (pdf_ids_str,))
-            
-            results = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT file_name FROM pdfs
+                        WHERE pdf_id = ANY(%s::uuid[])
+                    """, (pdf_ids_str,))
+                    
+                    results = cursor.fetchall()
             
             return [row[0] for row in results]
             
@@ -0,0 +1,320 @@
+"""
+Embedding storage modes for pdf_chunks_embeddings.
+
+EMBEDDING_STORAGE selects how chunk vectors are stored and searched:
+
+- vector  (default) float32 `embedding vector(384)`
+- halfvec float16 `embedding_half halfvec(384)`; the float column is left NULL,
+          halving heap, index and buffer-cache size (cosine drift ~1e-4)
+- binary  `embedding_bit bit(384)` (1 bit per dimension) for a Hamming-distance
+          candidate scan, re-ranked with the float `embedding` column
+
+Existing rows are migrated with:
+
+    python -m app.vector_storage migrate --mode halfvec [--drop-float]
+    python -m app.vector_storage migrate --mode binary
+
+Run the migration before switching EMBEDDING_STORAGE; rows without the
+mode's column are not found by searches in that mode.
+
+Search rows carry page_number, so the ANN scan reads a single table (the
+PDF name is joined from pdfs onto the top-k rows only, and rows without a
+page_number fall back to pdf_chunks), and the chunk text lives only there
+(pdf_chunks keeps positions/metadata with a NULL chunk_text). Existing rows
+are converted with:
+
+    python -m app.vector_storage denormalize [--keep-chunk-text]
+
+Hybrid retrieval adds `chunk_tsv tsvector` (written at ingest with the
+FTS_CONFIG text search configuration) and a GIN index, both created by the
+backend migrations. Rows ingested before that are backfilled (and, on a large
+table, the index built without blocking writes) with:
+
+    python -m app.vector_storage lexical
+
+pdfs.ingest_version counts successful ingests of a document; in-process
+caches of a PDF's vectors (hot_cache.py) are keyed by it. pdf_pages keeps each
+page's extracted text for PageIndex tree generation after ingest.
+
+The default schema (page_number, chunk_tsv, ingest_version, pdf_pages) comes
+from the backend's CodeIgniter migrations; nothing here runs at service
+startup. The commands above are the explicit, idempotent way to change or
+backfill it.
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from .database import db_connection
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 384
+STORAGE_MODES = ('vector', 'halfvec', 'binary')
+# Binary mode: Hamming candidates fetched per requested result before the float re-rank
+BINARY_RERANK_FACTOR = max(1, int(os.getenv('EMBEDDING_BINARY_RERANK_FACTOR', '4')))
+# Text search configuration for chunk_tsv (ingest and query must agree)
+FTS_CONFIG = os.getenv('FTS_CONFIG', 'english')
+
+
+def storage_mode():
+    mode = os.getenv('EMBEDDING_STORAGE', 'vector').strip().lower()
+    if mode not in STORAGE_MODES:
+        logger.warning(f"Unknown EMBEDDING_STORAGE '{mode}', using vector")
+        return 'vector'
+    return mode
+
+
+def vector_literal(values):
+    """Compact pgvector text literal ('[0.0123456789,...]').
+
+    Nine significant digits are the minimum that round-trip every float32,
+    so the stored vector is bit-identical to the model output, while sending
+    about half the bytes of a Python list (17-digit floats in an ARRAY[...] cast).
+    """
+    return '[' + ','.join(format(value, '.9g') for value in values) + ']'
+
+
+def bit_literal(values):
+    """Bit string for a bit(384) column; matches pgvector's binary_quantize (x > 0 -> 1)"""
+    return ''.join('1' if value > 0 else '0' for value in values)
+
+
+def embedding_columns(mode=None):
+    """(column names, VALUES template fragment, value builder) used by ingestion inserts"""
+    mode = mode or storage_mode()
+    if mode == 'halfvec':
+        return ['embedding_half'], f"%s::halfvec({EMBEDDING_DIMENSION})", lambda e: (vector_literal(e),)
+    if mode == 'binary':
+        return (
+            ['embedding', 'embedding_bit'],
+            f"%s::vector, %s::bit({EMBEDDING_DIMENSION})",
+            lambda e: (vector_literal(e), bit_literal(e))
+        )
+    return ['embedding'], "%s::vector", lambda e: (vector_literal(e),)
+
+
+def _missing_columns(cur, table, columns):
+    """Check the catalog first so an up-to-date schema never takes an ALTER TABLE lock"""
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = ANY(%s)
+    """, (table, list(columns)))
+    existing = {row[0] for row in cur.fetchall()}
+    return [column for column in columns if column not in existing]
+
+
+def _not_null(cur, table, column):
+    cur.execute("""
+        SELECT is_nullable = 'NO' FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def ensure_search_row_columns():
+    """Idempotently add the denormalized search-row columns and free pdf_chunks.chunk_text"""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            missing = _missing_columns(cur, 'pdf_chunks_embeddings', ['page_number'])
+            if missing:
+                cur.execute("ALTER TABLE pdf_chunks_embeddings ADD COLUMN IF NOT EXISTS page_number INTEGER")
+            if _not_null(cur, 'pdf_chunks', 'chunk_text'):
+                # New chunks store their text only in pdf_chunks_embeddings
+                cur.execute("ALTER TABLE pdf_chunks ALTER COLUMN chunk_text DROP NOT NULL")
+                missing.append('pdf_chunks.chunk_text nullable')
+        conn.commit()
+    if missing:
+        logger.info(f"Search row schema updated: {missing}")
+
+
+def ensure_lexical_column():
+    """Idempotently add chunk_tsv, the full-text column used by hybrid retrieval"""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            if _missing_columns(cur, 'pdf_chunks_embeddings', ['chunk_tsv']):
+                cur.execute("ALTER TABLE pdf_chunks_embeddings ADD COLUMN IF NOT EXISTS chunk_tsv tsvector")
+                logger.info("Added pdf_chunks_embeddings.chunk_tsv")
+        conn.commit()
+
+
+def backfill_lexical(batch_size=1000):
+    """Populate chunk_tsv for existing rows and build its GIN index without blocking writes"""
+    ensure_lexical_column()
+    total = _run_batches("""
+        UPDATE pdf_chunks_embeddings
+        SET chunk_tsv = to_tsvector(%s::regconfig, COALESCE(chunk_text, ''))
+        WHERE chunk_id IN (
+            SELECT chunk_id FROM pdf_chunks_embeddings
+            WHERE chunk_tsv IS NULL
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (FTS_CONFIG, batch_size), "Backfilled chunk_tsv")
+    
+    with db_connection() as conn:
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS pdf_chunks_embeddings_chunk_tsv_gin_idx
+                ON pdf_chunks_embeddings USING gin (chunk_tsv)
+            """)
+    logger.info(f"chunk_tsv ready: {total} rows backfilled, GIN index built")
+    return total
+
+
+def ensure_storage_columns(mode=None):
+    """Idempotently add the column the storage mode needs (no ALTER once the schema is up to date)"""
+    mode = mode or storage_mode()
+    columns = {
+        'halfvec': ('embedding_half', f"halfvec({EMBEDDING_DIMENSION})"),
+        'binary': ('embedding_bit', f"bit({EMBEDDING_DIMENSION})"),
+    }
+    if mode not in columns:
+        return
+    column, column_type = columns[mode]
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            if _missing_columns(cur, 'pdf_chunks_embeddings', [column]):
+                cur.execute(f"ALTER TABLE pdf_chunks_embeddings ADD COLUMN IF NOT EXISTS {column} {column_type}")
+                logger.info(f"Added pdf_chunks_embeddings.{column}")
+            if mode == 'halfvec' and _not_null(cur, 'pdf_chunks_embeddings', 'embedding'):
+                # New rows leave the float column empty
+                cur.execute("ALTER TABLE pdf_chunks_embeddings ALTER COLUMN embedding DROP NOT NULL")
+        conn.commit()
+    logger.info(f"Embedding storage columns ready for mode '{mode}'")
+
+
+def backfill_storage(mode=None, batch_size=1000, drop_float=False):
+    """Fill the mode's column for existing rows in short batches (one transaction each).
+
+    With drop_float (halfvec only) the float32 column is cleared in the same
+    update; the space is reclaimed by the next VACUUM.
+
+    Returns:
+        Number of rows updated
+    """
+    mode = mode or storage_mode()
+    if mode == 'halfvec':
+        target, expression = 'embedding_half', f"embedding::halfvec({EMBEDDING_DIMENSION})"
+    elif mode == 'binary':
+        target, expression = 'embedding_bit', f"binary_quantize(embedding)::bit({EMBEDDING_DIMENSION})"
+    else:
+        return 0
+
+    assignment = f"{target} = {expression}"
+    predicate = f"{target} IS NULL AND embedding IS NOT NULL"
+    if drop_float and mode == 'halfvec':
+        # Also covers rows converted by an earlier run that kept the float column
+        assignment = f"{target} = COALESCE({target}, {expression}), embedding = NULL"
+        predicate = "embedding IS NOT NULL"
+
+    started = time.monotonic()
+    total = _run_batches(f"""
+        UPDATE pdf_chunks_embeddings
+        SET {assignment}
+        WHERE chunk_id IN (
+            SELECT chunk_id FROM pdf_chunks_embeddings
+            WHERE {predicate}
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (batch_size,), f"Backfilled {target}")
+
+    logger.info(f"Backfill for '{mode}' finished: {total} rows in {time.monotonic() - started:.1f}s")
+    return total
+
+
+def _run_batches(sql, params, label):
+    """Repeat a LIMIT-ed UPDATE (one transaction per batch) until it touches fewer rows than the batch"""
+    batch_size = params[-1]
+    total = 0
+    while True:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                updated = cur.rowcount
+            conn.commit()
+        total += updated
+        if updated:
+            logger.info(f"{label}: {total} rows")
+        if updated < batch_size:
+            return total
+
+
+def denormalize_search_rows(batch_size=1000, drop_chunk_text=True):
+    """Backfill page_number into pdf_chunks_embeddings and drop the duplicate chunk text.
+
+    Returns:
+        (rows backfilled, pdf_chunks rows whose text was cleared)
+    """
+    ensure_search_row_columns()
+    started = time.monotonic()
+    
+    backfilled = _run_batches("""
+        UPDATE pdf_chunks_embeddings pce
+        SET page_number = pc.page_number
+        FROM pdf_chunks pc
+        WHERE pce.chunk_id = pc.chunk_id
+        AND pce.chunk_id IN (
+            SELECT e.chunk_id FROM pdf_chunks_embeddings e
+            JOIN pdf_chunks c ON c.chunk_id = e.chunk_id
+            WHERE e.page_number IS NULL
+            LIMIT %s
+            FOR UPDATE OF e SKIP LOCKED
+        )
+    """, (batch_size,), "Backfilled search rows")
+    
+    cleared = 0
+    if drop_chunk_text:
+        # Only clear text that is safely stored on the search row
+        cleared = _run_batches("""
+            UPDATE pdf_chunks pc
+            SET chunk_text = NULL
+            WHERE pc.chunk_id IN (
+                SELECT pc2.chunk_id FROM pdf_chunks pc2
+                JOIN pdf_chunks_embeddings pce ON pce.chunk_id = pc2.chunk_id
+                WHERE pc2.chunk_text IS NOT NULL AND pce.chunk_text IS NOT NULL
+                LIMIT %s
+                FOR UPDATE OF pc2 SKIP LOCKED
+            )
+        """, (batch_size,), "Cleared duplicate chunk text")
+    
+    logger.info(f"Search rows denormalized in {time.monotonic() - started:.1f}s "
+                f"({backfilled} backfilled, {cleared} duplicate texts cleared); run VACUUM to reclaim space")
+    return backfilled, cleared
+
+
+def migrate(mode, batch_size=1000, drop_float=False):
+    """Add columns, backfill existing rows and build the ANN index for a storage mode"""
+    from .vector_index import VectorIndexManager
+
+    ensure_storage_columns(mode)
+    backfill_storage(mode, batch_size=batch_size, drop_float=drop_float)
+    VectorIndexManager(storage=mode).create_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Migrate the pdf_chunks_embeddings storage layout")
+    parser.add_argument('command', choices=['migrate', 'denormalize', 'lexical'])
+    parser.add_argument('--mode', choices=STORAGE_MODES, default=storage_mode())
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--drop-float', action='store_true', help='halfvec only: clear the float32 column')
+    parser.add_argument('--keep-chunk-text', action='store_true', help='denormalize: keep pdf_chunks.chunk_text')
+    args = parser.parse_args()
+
+    if args.command == 'lexical':
+        backfill_lexical(batch_size=args.batch_size)
+        print("✅ pdf_chunks_embeddings.chunk_tsv populated and indexed")
+    elif args.command == 'denormalize':
+        denormalize_search_rows(batch_size=args.batch_size, drop_chunk_text=not args.keep_chunk_text)
+        print("✅ pdf_chunks_embeddings search rows denormalized")
+    else:
+        migrate(args.mode, batch_size=args.batch_size, drop_float=args.drop_float)
+        print(f"✅ pdf_chunks_embeddings migrated to '{args.mode}' storage")
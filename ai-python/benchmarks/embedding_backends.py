@@ -0,0 +1,154 @@
+"""
+Embedding backend parity check and throughput benchmark.
+
+Compares every EMBEDDING_BACKEND against the fp32 torch model (the vectors
+already stored in pdf_chunks_embeddings) and reports throughput:
+
+    cd ai-python
+    python -m benchmarks.embedding_backends --backends torch,onnx,onnx-int8
+    python -m benchmarks.embedding_backends --corpus chunks.txt --output results.json
+
+Exits with status 1 if a backend drifts past its tolerance, so it can gate a
+backend switch in CI or before a deploy.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from app.embedding_service import load_sentence_model
+
+# (min mean cosine, min per-text cosine, min top-k neighbour overlap) vs torch
+TOLERANCES = {
+    'torch': (0.99999, 0.9999, 1.0),
+    'onnx': (0.9999, 0.999, 0.98),
+    'onnx-o3': (0.9999, 0.999, 0.98),
+    'onnx-int8': (0.99, 0.97, 0.90),
+}
+
+_WORDS = (
+    "document page section chapter table figure result method analysis data model "
+    "system process value report summary revenue growth customer policy contract "
+    "clause payment term risk security network protocol server request response "
+    "energy temperature pressure sample experiment error rate patient treatment "
+    "dose study outcome student course exam grade lecture theorem proof lemma"
+).split()
+
+
+def synthetic_corpus(count, seed=13):
+    """Chunk-like texts of mixed length (one sentence up to a full 800-char chunk)"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(rng.randint(1, 10)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 18))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        texts.append(" ".join(sentences)[:800])
+    return texts
+
+
+def load_corpus(path, count):
+    with open(path, encoding='utf-8') as f:
+        texts = [line.strip() for line in f if len(line.strip()) >= 3]
+    return texts[:count]
+
+
+def encode(model, texts, batch_size):
+    return model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def measure_throughput(model, texts, batch_size, queries):
+    """Batch throughput (texts/s) and single-query latency percentiles (ms)"""
+    encode(model, texts[:batch_size], batch_size)  # warm-up
+
+    started = time.perf_counter()
+    encode(model, texts, batch_size)
+    batch_seconds = time.perf_counter() - started
+
+    latencies = []
+    for text in texts[:queries]:
+        started = time.perf_counter()
+        model.encode(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    return {
+        'texts_per_second': round(len(texts) / batch_seconds, 1),
+        'query_p50_ms': round(statistics.median(latencies), 2),
+        'query_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+
+def measure_parity(reference, candidate, top_k):
+    """Cosine drift per text plus how many top-k neighbours survive the backend change"""
+    cosines = np.sum(reference * candidate, axis=1)
+
+    ref_neighbours = np.argsort(-(reference @ reference.T), axis=1)[:, 1:top_k + 1]
+    cand_neighbours = np.argsort(-(candidate @ candidate.T), axis=1)[:, 1:top_k + 1]
+    overlap = np.mean([
+        len(set(r) & set(c)) / top_k for r, c in zip(ref_neighbours, cand_neighbours)
+    ])
+
+    return {
+        'mean_cosine': round(float(np.mean(cosines)), 6),
+        'min_cosine': round(float(np.min(cosines)), 6),
+        f'top{top_k}_overlap': round(float(overlap), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='torch,onnx,onnx-o3,onnx-int8')
+    parser.add_argument('--corpus', help='Text file, one chunk per line (default: synthetic)')
+    parser.add_argument('--texts', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--queries', type=int, default=100, help='Single-text encodes for latency')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.texts) if args.corpus else synthetic_corpus(args.texts)
+    print(f"Corpus: {len(texts)} texts")
+
+    reference_model, _ = load_sentence_model('torch')
+    reference = encode(reference_model, texts, args.batch_size)
+
+    results = {}
+    failed = []
+    for backend in [b.strip() for b in args.backends.split(',') if b.strip()]:
+        model, loaded = load_sentence_model(backend)
+        if loaded != backend:
+            print(f"{backend}: not available (fell back to {loaded}), skipped")
+            results[backend] = {'status': 'unavailable'}
+            continue
+
+        result = measure_throughput(model, texts, args.batch_size, args.queries)
+        result.update(measure_parity(reference, encode(model, texts, args.batch_size), args.top_k))
+
+        min_mean, min_single, min_overlap = TOLERANCES.get(backend, TOLERANCES['onnx-int8'])
+        passed = (result['mean_cosine'] >= min_mean and result['min_cosine'] >= min_single
+                  and result[f'top{args.top_k}_overlap'] >= min_overlap)
+        result['status'] = 'pass' if passed else 'fail'
+        if not passed:
+            failed.append(backend)
+
+        results[backend] = result
+        print(f"{backend}: {json.dumps(result)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'texts': len(texts), 'batch_size': args.batch_size, 'results': results}, f, indent=2)
+
+    if failed:
+        print(f"Parity FAILED for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
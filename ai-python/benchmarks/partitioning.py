@@ -0,0 +1,235 @@
+"""
+Partitioning benchmark: search and delete latency of plain vs partitioned chunk storage.
+
+Builds copies of a synthetic pdf_chunks_embeddings-shaped table in a scratch
+schema on a local Postgres with pgvector, one per layout:
+
+    plain  single table (the unpartitioned layout)
+    user   HASH (user_id) into --partitions partitions
+    pdf    LIST (pdf_id), one partition per document
+
+    cd ai-python
+    python -m benchmarks.partitioning --dsn postgresql://localhost/bench --chunks 10000000
+    python -m benchmarks.partitioning --dsn ... --chunks 200000 --dim 64 --layouts plain,user --output results.json
+
+All layouts get the same rows (generated server-side), the (user_id, pdf_id)
+B-tree and, unless --index none, an HNSW index. For each layout it reports
+filtered top-k search latency percentiles and QPS, how many partitions one
+search touches (from EXPLAIN), sizes, and the latency of deleting whole
+documents (DELETE for plain/user, DROP TABLE of the partition for pdf).
+
+At 10M chunks x 384 dims each layout is ~17 GB and its HNSW build takes hours;
+use --dim / --chunks / --index none for a smoke run. The pdf layout creates
+chunks / --chunks-per-pdf partitions.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+
+import psycopg2
+
+SCHEMA = 'bench_partitioning'
+LAYOUTS = ('plain', 'user', 'pdf')
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+    return {'p50_ms': round(statistics.median(ordered), 2), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+
+def timed(cur, sql, params=None):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    return (time.perf_counter() - started) * 1000
+
+
+def random_vector(rng, dim):
+    return '[' + ','.join(format(rng.random() - 0.5, '.6f') for _ in range(dim)) + ']'
+
+
+def create_source(cur, args):
+    """Documents and chunks shared by every layout"""
+    pdf_count = max(1, args.chunks // args.chunks_per_pdf)
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.docs AS
+        SELECT gen_random_uuid() AS pdf_id,
+               ('00000000-0000-4000-8000-' || lpad(to_hex(n %% %s), 12, '0'))::uuid AS user_id
+        FROM generate_series(1, %s) n
+    """, (args.users, pdf_count))
+    cur.execute(f"""
+        CREATE UNLOGGED TABLE {SCHEMA}.source (
+            chunk_id uuid, pdf_id uuid, user_id uuid, chunk_index int, page_number int,
+            chunk_text text, embedding vector({args.dim})
+        )
+    """)
+    cur.execute(f"SELECT pdf_id FROM {SCHEMA}.docs")
+    pdf_ids = [row[0] for row in cur.fetchall()]
+    for start in range(0, len(pdf_ids), 100):
+        # The g-dependent subquery is re-evaluated per row, giving every chunk its own vector
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.source
+            SELECT gen_random_uuid(), d.pdf_id, d.user_id, g, g / 5, repeat('lorem ipsum ', 60),
+                   (SELECT array_agg(random() - 0.5 + g * 0) FROM generate_series(1, %s))::vector
+            FROM {SCHEMA}.docs d, generate_series(1, %s) g
+            WHERE d.pdf_id = ANY(%s::uuid[])
+        """, (args.dim, args.chunks_per_pdf, [str(p) for p in pdf_ids[start:start + 100]]))
+        print(f"  generated {min(start + 100, len(pdf_ids)) * args.chunks_per_pdf} chunks", flush=True)
+    return pdf_count
+
+
+def build_layout(cur, layout, args):
+    table = f"{SCHEMA}.chunks_{layout}"
+    columns = f"(LIKE {SCHEMA}.source)"
+    if layout == 'plain':
+        cur.execute(f"CREATE TABLE {table} {columns}")
+        cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (chunk_id)")
+    elif layout == 'user':
+        cur.execute(f"CREATE TABLE {table} {columns} PARTITION BY HASH (user_id)")
+        cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (chunk_id, user_id)")
+        for remainder in range(args.partitions):
+            cur.execute(f"""
+                CREATE TABLE {table}_p{remainder:02d} PARTITION OF {table}
+                FOR VALUES WITH (MODULUS {args.partitions}, REMAINDER {remainder})
+            """)
+    else:
+        cur.execute(f"CREATE TABLE {table} {columns} PARTITION BY LIST (pdf_id)")
+        cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (chunk_id, pdf_id)")
+        cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        cur.execute(f"SELECT pdf_id FROM {SCHEMA}.docs")
+        for (pdf_id,) in cur.fetchall():
+            cur.execute(f"CREATE TABLE {table}_{uuid.UUID(str(pdf_id)).hex} PARTITION OF {table} FOR VALUES IN ('{pdf_id}')")
+
+    timings = {'load_s': timed(cur, f"INSERT INTO {table} SELECT * FROM {SCHEMA}.source") / 1000}
+    timings['btree_s'] = timed(cur, f"CREATE INDEX ON {table} (user_id, pdf_id)") / 1000
+    if args.index == 'hnsw':
+        cur.execute("SET maintenance_work_mem = %s", (args.build_mem,))
+        timings['hnsw_s'] = timed(cur, f"CREATE INDEX ON {table} USING hnsw (embedding vector_cosine_ops)") / 1000
+    cur.execute(f"ANALYZE {table}")
+    cur.execute("SELECT pg_total_relation_size(%s::regclass) + COALESCE(("
+                "SELECT sum(pg_total_relation_size(inhrelid)) FROM pg_inherits WHERE inhparent = %s::regclass), 0)",
+                (table, table))
+    timings['size_bytes'] = int(cur.fetchone()[0])
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in timings.items()}
+
+
+def search_workload(cur, args, rng):
+    """(user_id, pdf_ids, query vector) tuples; each user searches 1-5 of their documents"""
+    cur.execute(f"SELECT user_id, array_agg(pdf_id::text) FROM {SCHEMA}.docs GROUP BY user_id")
+    owners = cur.fetchall()
+    workload = []
+    for _ in range(args.queries):
+        user_id, pdf_ids = rng.choice(owners)
+        workload.append((str(user_id), rng.sample(pdf_ids, min(len(pdf_ids), rng.randint(1, 5))),
+                         random_vector(rng, args.dim)))
+    return workload
+
+
+def measure_search(cur, layout, workload, args):
+    table = f"{SCHEMA}.chunks_{layout}"
+    sql = f"""
+        SELECT chunk_id, 1 - (embedding <=> %s::vector) AS similarity
+        FROM {table}
+        WHERE user_id = %s::uuid AND pdf_id = ANY(%s::uuid[])
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+    """
+    cur.execute("SET hnsw.ef_search = %s", (args.ef_search,))
+    for user_id, pdf_ids, vector in workload[:10]:  # warm-up
+        cur.execute(sql, (vector, user_id, pdf_ids, vector, args.top_k))
+
+    latencies = []
+    started = time.perf_counter()
+    for user_id, pdf_ids, vector in workload:
+        latencies.append(timed(cur, sql, (vector, user_id, pdf_ids, vector, args.top_k)))
+        cur.fetchall()
+    elapsed = time.perf_counter() - started
+
+    user_id, pdf_ids, vector = workload[0]
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, (vector, user_id, pdf_ids, vector, args.top_k))
+    relations = set()
+
+    def walk(node):
+        if node.get('Relation Name'):
+            relations.add(node['Relation Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(cur.fetchone()[0][0]['Plan'])
+    return {**percentiles(latencies), 'qps': round(len(workload) / elapsed, 1), 'relations_scanned': len(relations)}
+
+
+def measure_deletes(cur, layout, victims):
+    table = f"{SCHEMA}.chunks_{layout}"
+    latencies = []
+    for pdf_id, user_id in victims:
+        if layout == 'pdf':
+            latencies.append(timed(cur, f"DROP TABLE {table}_{uuid.UUID(str(pdf_id)).hex}"))
+        else:
+            latencies.append(timed(cur, f"DELETE FROM {table} WHERE user_id = %s AND pdf_id = %s",
+                                   (str(user_id), str(pdf_id))))
+    return percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help='Local Postgres with pgvector (a scratch schema is created)')
+    parser.add_argument('--chunks', type=int, default=10_000_000)
+    parser.add_argument('--chunks-per-pdf', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--layouts', default=','.join(LAYOUTS))
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--index', choices=['hnsw', 'none'], default='hnsw')
+    parser.add_argument('--build-mem', default='2GB')
+    parser.add_argument('--ef-search', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--deletes', type=int, default=20)
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch schema afterwards')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    print(f"Generating {args.chunks} chunks ({args.dim} dims)...")
+    pdf_count = create_source(cur, args)
+    workload = search_workload(cur, args, rng)
+    cur.execute(f"SELECT pdf_id, user_id FROM {SCHEMA}.docs ORDER BY random() LIMIT %s", (args.deletes,))
+    victims = cur.fetchall()
+
+    results = {}
+    for layout in [name.strip() for name in args.layouts.split(',') if name.strip() in LAYOUTS]:
+        print(f"[{layout}] building...", flush=True)
+        result = build_layout(cur, layout, args)
+        result['search'] = measure_search(cur, layout, workload, args)
+        result['delete'] = measure_deletes(cur, layout, victims)
+        results[layout] = result
+        print(f"[{layout}] {json.dumps(result)}", flush=True)
+        cur.execute(f"DROP TABLE {SCHEMA}.chunks_{layout} CASCADE")
+
+    if not args.keep:
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+
+    report = {
+        'chunks': args.chunks, 'pdfs': pdf_count, 'users': args.users, 'dim': args.dim,
+        'index': args.index, 'partitions': args.partitions, 'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""
+Retrieval benchmark: latency, throughput and recall of VectorSearch on a synthetic corpus.
+
+Generates a synthetic corpus, ingests it through DocumentProcessor into a
+scratch schema on a local Postgres with pgvector, and replays a query set
+through VectorSearch.search_similar_chunks for each combination of the swept
+settings:
+
+    cd ai-python
+    python -m benchmarks.retrieval --dsn postgresql://postgres@localhost/bench --docs 200
+    python -m benchmarks.retrieval --dsn ... --index hnsw,ivfflat,none --modes fast,accurate --top-k 5,10 --output run.json
+    EMBEDDING_BACKEND=onnx EMBEDDING_STORAGE=halfvec python -m benchmarks.retrieval --dsn ... --rebuild
+
+For each run it reports p50/p95/p99 latency (query embedding included), QPS
+at --concurrency and recall@k against an exact brute-force top-k over the same
+user and PDFs. Everything else (storage mode, embedding backend, MMR, fan-out)
+comes from the usual environment variables, which are recorded in the output.
+
+The app's tables are created in --schema (via PGOPTIONS search_path), so the
+benchmark never touches public. The corpus is kept between runs and reused
+unless --rebuild. Result, hot-document and query-embedding caches are off
+unless --with-caches, so every run measures real searches.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+# Settings that change retrieval results or latency, copied into the report
+RECORDED_SETTINGS = (
+    'EMBEDDING_BACKEND', 'EMBEDDING_STORAGE', 'VECTOR_INDEX_TYPE', 'VECTOR_HNSW_M', 'VECTOR_HNSW_EF_CONSTRUCTION',
+    'VECTOR_IVFFLAT_LISTS', 'VECTOR_SEARCH_EXACT_MAX_ROWS', 'RETRIEVAL_MMR_LAMBDA', 'VECTOR_SEARCH_FANOUT',
+    'VECTOR_FANOUT_MIN_PDFS', 'DB_POOL_MAX',
+)
+
+_TOPICS = (
+    "revenue margin forecast quarter growth customer pricing churn budget invoice",
+    "contract clause liability termination payment warranty indemnity breach party notice",
+    "network protocol server latency packet router firewall request response throughput",
+    "patient treatment dose trial outcome symptom therapy diagnosis clinical adverse",
+    "student course exam grade lecture syllabus assignment semester tutor credit",
+    "theorem proof lemma corollary matrix vector integral derivative bound convergence",
+    "reactor temperature pressure sample catalyst yield solvent reaction energy phase",
+    "policy regulation compliance audit risk control governance disclosure board report",
+)
+_COMMON = "the a of and to in for with on by is are was were this that from as at".split()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+    return {
+        'p50_ms': round(statistics.median(ordered), 2),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'mean_ms': round(statistics.fmean(ordered), 2),
+    }
+
+
+def configure_environment(args):
+    """Point the app's pool at the benchmark database and schema (before anything connects)"""
+    params = parse_dsn(args.dsn)
+    os.environ.update({
+        'DB_HOST': params.get('host', 'localhost'),
+        'DB_NAME': params.get('dbname', 'postgres'),
+        'DB_USER': params.get('user', 'postgres'),
+        'DB_PASSWORD': params.get('password', ''),
+        'DB_PORT': params.get('port', '5432'),
+        'SSLMODE': params.get('sslmode', 'disable'),
+        'PGOPTIONS': f"-c search_path={args.schema},public",
+    })
+    if not args.with_caches:
+        os.environ.update({'RESULT_CACHE_TTL': '0', 'HOT_CACHE_MAX_MB': '0', 'EMBEDDING_CACHE_SIZE': '0'})
+
+
+def create_schema(cur, schema, rebuild):
+    """Minimal copies of the tables the AI service reads and writes"""
+    if rebuild:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.pdfs (
+            pdf_id uuid PRIMARY KEY,
+            user_id uuid NOT NULL,
+            file_name varchar(255),
+            file_path varchar(500),
+            page_count integer,
+            processing_status varchar(20) DEFAULT 'pending',
+            processing_progress integer DEFAULT 0,
+            tree_file_id varchar(255),
+            tree_status varchar(20),
+            ingest_version integer NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.pdf_chunks (
+            chunk_id uuid PRIMARY KEY,
+            pdf_id uuid NOT NULL REFERENCES {schema}.pdfs (pdf_id) ON DELETE CASCADE,
+            user_id uuid NOT NULL,
+            chunk_index integer,
+            page_number integer,
+            start_char integer,
+            end_char integer,
+            chunk_text text,
+            created_at timestamp DEFAULT now()
+        )
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.pdf_chunks_embeddings (
+            chunk_id uuid PRIMARY KEY REFERENCES {schema}.pdf_chunks (chunk_id) ON DELETE CASCADE,
+            pdf_id uuid NOT NULL,
+            user_id uuid NOT NULL,
+            chunk_index integer,
+            chunk_text text,
+            start_char integer,
+            end_char integer,
+            page_number integer,
+            chunk_tsv tsvector,
+            embedding vector(384)
+        )
+    """)
+
+
+def synthetic_document(rng, chars):
+    """Paragraphs of mostly one topic's vocabulary, so chunks cluster the way real documents do"""
+    topic = rng.choice(_TOPICS).split()
+    other = rng.choice(_TOPICS).split()
+    paragraphs, length = [], 0
+    while length < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [
+                rng.choice(topic) if roll < 0.6 else rng.choice(other) if roll < 0.7 else rng.choice(_COMMON)
+                for roll in (rng.random() for _ in range(rng.randint(8, 20)))
+            ]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+        length += len(paragraphs[-1])
+    return "\n\n".join(paragraphs)
+
+
+def ingest_corpus(conn, args, rng):
+    """Write --docs synthetic documents through DocumentProcessor; returns ingest stats"""
+    from app.pdf_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    users = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.users)]
+    chunks = 0
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in range(args.docs):
+            pdf_id, user_id = str(uuid.uuid4()), users[n % len(users)]
+            file_name = f"bench-{n:05d}.txt"
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO pdfs (pdf_id, user_id, file_name, file_path, processing_status) VALUES (%s, %s, %s, %s, 'processing')",
+                    (pdf_id, user_id, file_name, file_name)
+                )
+            conn.commit()
+
+            path = os.path.join(tmp_dir, file_name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(synthetic_document(rng, args.doc_chars))
+            result = processor.process_local_file(pdf_id, path, user_id)
+            if result['status'] != 'success':
+                raise RuntimeError(f"Ingest of {file_name} failed: {result['message']}")
+            chunks += result['data']['chunk_count']
+            if (n + 1) % 10 == 0 or n + 1 == args.docs:
+                print(f"  ingested {n + 1}/{args.docs} documents ({chunks} chunks)", flush=True)
+    elapsed = time.perf_counter() - started
+    return {'seconds': round(elapsed, 1), 'chunks_per_second': round(chunks / elapsed, 1)}
+
+
+def build_queries(cur, args, rng):
+    """(text, pdf_ids, user_id) per query: a perturbed span of a stored chunk, searched
+    over its PDF plus up to --pdfs-per-query - 1 other PDFs of the same user"""
+    cur.execute("SELECT user_id::text, array_agg(pdf_id::text) FROM pdfs WHERE processing_status = 'completed' GROUP BY user_id")
+    pdfs_by_user = dict(cur.fetchall())
+    cur.execute("SELECT setseed(%s)", (1 / (1 + args.seed),))
+    cur.execute(
+        "SELECT user_id::text, pdf_id::text, chunk_text FROM pdf_chunks_embeddings ORDER BY random() LIMIT %s",
+        (args.queries + args.warmup,)
+    )
+    samples = cur.fetchall()
+    if not samples:
+        raise RuntimeError("No chunks found; run without --skip-ingest or with --rebuild")
+
+    queries = []
+    for n in range(args.queries + args.warmup):
+        user_id, pdf_id, text = samples[n % len(samples)]
+        words = text.split()
+        start = rng.randrange(max(1, len(words) - 12))
+        span = [word for word in words[start:start + rng.randint(6, 12)] if rng.random() > 0.2]
+        others = [p for p in pdfs_by_user[user_id] if p != pdf_id]
+        pdf_ids = [pdf_id] + rng.sample(others, min(len(others), args.pdfs_per_query - 1))
+        queries.append((" ".join(span) or text[:80], pdf_ids, user_id))
+    return queries[:args.warmup], queries[args.warmup:]
+
+
+def ground_truth(cur, queries, embedding_service, storage, max_k):
+    """Exact top-max_k chunk ids per query by cosine similarity over the query's user and PDFs"""
+    column = 'embedding_half' if storage == 'halfvec' else 'embedding'
+    vectors_by_pdf = {}
+    truths = []
+    for text, pdf_ids, user_id in queries:
+        missing = [pdf_id for pdf_id in pdf_ids if pdf_id not in vectors_by_pdf]
+        if missing:
+            cur.execute(f"""
+                SELECT pdf_id::text, array_agg(chunk_id::text), array_agg({column}::real[])
+                FROM pdf_chunks_embeddings WHERE pdf_id = ANY(%s::uuid[]) GROUP BY pdf_id
+            """, (missing,))
+            for pdf_id, chunk_ids, vectors in cur.fetchall():
+                matrix = np.asarray(vectors, dtype=np.float32)
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+                vectors_by_pdf[pdf_id] = (chunk_ids, matrix)
+        ids = [chunk_id for pdf_id in pdf_ids for chunk_id in vectors_by_pdf.get(pdf_id, ([], None))[0]]
+        matrix = np.vstack([vectors_by_pdf[pdf_id][1] for pdf_id in pdf_ids if pdf_id in vectors_by_pdf])
+        query = np.asarray(embedding_service.generate_embedding(text), dtype=np.float32)
+        order = np.argsort(-(matrix @ (query / np.linalg.norm(query))))[:max_k]
+        truths.append([ids[i] for i in order])
+    return truths
+
+
+def prepare_index(index):
+    """Build the ANN index the app would use, or drop it ('none') to measure exact scans"""
+    from app.database import db_connection
+    from app.vector_index import VectorIndexManager
+
+    manager = VectorIndexManager()
+    if index != 'none':
+        started = time.perf_counter()
+        manager.create_index(index)
+        return {'index': manager.index_name(index), 'build_seconds': round(time.perf_counter() - started, 1)}
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for index_type in ('hnsw', 'ivfflat'):
+                cur.execute(f"DROP INDEX IF EXISTS {manager.index_name(index_type)}")
+        conn.commit()
+    return {'index': None}
+
+
+def replay(search, queries, truths, top_k, mode, threshold, concurrency):
+    def run(query):
+        text, pdf_ids, user_id = query
+        started = time.perf_counter()
+        chunks = search.search_similar_chunks(
+            text, pdf_ids, user_id, top_k=top_k, similarity_threshold=threshold, search_mode=mode
+        )
+        return (time.perf_counter() - started) * 1000, [chunk['chunk_id'] for chunk in chunks]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(run, queries))
+    elapsed = time.perf_counter() - started
+
+    recalls = []
+    for (_, retrieved), truth in zip(outcomes, truths):
+        expected = truth[:top_k]
+        if expected:
+            recalls.append(len(set(retrieved) & set(expected)) / len(expected))
+    return {
+        **percentiles([latency for latency, _ in outcomes]),
+        'qps': round(len(queries) / elapsed, 1),
+        f'recall@{top_k}': round(statistics.fmean(recalls), 4) if recalls else None,
+        'short_results': sum(1 for _, retrieved in outcomes if len(retrieved) < top_k),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help='Local Postgres with pgvector')
+    parser.add_argument('--schema', default='bench_retrieval', help='Scratch schema for the corpus')
+    parser.add_argument('--docs', type=int, default=100)
+    parser.add_argument('--doc-chars', type=int, default=40000, help='Characters per document (~60 chunks per 40k)')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--rebuild', action='store_true', help='Drop and re-ingest the corpus')
+    parser.add_argument('--skip-ingest', action='store_true', help='Use the corpus already in --schema')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--pdfs-per-query', type=int, default=3)
+    parser.add_argument('--index', default='hnsw', help='Comma-separated: hnsw, ivfflat, none')
+    parser.add_argument('--modes', default='balanced', help='Comma-separated search modes: fast, balanced, accurate')
+    parser.add_argument('--top-k', default='5', help='Comma-separated top_k values')
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--with-caches', action='store_true', help='Keep result/hot/embedding caches on')
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    if args.schema == 'public':
+        sys.exit("Refusing to benchmark in the public schema")
+    configure_environment(args)
+    rng = random.Random(args.seed)
+
+    conn = psycopg2.connect(args.dsn)  # PGOPTIONS sets the search_path
+    with conn.cursor() as cur:
+        create_schema(cur, args.schema, args.rebuild)
+        conn.commit()
+        cur.execute("SELECT count(*) FROM pdfs WHERE processing_status = 'completed'")
+        existing_docs = cur.fetchone()[0]
+
+    ingest = None
+    if existing_docs:
+        print(f"Reusing {existing_docs} documents in schema {args.schema}")
+    elif args.skip_ingest:
+        sys.exit(f"Schema {args.schema} has no corpus to reuse")
+    else:
+        print(f"Ingesting {args.docs} documents of ~{args.doc_chars} chars...")
+        ingest = ingest_corpus(conn, args, rng)
+
+    # Imported after configure_environment so the pool and caches see the benchmark settings
+    from app.vector_search import VectorSearch
+    from app.vector_storage import storage_mode
+
+    search = VectorSearch()
+    top_ks = [int(k) for k in args.top_k.split(',')]
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*), count(DISTINCT pdf_id), count(DISTINCT user_id) FROM pdf_chunks_embeddings")
+        chunk_count, pdf_count, user_count = cur.fetchone()
+        warmup, queries = build_queries(cur, args, rng)
+        print(f"Corpus: {chunk_count} chunks, {pdf_count} PDFs, {user_count} users; computing ground truth...")
+        truths = ground_truth(cur, queries, search.embedding_service, storage_mode(), max(top_ks))
+    conn.rollback()
+    conn.close()
+
+    results = []
+    for index in [name.strip() for name in args.index.split(',') if name.strip()]:
+        index_info = prepare_index(index)
+        for mode in [name.strip() for name in args.modes.split(',') if name.strip()]:
+            for top_k in top_ks:
+                replay(search, warmup, [[]] * len(warmup), top_k, mode, args.threshold, args.concurrency)
+                result = {
+                    **index_info, 'index_type': index, 'mode': mode, 'top_k': top_k,
+                    **replay(search, queries, truths, top_k, mode, args.threshold, args.concurrency)
+                }
+                results.append(result)
+                print(json.dumps(result), flush=True)
+
+    report = {
+        'corpus': {'chunks': chunk_count, 'pdfs': pdf_count, 'users': user_count, 'ingest': ingest},
+        'queries': len(queries),
+        'pdfs_per_query': args.pdfs_per_query,
+        'concurrency': args.concurrency,
+        'threshold': args.threshold,
+        'caches': args.with_caches,
+        'settings': {name: os.getenv(name) for name in RECORDED_SETTINGS},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
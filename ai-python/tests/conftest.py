@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Run from ai-python/ or the repo root: `app` and `benchmarks` import from ai-python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
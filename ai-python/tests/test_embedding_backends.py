@@ -0,0 +1,60 @@
+"""
+Parity of the configured EMBEDDING_BACKEND against the fp32 torch model.
+
+Asserts the same tolerances `python -m benchmarks.embedding_backends` gates on.
+Skipped when the backend (or ONNX Runtime) is unavailable here:
+
+    EMBEDDING_BACKEND=onnx-int8 python -m pytest tests/test_embedding_backends.py
+"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sentence_transformers')
+
+from app.embedding_service import load_sentence_model
+from benchmarks.embedding_backends import TOLERANCES, encode, measure_parity, synthetic_corpus
+
+BACKEND = os.getenv('EMBEDDING_BACKEND', 'onnx').strip().lower()
+TOP_K = 5
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return synthetic_corpus(128)
+
+
+@pytest.fixture(scope='module')
+def reference(corpus):
+    model, _ = load_sentence_model('torch')
+    return encode(model, corpus, 32)
+
+
+@pytest.fixture(scope='module')
+def candidate(corpus):
+    if BACKEND == 'torch':
+        pytest.skip("EMBEDDING_BACKEND is torch; nothing to compare against")
+    pytest.importorskip('onnxruntime')
+    model, loaded = load_sentence_model(BACKEND)
+    if loaded != BACKEND:
+        pytest.skip(f"{BACKEND} not available (fell back to {loaded})")
+    return encode(model, corpus, 32)
+
+
+def test_backend_has_tolerances():
+    assert BACKEND in TOLERANCES
+
+
+def test_backend_within_tolerances(reference, candidate):
+    min_mean, min_single, min_overlap = TOLERANCES[BACKEND]
+    parity = measure_parity(reference, candidate, TOP_K)
+
+    assert parity['mean_cosine'] >= min_mean
+    assert parity['min_cosine'] >= min_single
+    assert parity[f'top{TOP_K}_overlap'] >= min_overlap
+
+
+def test_backend_keeps_dimension(reference, candidate):
+    assert candidate.shape == reference.shape == (len(reference), 384)
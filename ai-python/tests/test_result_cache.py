@@ -0,0 +1,141 @@
+"""
+RetrievalResultCache on the in-process LRU backend.
+
+pdfs.ingest_version is served by a fake db_connection, so no database is needed.
+"""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('psycopg2')
+
+from app import result_cache
+from app.result_cache import RetrievalResultCache
+from app.utils import cache_utils
+from app.utils.cache_utils import LRUCache
+
+PDF_A = '11111111-1111-4111-8111-111111111111'
+PDF_B = '22222222-2222-4222-8222-222222222222'
+USER = '33333333-3333-4333-8333-333333333333'
+
+
+class FakePdfs:
+    """pdf_id -> ingest_version, answering the cache's version lookup"""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.queries = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql, params):
+        self.queries += 1
+        self._rows = [(pdf_id, self.versions[pdf_id]) for pdf_id in params[0] if pdf_id in self.versions]
+
+    def fetchall(self):
+        return self._rows
+
+
+@pytest.fixture
+def pdfs(monkeypatch):
+    fake = FakePdfs({PDF_A: 1, PDF_B: 1})
+    monkeypatch.setattr(result_cache, 'db_connection', fake.connection)
+    return fake
+
+
+@pytest.fixture
+def cache(pdfs):
+    return RetrievalResultCache(LRUCache(max_entries=100, ttl=60, name='test results'), version_ttl=60)
+
+
+def unit_vector(seed, dim=384):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    # Snap to the int8 grid so small noise can never cross a rounding boundary
+    return np.round(vector / np.linalg.norm(vector) * 127) / 127
+
+
+def test_key_ignores_float_noise(cache):
+    vector = unit_vector(1)
+    noise = np.random.default_rng(3).uniform(-1e-3, 1e-3, vector.shape)
+
+    assert cache.make_key(vector, [PDF_A], USER, 5) == cache.make_key(vector + noise, [PDF_A], USER, 5)
+    assert cache.make_key(vector, [PDF_A], USER, 5) != cache.make_key(unit_vector(2), [PDF_A], USER, 5)
+
+
+def test_key_depends_on_pdf_set_not_order(cache):
+    vector = unit_vector(1)
+
+    assert cache.make_key(vector, [PDF_A, PDF_B], USER, 5) == cache.make_key(vector, [PDF_B, PDF_A], USER, 5)
+    assert cache.make_key(vector, [PDF_A, PDF_B], USER, 5) != cache.make_key(vector, [PDF_A], USER, 5)
+
+
+def test_key_depends_on_ingest_version(cache, pdfs):
+    vector = unit_vector(1)
+    before = cache.make_key(vector, [PDF_A], USER, 5)
+    pdfs.versions[PDF_A] = 2
+    cache.invalidate(PDF_A)
+
+    assert cache.make_key(vector, [PDF_A], USER, 5) != before
+
+
+def test_unknown_pdf_is_not_cached(cache):
+    key = cache.make_key(unit_vector(1), [PDF_A, '44444444-4444-4444-8444-444444444444'], USER, 5)
+
+    assert key is None
+    cache.set(key, [{'chunk_text': 'x'}])
+    assert cache.get(key) is None
+
+
+def test_reingest_misses_after_invalidate(cache, pdfs):
+    vector = unit_vector(1)
+    cache.set(cache.make_key(vector, [PDF_A], USER, 5), [{'chunk_text': 'old'}])
+
+    pdfs.versions[PDF_A] = 2
+    # The cached version still points at the old entry until the PDF is invalidated
+    assert cache.get(cache.make_key(vector, [PDF_A], USER, 5)) == [{'chunk_text': 'old'}]
+
+    cache.invalidate(PDF_A)
+    assert cache.get(cache.make_key(vector, [PDF_A], USER, 5)) is None
+    assert cache.invalidations == 1
+
+
+def test_version_lookup_is_cached(cache, pdfs):
+    vector = unit_vector(1)
+    cache.make_key(vector, [PDF_A, PDF_B], USER, 5)
+    cache.make_key(vector, [PDF_B, PDF_A], USER, 10)
+
+    assert pdfs.queries == 1
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils, 'time', SimpleNamespace(time=lambda: now[0]))
+    cache.backend = LRUCache(max_entries=100, ttl=60)
+    key = cache.make_key(unit_vector(1), [PDF_A], USER, 5)
+    cache.set(key, [{'chunk_text': 'a'}])
+
+    now[0] += 59
+    assert cache.get(key) == [{'chunk_text': 'a'}]
+    now[0] += 2
+    assert cache.get(key) is None
+
+
+def test_get_returns_copies(cache):
+    key = cache.make_key(unit_vector(1), [PDF_A], USER, 5)
+    chunks = [{'chunk_text': 'a', 'similarity': 0.9}]
+    cache.set(key, chunks)
+    chunks[0]['source'] = 'caller'
+
+    first = cache.get(key)
+    first[0]['rerank_score'] = 1.0
+
+    assert cache.get(key) == [{'chunk_text': 'a', 'similarity': 0.9}]
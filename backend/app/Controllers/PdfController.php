@@ -481,7 +481,8 @@ class PdfController extends BaseController
                 // Still proceed to delete from DB even if Appwrite deletion fails to avoid orphaned DB records
             }
             
-            // Delete from database (cascade will handle chunks and embeddings)
+            // Delete chunks and embeddings with a pruned delete, then the PDF row
+            $this->pdfChunkModel->deleteForPdf($pdfId, $userId);
             $this->pdfModel->delete($pdfId);
             
             return $this->response->setJSON([
@@ -0,0 +1,29 @@
+<?php
+
+namespace App\Database\Migrations;
+
+use CodeIgniter\Database\Migration;
+
+class MakePdfChunkTextNullable extends Migration
+{
+    public function up()
+    {
+        // Chunk text is stored once, on the pdf_chunks_embeddings search row
+        $this->forge->modifyColumn('pdf_chunks', [
+            'chunk_text' => [
+                'type' => 'TEXT',
+                'null' => true,
+            ],
+        ]);
+    }
+
+    public function down()
+    {
+        $this->forge->modifyColumn('pdf_chunks', [
+            'chunk_text' => [
+                'type' => 'TEXT',
+                'null' => false,
+            ],
+        ]);
+    }
+}
@@ -0,0 +1,26 @@
+<?php
+
+namespace App\Database\Migrations;
+
+use CodeIgniter\Database\Migration;
+
+class AddIngestVersionToPdfs extends Migration
+{
+    public function up()
+    {
+        // Bumped by the AI service on every successful (re)ingest; keys its in-memory vector caches
+        $this->forge->addColumn('pdfs', [
+            'ingest_version' => [
+                'type' => 'INTEGER',
+                'default' => 0,
+                'null' => false,
+                'after' => 'tree_status',
+            ],
+        ]);
+    }
+
+    public function down()
+    {
+        $this->forge->dropColumn('pdfs', 'ingest_version');
+    }
+}
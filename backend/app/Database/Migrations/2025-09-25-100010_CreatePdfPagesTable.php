@@ -0,0 +1,34 @@
+<?php
+
+namespace App\Database\Migrations;
+
+use CodeIgniter\Database\Migration;
+
+class CreatePdfPagesTable extends Migration
+{
+    public function up()
+    {
+        // Extracted text of each page, written by the AI service at ingest for PageIndex tree generation
+        $this->forge->addField([
+            'pdf_id' => [
+                'type' => 'VARCHAR',
+                'constraint' => 36, // UUID length
+            ],
+            'page_number' => [
+                'type' => 'INTEGER',
+            ],
+            'page_text' => [
+                'type' => 'TEXT',
+            ],
+        ]);
+
+        $this->forge->addKey(['pdf_id', 'page_number'], true);
+        $this->forge->addForeignKey('pdf_id', 'pdfs', 'pdf_id', 'CASCADE', 'CASCADE');
+        $this->forge->createTable('pdf_pages', true);
+    }
+
+    public function down()
+    {
+        $this->forge->dropTable('pdf_pages', true);
+    }
+}
@@ -0,0 +1,33 @@
+<?php
+
+namespace App\Database\Migrations;
+
+use CodeIgniter\Database\Migration;
+
+class AddSearchRowColumnsToPdfChunksEmbeddings extends Migration
+{
+    public function up()
+    {
+        // pdf_chunks_embeddings is the AI service's pgvector table; it is created outside these migrations
+        if (! $this->db->tableExists('pdf_chunks_embeddings')) {
+            return;
+        }
+
+        // page_number: the search row carries its page, so the vector scan reads one table.
+        // chunk_tsv: full-text vector written at ingest for hybrid (lexical + vector) retrieval.
+        $this->db->query('ALTER TABLE pdf_chunks_embeddings
+            ADD COLUMN IF NOT EXISTS page_number INTEGER,
+            ADD COLUMN IF NOT EXISTS chunk_tsv TSVECTOR');
+    }
+
+    public function down()
+    {
+        if (! $this->db->tableExists('pdf_chunks_embeddings')) {
+            return;
+        }
+
+        $this->db->query('ALTER TABLE pdf_chunks_embeddings
+            DROP COLUMN IF EXISTS chunk_tsv,
+            DROP COLUMN IF EXISTS page_number');
+    }
+}
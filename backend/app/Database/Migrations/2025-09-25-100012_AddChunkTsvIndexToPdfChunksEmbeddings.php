@@ -0,0 +1,26 @@
+<?php
+
+namespace App\Database\Migrations;
+
+use CodeIgniter\Database\Migration;
+
+class AddChunkTsvIndexToPdfChunksEmbeddings extends Migration
+{
+    public function up()
+    {
+        if (! $this->db->tableExists('pdf_chunks_embeddings')) {
+            return;
+        }
+
+        // GIN index for the hybrid retrieval lexical leg (chunk_tsv @@ query). This blocks writes
+        // while it builds; on a large existing table run `python -m app.vector_storage lexical`
+        // first, which backfills chunk_tsv and builds the same index concurrently.
+        $this->db->query('CREATE INDEX IF NOT EXISTS pdf_chunks_embeddings_chunk_tsv_gin_idx
+            ON pdf_chunks_embeddings USING gin (chunk_tsv)');
+    }
+
+    public function down()
+    {
+        $this->db->query('DROP INDEX IF EXISTS pdf_chunks_embeddings_chunk_tsv_gin_idx');
+    }
+}
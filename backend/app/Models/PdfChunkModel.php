@@ -47,14 +47,33 @@ class PdfChunkModel extends Model
     protected $beforeDelete   = [];
     protected $afterDelete    = [];
 
+    // Chunk text lives on pdf_chunks_embeddings; older rows may still carry it here.
+    // Joining on pdf_id as well lets a partitioned table prune to the document's partition.
+    private function withChunkText(){
+        return $this->select('pdf_chunks.*, COALESCE(pdf_chunks.chunk_text, pce.chunk_text) AS chunk_text', false)
+                   ->join('pdf_chunks_embeddings pce', 'pce.chunk_id = pdf_chunks.chunk_id AND pce.pdf_id = pdf_chunks.pdf_id', 'left');
+    }
+
     public function getPdfChunks($pdfId){
-        return $this->where('pdf_id', $pdfId)
-                   ->orderBy('page_number', 'ASC')
-                   ->orderBy('chunk_index', 'ASC')
+        return $this->withChunkText()
+                   ->where('pdf_chunks.pdf_id', $pdfId)
+                   ->orderBy('pdf_chunks.page_number', 'ASC')
+                   ->orderBy('pdf_chunks.chunk_index', 'ASC')
                    ->findAll();
     }
     
     public function getChunkById($chunkId){
-        return $this->where('chunk_id', $chunkId)->first();
+        return $this->withChunkText()->where('pdf_chunks.chunk_id', $chunkId)->first();
+    }
+
+    // Delete a document's chunks filtered by both partition keys, so only one partition is touched
+    public function deleteForPdf($pdfId, $userId){
+        $this->db->table('pdf_chunks_embeddings')
+                 ->where('pdf_id', $pdfId)
+                 ->where('user_id', $userId)
+                 ->delete();
+        return $this->where('pdf_id', $pdfId)
+                    ->where('user_id', $userId)
+                    ->delete();
     }
 }
@@ -254,7 +254,7 @@ export default function ChatSessionPage() {
     const savedRetrievalMode = typeof window !== "undefined"
       ? localStorage.getItem("chat-retrieval-mode") as RetrievalMode | null
       : null;
-    if (savedRetrievalMode === "vector" || savedRetrievalMode === "pageindex" || savedRetrievalMode === "comparison") {
+    if (savedRetrievalMode === "vector" || savedRetrievalMode === "hybrid" || savedRetrievalMode === "pageindex" || savedRetrievalMode === "comparison") {
       setRetrievalMode(savedRetrievalMode);
     }
 
@@ -1009,6 +1009,7 @@ export default function ChatSessionPage() {
             </SelectTrigger>
             <SelectContent className="rounded-xl border-zinc-200 dark:border-white/10 bg-white dark:bg-[#111]">
               <SelectItem value="vector" className="focus:bg-zinc-100 dark:focus:bg-white/10 cursor-pointer">Vector</SelectItem>
+              <SelectItem value="hybrid" className="focus:bg-zinc-100 dark:focus:bg-white/10 cursor-pointer">Hybrid</SelectItem>
               <SelectItem value="pageindex" className="focus:bg-zinc-100 dark:focus:bg-white/10 cursor-pointer">PageIndex</SelectItem>
               <SelectItem value="comparison" className="focus:bg-zinc-100 dark:focus:bg-white/10 cursor-pointer">Compare</SelectItem>
             </SelectContent>
@@ -100,7 +100,7 @@ export interface SendMessageData {
 }
 
 export type LlmProvider = 'groq' | 'cerebras' | 'bytez';
-export type RetrievalMode = 'vector' | 'pageindex' | 'comparison';
+export type RetrievalMode = 'vector' | 'hybrid' | 'pageindex' | 'comparison';
 
 class ApiClient {
   private baseUrl: string;